@@ -0,0 +1,62 @@
+"""
+Measures how long `graph.build` takes for large, generated rulesets.
+
+The generated rulesets look like what we see in production: a handful of entities shared by
+every rate limit and rule (a diamond-shaped graph), plus a long chain of nested rules.
+
+Usage:
+
+    PYTHONPATH=src/ python benchmarks/bench_build.py [num_rules ...]
+"""
+import sys
+import time
+
+import graph
+from utils import paused_gc
+
+PREAMBLE = '''
+Action = JsonData('$.action')
+User = Entity('User', JsonData('$.user.id'))
+Ip = Entity('Ip', JsonData('$.http.remote_addr'))
+IsPost = Action == 'forum_post_created'
+'''
+
+RULE = '''
+RateLimit{i} = RateLimit(by=User, max={i}, per=Interval.Minutes(1), where=[IsPost])
+IpRule{i} = Rule(when=[RateLimit{i}, Ip == '10.0.0.{i}'], reason='Rule {i}')
+ChainRule{i} = Rule(when=[{previous}, IpRule{i}], reason='Chain {i}')
+'''
+
+
+def generate_ruleset(num_rules):
+    code = [PREAMBLE]
+    previous = 'IsPost'
+    for i in xrange(num_rules):
+        code.append(RULE.format(i=i, previous=previous))
+        previous = 'ChainRule%d' % i
+
+    return ''.join(code)
+
+
+def bench(num_rules):
+    code = generate_ruleset(num_rules)
+
+    with paused_gc():
+        start = time.time()
+        dependency_graph = graph.build_dependency_graph(code)
+        built = time.time()
+        plan = graph.ExecutionPlan(dependency_graph)
+        compiled = time.time()
+
+    print '%7d rules, %7d nodes: build_dependency_graph %.2fs, ExecutionPlan %.2fs, total %.2fs' % (
+        num_rules,
+        len(plan),
+        built - start,
+        compiled - built,
+        compiled - start,
+    )
+
+
+if __name__ == '__main__':
+    for num_rules in map(int, sys.argv[1:]) or [1000, 10000]:
+        bench(num_rules)
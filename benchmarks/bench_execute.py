@@ -0,0 +1,90 @@
+"""
+Measures per-event execution throughput of a representative ruleset.
+
+Usage:
+
+    PYTHONPATH=src/ python benchmarks/bench_execute.py [batch_size]
+"""
+import random
+import sys
+import time
+
+import codegen
+import graph
+
+RULESET = '''
+Action = JsonData('$.action')
+UserId = JsonData('$.data.user.id')
+User = Entity('User', UserId)
+UserEmail = Entity('Email', JsonData('$.data.user.email'))
+Ip = Entity('Ip', JsonData('$.data.http.remote_addr'))
+PostTopic = JsonData('$.data.post.topic')
+PostLength = JsonData('$.data.post.length')
+
+IsPost = Action == 'forum_post_created'
+IsLongPost = PostLength > 5000
+IsShortPost = PostLength <= 10
+HasDealsTopic = PostTopic.in_(['deals', 'free money', 'click here', 'woah'])
+IsBlockedIp = Ip.in_(['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+NoEmail = UserEmail == None
+
+PostsPerMinute = RateLimit(by=User, max=5, per=Interval.Minutes(1), where=[IsPost])
+PostsPerHour = RateLimit(by=User, max=50, per=Interval.Hours(1), where=[IsPost])
+PostsPerDay = RateLimit(by=User, max=200, per=Interval.Days(1), where=[IsPost])
+
+SpamRule = Rule(when=[IsPost & HasDealsTopic, IsBlockedIp], reason='Spam')
+WeirdPostRule = Rule(when=[IsPost & (IsLongPost | IsShortPost)], reason='Weird post')
+PostFloodRule = Rule(when=[PostsPerMinute, PostsPerHour, PostsPerDay], reason='Post flood')
+NoEmailRule = Rule(when=[IsPost & NoEmail], reason='No email')
+AnyRule = Rule(when=[SpamRule, WeirdPostRule, NoEmailRule], reason='Any')
+
+WhenRules(
+    rules=[SpamRule, WeirdPostRule, PostFloodRule],
+    then=[
+        Label.Add(User, 'require_captcha'),
+    ]
+)
+'''
+
+
+def generate_event(i):
+    return {
+        'action': random.choice(['forum_post_created', 'login']),
+        'data': {
+            'user': {
+                'id': str(i % 100),
+                'email': random.choice(['foo@jh.gg', None]),
+            },
+            'http': {
+                'remote_addr': '10.0.0.%d' % random.randint(0, 20),
+            },
+            'post': {
+                'topic': random.choice(['deals', 'hello', 'woah', 'question']),
+                'length': random.randint(0, 6000),
+            },
+        },
+    }
+
+
+def timed(label, count, fn):
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    print '%-24s %8.1f us/event' % (label, elapsed * 1e6 / count)
+
+
+def main(batch_size):
+    random.seed(0)
+    plan = graph.build(RULESET)
+    events = [generate_event(i) for i in xrange(batch_size * 20)]
+    batches = [events[i:i + batch_size] for i in xrange(0, len(events), batch_size)]
+
+    print '%d nodes, %d events, batches of %d' % (len(plan), len(events), batch_size)
+    timed('execute', len(events), lambda: [graph.execute(plan, event) for event in events])
+    compiled = codegen.compile_plan(plan)
+    timed('compiled', len(events), lambda: [compiled.execute(event) for event in events])
+    timed('execute_many', len(events), lambda: [graph.execute_many(plan, batch) for batch in batches])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,80 @@
+"""
+Compares the memory taken by the labels of many entities in the `DictLabelStore` stand-in, and in
+the compact `InternedLabelStore`, and how long it takes to load them from a snapshot file.
+
+Usage:
+
+    PYTHONPATH=src/ python benchmarks/bench_labels.py [num_entities]
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from stores.labels import InternedLabelStore
+
+LABELS = ['banned', 'require_captcha', 'spammer', 'verified']
+
+
+def generate_labels(num_entities):
+    for i in xrange(num_entities):
+        entity_type, entity_id = ('User', str(i)) if i % 2 else ('Email', 'user%d@jh.gg' % i)
+        yield entity_type, entity_id, LABELS[i % len(LABELS)], 'ADDED' if i % 3 else 'REMOVED'
+        if i % 5 == 0:
+            yield entity_type, entity_id, LABELS[(i + 1) % len(LABELS)], 'ADDED'
+
+
+def get_rss():
+    # ru_maxrss is in kilobytes on linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_dict(path):
+    labels = defaultdict(dict)
+    with open(path, 'rb') as f:
+        for line in f:
+            entity_type, entity_id, label, status = line.rstrip('\n').decode('utf-8').split(u'\t')
+            labels[u'%s/%s' % (entity_type, entity_id)][label] = status
+
+    return labels
+
+
+def load_interned(path):
+    store = InternedLabelStore()
+    store.load(path)
+    return store
+
+
+def measure(load, path, results):
+    before = get_rss()
+    start = time.time()
+    store = load(path)
+    results.put((time.time() - start, get_rss() - before, len(store)))
+
+
+def main(num_entities):
+    fd, path = tempfile.mkstemp(suffix='.tsv')
+    with os.fdopen(fd, 'wb') as f:
+        for labels in generate_labels(num_entities):
+            f.write('\t'.join(labels) + '\n')
+
+    print '%d entities' % num_entities
+    print '%-12s %10s %14s %8s' % ('', 'load', 'memory', 'bytes')
+    try:
+        # Each store is loaded in a fresh process, so that the memory of one does not hide the other.
+        for name, load in (('dict', load_dict), ('interned', load_interned)):
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(target=measure, args=(load, path, results))
+            process.start()
+            elapsed, memory, count = results.get()
+            process.join()
+            print '%-12s %9.2fs %12.1fMB %8d' % (name, elapsed, memory / 1e6, memory / count)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
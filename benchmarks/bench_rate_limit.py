@@ -0,0 +1,90 @@
+"""
+Compares the memory taken, and the error of, the exact and approximate (`approx=True`) rate
+limit stores, counting events of a large number of keys with a skewed distribution, like the
+IPs of real traffic.
+
+Usage:
+
+    PYTHONPATH=src/ python benchmarks/bench_rate_limit.py [num_keys] [num_events]
+"""
+import random
+import sys
+import time
+
+from stores.rate_limit import CountMinSketchRateLimitStore, LocalRateLimitStore
+from stores.windows import Window
+
+WINDOWS = (Window(3600),)
+THRESHOLD = 1000
+
+
+def get_exact_memory(store):
+    """
+    Roughly, the number of bytes taken by the counters of the exact store.
+    """
+    memory = sys.getsizeof(store._counters._values)
+    for key, counter in store._counters:
+        memory += sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+        memory += sys.getsizeof(counter) + sys.getsizeof(counter.windows) + sys.getsizeof(counter.rings)
+        for ring in counter.rings:
+            memory += sys.getsizeof(ring) + sys.getsizeof(ring.values)
+
+    return memory
+
+
+def generate_keys(num_keys, num_events):
+    # A few keys make most of the traffic, as they would for the IPs of proxies and crawlers.
+    keys = [('IpRateLimit', u'Ip/10.%d.%d.%d' % (i >> 16, (i >> 8) & 255, i & 255)) for i in xrange(num_keys)]
+    weights = [1.0 / (rank + 1) for rank in xrange(num_keys)]
+    total = sum(weights)
+
+    events = []
+    for key, weight in zip(keys, weights):
+        events.extend([key] * max(1, int(round(num_events * weight / total))))
+
+    random.shuffle(events)
+    return events
+
+
+def timed(store, events):
+    counts = {}
+    start = time.time()
+    for key in events:
+        counts[key] = store.increment(key, WINDOWS)[0]
+
+    return counts, (time.time() - start) * 1e6 / len(events)
+
+
+def main(num_keys, num_events):
+    random.seed(0)
+    events = generate_keys(num_keys, num_events)
+    clock = lambda: 0
+
+    exact_store = LocalRateLimitStore(clock=clock)
+    approximate_store = CountMinSketchRateLimitStore(clock=clock)
+    exact, exact_time = timed(exact_store, events)
+    approximate, approximate_time = timed(approximate_store, events)
+
+    errors = [approximate[key] - count for key, count in exact.iteritems()]
+    wrong = sum(
+        1 for key, count in exact.iteritems()
+        if (approximate[key] > THRESHOLD) != (count > THRESHOLD)
+    )
+
+    print '%d keys, %d events' % (len(exact), len(events))
+    print '%-12s %10s %12s' % ('', 'memory', 'increment')
+    print '%-12s %8.1fMB %9.1f us' % ('exact', get_exact_memory(exact_store) / 1e6, exact_time)
+    print '%-12s %8.1fMB %9.1f us' % ('approximate', approximate_store.memory / 1e6, approximate_time)
+    print 'overcount: mean %.2f, max %d; keys wrongly over %d: %d' % (
+        float(sum(errors)) / len(errors),
+        max(errors),
+        THRESHOLD,
+        wrong,
+    )
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000000,
+    )
@@ -0,0 +1,72 @@
+"""
+Compares the cost of counting events in the per-process `LocalRateLimitStore` and in the
+`SharedMemoryRateLimitStore`, and the throughput of the shared store as more processes count
+events in it at once.
+
+Usage:
+
+    PYTHONPATH=src/ python benchmarks/bench_shared_rate_limit.py [num_keys] [num_events]
+"""
+import multiprocessing
+import random
+import sys
+import time
+
+from stores.rate_limit import LocalRateLimitStore, SharedMemoryRateLimitStore
+from stores.windows import Window
+
+WINDOWS = (Window(60), Window(3600), Window(86400))
+
+
+def count(store, keys):
+    for key in keys:
+        store.increment(key, WINDOWS)
+
+
+def timed(label, num_events, fn):
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    print '%-28s %8.1f us/event %10.0f events/s' % (label, elapsed * 1e6 / num_events, num_events / elapsed)
+
+
+def count_in_processes(store, keys, processes):
+    workers = [
+        multiprocessing.Process(target=count, args=(store, keys[i::processes]))
+        for i in xrange(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def main(num_keys, num_events):
+    random.seed(0)
+    keys = [('PostsPerUser', u'User/%d' % random.randint(0, num_keys)) for _ in xrange(num_events)]
+
+    cores = multiprocessing.cpu_count()
+    print '%d keys, %d events, %d windows, %d cores' % (num_keys, num_events, len(WINDOWS), cores)
+    timed('local (1 process)', num_events, lambda: count(LocalRateLimitStore(), keys))
+    timed('shared (1 process)', num_events, lambda: count(SharedMemoryRateLimitStore(), keys))
+
+    processes = 2
+    while processes <= max(cores, 2):
+        store = SharedMemoryRateLimitStore()
+        label = 'shared (%d processes)' % processes
+        timed(label, num_events, lambda: count_in_processes(store, keys, processes))
+
+        # Every process counted into the same table, so the counts add up to every event.
+        probe = ('PostsPerUser', keys[0][1])
+        expected = sum(1 for key in keys if key == probe) + 1
+        assert store.increment(probe, WINDOWS)[0] == expected
+        processes *= 2
+
+    print 'shared table: %.1fMB' % (SharedMemoryRateLimitStore().memory / 1e6)
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 200000,
+    )
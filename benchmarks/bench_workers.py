@@ -0,0 +1,50 @@
+"""
+Measures the throughput of executing the ruleset of `bench_execute` for a stream of events in
+this process, and on `WorkerPool`s of increasing numbers of worker processes.
+
+Usage:
+
+    PYTHONPATH=src/ python benchmarks/bench_workers.py [num_events] [batch_size]
+"""
+import multiprocessing
+import random
+import sys
+import time
+
+import graph
+from bench_execute import RULESET, generate_event
+from workers import WorkerPool
+
+
+def timed(label, count, fn):
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    print '%-24s %8.1f us/event %10.0f events/s' % (label, elapsed * 1e6 / count, count / elapsed)
+
+
+def main(num_events, batch_size):
+    random.seed(0)
+    plan = graph.build(RULESET)
+    events = [generate_event(i) for i in xrange(num_events)]
+    batches = [events[i:i + batch_size] for i in xrange(0, len(events), batch_size)]
+
+    cores = multiprocessing.cpu_count()
+    print '%d events, batches of %d, %d cores' % (num_events, batch_size, cores)
+    timed('in process', num_events, lambda: [graph.execute_many(plan, batch) for batch in batches])
+
+    processes = 1
+    while processes <= cores:
+        with WorkerPool(plan, processes, batch_size) as pool:
+            # The workers are started before timing, so that only the execution is measured.
+            pool.execute_many(events[:batch_size * processes])
+            timed('%d processes' % processes, num_events, lambda: pool.execute_many(events))
+
+        processes *= 2
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+    )
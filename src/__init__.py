@@ -1 +1,2 @@
-from graph import build, execute
+from graph import build, execute, execute_async, execute_many
+from plan import ExecutionPlan
@@ -35,12 +35,14 @@ class LiteralTransformer(ast.NodeTransformer):
 
         E.g. it will transform 2 into Literal.Number(2) within the code.
         """
+        # Locations are copied onto every node we create here, so that the (rather slow) whole
+        # tree `ast.fix_missing_locations` pass is not needed afterwards.
         return ast.copy_location(ast.Call(
-            func=ast.Attribute(
-                value=ast.Name(id=LITERAL_GLOBAL_KEY, ctx=ast.Load()),
+            func=ast.copy_location(ast.Attribute(
+                value=ast.copy_location(ast.Name(id=LITERAL_GLOBAL_KEY, ctx=ast.Load()), node),
                 attr=attr,
                 ctx=ast.Load()
-            ),
+            ), node),
             args=[node],
             keywords=[],
         ), node)
@@ -72,4 +74,4 @@ def transform_ast(code):
     transformed_nodes = transformer.visit(ast_nodes)
 
     # print ast.dump(transformed_nodes)
-    return ast.fix_missing_locations(transformed_nodes)
+    return transformed_nodes
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by `LRUCache.get` for keys that are not cached.
+MISSING = object()
+
+
+class LRUCache(object):
+    """
+    A thread safe cache of at most `max_size` values, evicting the least recently used ones, and,
+    if `ttl` is given, the values that were cached more than `ttl` seconds ago.
+
+    `hits` and `misses` count the lookups that found a value, or did not.
+    """
+
+    def __init__(self, max_size, ttl=None, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Maps each key to its (value, expiry timestamp), from the least to the most recently used.
+        self._values = OrderedDict()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return '<LRUCache size=%d, max_size=%d, hits=%d, misses=%d>' % (
+            len(self), self.max_size, self.hits, self.misses
+        )
+
+    def get(self, key):
+        """
+        Returns the value cached for `key`, or MISSING.
+        """
+        with self._lock:
+            entry = self._values.pop(key, None)
+            if entry is None or (entry[1] is not None and entry[1] <= self.clock()):
+                self.misses += 1
+                return MISSING
+
+            self._values[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = value, expires_at
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
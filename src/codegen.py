@@ -0,0 +1,319 @@
+import math
+import operator
+
+import graph
+from node import AndNode, CmpNode, ContainsNode, InvertNode, OrNode
+from nodes.coalesce import Coalesce
+from nodes.data import LOOKUP_ERRORS
+from nodes.entity import Entity, EntityRef
+from nodes.rule import Rule
+from plan import DATA_SLOT, UNRESOLVED, Operands, force, is_memoized, unwrap
+
+# The comparisons that are inlined as operators, rather than calls to the comparitor of the node.
+OPERATORS = {
+    operator.eq: '%s == %s',
+    operator.ne: '%s != %s',
+    operator.gt: '%s > %s',
+    operator.ge: '%s >= %s',
+    operator.lt: '%s < %s',
+    operator.le: '%s <= %s',
+}
+
+# The types of constants that are inlined into the code by their `repr`.
+INLINED_CONSTANTS = (bool, int, long, float, str, unicode, type(None))
+
+
+class CompiledPlan(object):
+    """
+    A plan compiled into a single Python function (see `compile_plan`), whose `execute` returns
+    the same results as `graph.execute` would for the plan.
+    """
+
+    def __init__(self, plan, function, source):
+        self.plan = plan
+        self.function = function
+        self.source = source
+
+    def __repr__(self):
+        return '<CompiledPlan plan=%r>' % self.plan
+
+    def execute(self, data):
+        # The thread pool that blocking nodes are resolved on is driven by the interpreter.
+        if self.plan.blocking:
+            return graph.execute(self.plan, data)
+
+        return graph.extract_result(self.plan, self.function(data))
+
+
+def compile_plan(plan, outputs=None, actions=True):
+    """
+    Generates the source of a Python function that executes the plan selected by `outputs` and
+    `actions` (see `ExecutionPlan.select`) for an event, step by step, and compiles it once, so
+    that executing the plan does not pay for dispatching each step through the interpreter loop
+    of `graph.execute`.
+
+    Plain `JsonData` paths, comparisons, `~`, `&`, `|`, `Rule`, `Entity`, `in_` lists of
+    literals and lazy `Coalesce` nodes are inlined, as are literal constants. Every other node
+    is called through its `resolve` (or `resolve_lazy`), like the interpreter would.
+    """
+    plan = plan.select(outputs, actions)
+    generator = CodeGenerator(plan)
+    source = generator.generate()
+
+    namespace = dict(generator.namespace)
+    exec compile(source, '<compiled plan %x>' % id(plan), 'exec') in namespace
+    return CompiledPlan(plan, namespace['execute'], source)
+
+
+class CodeGenerator(object):
+    """
+    Generates the source of the function compiled by `compile_plan`. The values of the slots of
+    the plan are kept in a list, `values`, as they are by `graph.execute`, so that the nodes that
+    are not inlined can be handed `Operands` of it.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.constants = dict((slot, plan.initial_values[slot]) for slot in plan.constant_slots)
+        self.namespace = {
+            'EntityRef': EntityRef,
+            'LOOKUP_ERRORS': LOOKUP_ERRORS,
+            'Operands': Operands,
+            'force': force,
+            'UNRESOLVED': UNRESOLVED,
+            'initial_values': plan.initial_values,
+            'plan': plan,
+        }
+
+    def bind(self, name, value):
+        """
+        Makes `value` available to the generated code as `name`, returning the name.
+        """
+        self.namespace[name] = value
+        return name
+
+    def generate(self):
+        lines = [
+            'def execute(data):',
+            '    values = list(initial_values)',
+            '    values[%d] = data' % DATA_SLOT,
+        ]
+
+        for slot in self.plan.extracted_slots:
+            lines.extend(indent(self.extract(slot)))
+
+        for step in self.plan.eager_steps:
+            lines.extend(indent(self.resolve(step, deferred=False)))
+
+        lines.append('    return values')
+
+        for slot in sorted(self.plan.closures):
+            lines.append('')
+            lines.extend(self.force(slot))
+
+        return '\n'.join(lines) + '\n'
+
+    def extract(self, slot):
+        node = unwrap(self.plan.step_of(slot).node)
+        if node.path is None:
+            resolve = self.bind('resolve_%d' % slot, node.resolve)
+            return [
+                'if data is not None:',
+                '    values[%d] = %s(data)' % (slot, resolve),
+            ]
+
+        # Like `lookup_path`, any of the keys not being there resolves the node to None.
+        return [
+            'try:',
+            '    values[%d] = data%s' % (slot, ''.join('[%r]' % key for key in node.path)),
+            'except LOOKUP_ERRORS:',
+            '    pass',
+        ]
+
+    def force(self, slot):
+        """
+        Generates a function that resolves the deferred `slot`, like `plan.force`.
+        """
+        lines = ['def force_%d(values):' % slot]
+        closure = self.plan.closures[slot]
+
+        # Deferred lazy nodes are resolved by `plan.force`, which resolves nested lazy nodes with a
+        # stack of its own, rather than by calling the functions of their operands recursively.
+        if any(self.plan.step_of(closure_slot).resolve_lazy is not None for closure_slot in closure):
+            lines.append('    return force(plan, values, %d)' % slot)
+            return lines
+
+        for closure_slot in closure:
+            lines.append('    if values[%d] is UNRESOLVED:' % closure_slot)
+            lines.extend(indent(self.resolve(self.plan.step_of(closure_slot), deferred=True), 2))
+
+        lines.append('    return values[%d]' % slot)
+        return lines
+
+    def operand(self, slot, lazy=False):
+        """
+        Returns the expression of the value of `slot`, and whether it is known to be None, or not
+        (or None, if it is not known). Deferred slots are forced by the operands of lazy steps,
+        while the dependencies of other steps are always resolved by the time they run.
+        """
+        if slot in self.constants:
+            value = self.constants[slot]
+            expression = repr(value) if is_inlined(value) else 'values[%d]' % slot
+            return expression, value is None
+
+        if lazy and slot in self.plan.closures:
+            return 'force_%d(values)' % slot, None
+
+        return 'values[%d]' % slot, None
+
+    def resolve(self, step, deferred):
+        """
+        Generates the statements that resolve `step` into its slot. Deferred steps must resolve
+        their slot to None, rather than leave it as is, if all of their dependencies are None.
+        """
+        if step.resolve_lazy is not None:
+            return self.resolve_lazy(step)
+
+        target = 'values[%d]' % step.slot
+        operands = [self.operand(slot) for slot in step.arg_slots]
+        args = [expression for expression, _ in operands]
+        statements = self.inline(step, target, args)
+        if statements is None:
+            resolve = self.bind('resolve_%d' % step.slot, step.resolve)
+            statements = ['%s = %s(%s)' % (target, resolve, ', '.join(args))]
+
+        if not operands or any(is_none is False for _, is_none in operands):
+            return statements
+
+        # If every dependency resolved to None, so does this node.
+        checks = ['%s is not None' % arg for arg, is_none in operands if is_none is None]
+        if not checks:
+            return ['%s = None' % target] if deferred else []
+
+        lines = ['if %s:' % ' or '.join(checks)]
+        lines.extend(indent(statements))
+        if deferred:
+            lines.extend(['else:', '    %s = None' % target])
+
+        return lines
+
+    def inline(self, step, target, args):
+        """
+        Generates the statements of nodes that are inlined, or returns None.
+        """
+        node = unwrap(step.node)
+        if is_memoized(step.node):
+            return None
+
+        node_type = type(node)
+        if node_type is CmpNode and node.comparitor in OPERATORS:
+            return ['%s = %s' % (target, OPERATORS[node.comparitor] % tuple(args))]
+
+        if node_type is OrNode:
+            return ['%s = bool(%s or %s)' % (target, args[0], args[1])]
+
+        if node_type is AndNode:
+            return ['%s = bool(%s and %s)' % (target, args[0], args[1])]
+
+        if node_type is InvertNode:
+            return ['%s = not %s' % (target, args[0])]
+
+        if node_type is Rule:
+            return ['%s = bool(%s)' % (target, ' or '.join(args) or 'False')]
+
+        if node_type is Entity:
+            return ['%s = EntityRef(%r, %s)' % (target, node.type, args[0])]
+
+        if node_type is ContainsNode and node.members is not None:
+            members = self.bind('members_%d' % step.slot, node.members)
+            resolve = self.bind('resolve_%d' % step.slot, step.resolve)
+            return [
+                'try:',
+                '    %s = %s in %s' % (target, args[1], members),
+                'except TypeError:',
+                '    %s = %s(%s)' % (target, resolve, ', '.join(args)),
+            ]
+
+        return None
+
+    def resolve_lazy(self, step):
+        """
+        Generates the statements that resolve a lazy step, resolving its operands only if (and
+        when) needed.
+        """
+        node = unwrap(step.node)
+        target = 'values[%d]' % step.slot
+        args = [self.operand(slot, lazy=True)[0] for slot in step.arg_slots]
+        node_type = type(node)
+
+        if node_type is OrNode:
+            return [
+                'a = %s' % args[0],
+                'if a:',
+                '    %s = True' % target,
+                'else:',
+                '    b = %s' % args[1],
+                '    %s = None if a is None and b is None else bool(b)' % target,
+            ]
+
+        if node_type is AndNode:
+            return [
+                'a = %s' % args[0],
+                'if a is not None and not a:',
+                '    %s = False' % target,
+                'else:',
+                '    b = %s' % args[1],
+                '    %s = None if a is None and b is None else bool(a and b)' % target,
+            ]
+
+        # The operands are resolved within a loop, that stops at the first one that decides the
+        # value, rather than in nested conditions, as rules may have any number of operands.
+        if node_type is Rule:
+            lines = ['while True:']
+            for index, arg in enumerate(args):
+                lines.extend([
+                    '    a = %s' % arg,
+                    '    if a:',
+                    '        %s = True' % target,
+                    '        break',
+                    '    all_none = %sa is None' % ('' if index == 0 else 'all_none and '),
+                ])
+
+            lines.extend([
+                '    %s = None if all_none else False' % target,
+                '    break',
+            ])
+            return lines
+
+        if node_type is Coalesce:
+            lines = ['while True:']
+            for arg in args:
+                lines.extend([
+                    '    a = %s' % arg,
+                    '    if a is not None:',
+                    '        %s = a' % target,
+                    '        break',
+                ])
+
+            lines.extend([
+                '    %s = None' % target,
+                '    break',
+            ])
+            return lines
+
+        resolve_lazy = self.bind('resolve_lazy_%d' % step.slot, step.resolve_lazy)
+        return ['%s = %s(Operands(plan, values, %r))' % (target, resolve_lazy, step.arg_slots)]
+
+
+def is_inlined(value):
+    """
+    Whether a constant is inlined into the code, as its `repr` evaluates back to it.
+    """
+    if isinstance(value, float):
+        return not (math.isinf(value) or math.isnan(value))
+
+    return isinstance(value, INLINED_CONSTANTS)
+
+
+def indent(lines, levels=1):
+    return ['    ' * levels + line for line in lines]
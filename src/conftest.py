@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+
+import pytest
+
+from stores import aggregate as aggregate_stores
+from stores import count_distinct as count_distinct_stores
+from stores import labels as label_stores
+from stores import rate_limit as rate_limit_stores
+
+
+@pytest.fixture(autouse=True)
+def rate_limit_store(monkeypatch):
+    """
+    Gives every test its own rate limit counters, as they are shared by the graphs built from
+    the same rules.
+    """
+    store = rate_limit_stores.LocalRateLimitStore()
+    monkeypatch.setattr(rate_limit_stores, 'store', store)
+    approximate_store = rate_limit_stores.CountMinSketchRateLimitStore(width=2 ** 10)
+    monkeypatch.setattr(rate_limit_stores, 'approximate_store', approximate_store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def count_distinct_store(monkeypatch):
+    store = count_distinct_stores.LocalCountDistinctStore()
+    monkeypatch.setattr(count_distinct_stores, 'store', store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def aggregate_store(monkeypatch):
+    store = aggregate_stores.LocalAggregateStore()
+    monkeypatch.setattr(aggregate_stores, 'store', store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def label_store(monkeypatch):
+    store = label_stores.DictLabelStore({})
+    monkeypatch.setattr(label_stores, 'store', store)
+    return store
@@ -0,0 +1,101 @@
+import sys
+import threading
+
+
+class Future(object):
+    """
+    A minimal, thread-safe future: a placeholder for a value that will be resolved later, possibly
+    on another thread.
+
+    Callbacks added with `add_done_callback` are called with the future once it has resolved,
+    on the thread that resolved it (or immediately, if it is already resolved).
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._done = False
+        self._value = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def set_result(self, value):
+        self._set(value, None)
+
+    def set_exception(self, exception, traceback=None):
+        self._set(None, (type(exception), exception, traceback))
+
+    def _set(self, value, exc_info):
+        with self._condition:
+            if self._done:
+                raise RuntimeError('Future %r was already resolved.' % self)
+
+            self._value = value
+            self._exc_info = exc_info
+            self._done = True
+            self._condition.notify_all()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        if self._exc_info:
+            return self._exc_info[1]
+
+    def result(self, timeout=None):
+        """
+        Blocks until the future resolves, returning its value, or raising its exception.
+        """
+        self._wait(timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+
+        return self._value
+
+    def _wait(self, timeout):
+        with self._condition:
+            if not self._done:
+                self._condition.wait(timeout)
+
+            if not self._done:
+                raise RuntimeError('Timed out waiting for future %r.' % self)
+
+
+def resolved(value):
+    """
+    Returns a future that has already resolved to `value`.
+    """
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def then(future, fn):
+    """
+    Returns a future that resolves to `fn(value)` once `future` resolves to `value`, or to
+    the exception of `future` (or `fn`) if either raises.
+    """
+    chained = Future()
+
+    def on_done(_):
+        try:
+            value = fn(future.result())
+        except Exception as e:
+            chained.set_exception(e, sys.exc_info()[2])
+        else:
+            chained.set_result(value)
+
+    future.add_done_callback(on_done)
+    return chained
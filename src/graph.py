@@ -1,11 +1,18 @@
 from collections import defaultdict, OrderedDict
+from functools import partial
+from itertools import izip
 
 from ast_utils import LITERAL_GLOBAL_KEY, transform_ast
 from literals import Literal
 from nodes import GLOBAL_ENTITIES
-from nodes.data import Data
+from nodes.has_label import prefetch_labels
+from nodes.rate_limit import group_rate_limits
 from nodes.rule import WhenRules
 from node import AnonymousNode, NamedNode
+from futures import then
+from utils import paused_gc
+from plan import DATA_SLOT, ExecutionPlan, Operands, get_batch_resolver, is_blocking, topological_order
+from scheduler import PlanExecution, get_blocking_pool
 
 
 class NodeNamespace(dict):
@@ -25,6 +32,10 @@ class NodeNamespace(dict):
         if isinstance(value, AnonymousNode):
             value = NamedNode(key, value)
 
+            bind_name = getattr(value.node, 'bind_name', None)
+            if bind_name is not None:
+                bind_name(key)
+
         super(NodeNamespace, self).__setitem__(key, value)
 
     def iter_named_nodes(self):
@@ -43,9 +54,19 @@ BASE_GLOBALS.update({
 
 
 def build(code):
+    """
+    Takes a code snippet containing our subset of python rules DSL, building the dependency
+    graph, and compiling it into an `ExecutionPlan` that will then be passed to an executor for
+    evaluation.
+    """
+    with paused_gc():
+        return ExecutionPlan(build_dependency_graph(code))
+
+
+def build_dependency_graph(code):
     """
     Takes a code snippet containing our subset of python rules DSL, and building
-    the dependency graph that will then be passed to an executor for evaluation.
+    the dependency graph, mapping each node to the set of nodes that depend on it.
     """
     # Phase 1, transform the AST, validating that the code is our subset of python
     # we are using to represent rules.
@@ -72,88 +93,218 @@ def build(code):
     # Run the code, which should evaluate all nodes.
     exec compiled in namespace
 
-    def build_dependency_graph(node):
-        """
-        For each node, recurse down its dependencies, building the dependency graph.
-        """
+    # Start the traversal by crawling the named nodes (and the `WhenRules` we have tracked),
+    # and traversing up their dependency chain to discover the dependency graph. The traversal
+    # visits each node once, in dependency order, so we only need to record its edges.
+    roots = list(dependency_graph)
+    roots.extend(namespace.iter_named_nodes())
+
+    # Label checks share a single lookup, and rate limits counting the same events share their
+    # counter, which changes their dependencies, so this must be done before the edges are recorded.
+    # The labels are prefetched first, so that rate limits are grouped by the final structure of
+    # their `where`, which may check labels (the shared lookup is a new node, hence the new order).
+    prefetch_labels(topological_order(roots))
+    group_rate_limits(topological_order(roots))
+
+    for node in topological_order(roots):
         dependency_graph[node]
         for dependent_node in node.get_dependent_nodes():
             dependency_graph[dependent_node].add(node)
-            build_dependency_graph(dependent_node)
-
-    # Start the traversal by crawling the named nodes, and traversing up their dependency
-    # chain to discover the dependency graph.
-    for node in namespace.iter_named_nodes():
-        build_dependency_graph(node)
 
     return dependency_graph
 
 
-def execute(dependency_graph, data):
+def execute(plan, data, outputs=None, actions=True):
     """
-    Given a dependency graph and input data, evaluate the rules for a given event.
+    Given an execution plan and input data, evaluate the rules for a given event.
+
+    Returning all the output named nodes within the plan (or only those named in `outputs`), to
+    their resolved value, and also the side-effects (entity label mutations) that should take place
+    as result of this execution (unless `actions` is False). Only the nodes needed for those are
+    evaluated, see `ExecutionPlan.select`.
 
-    Returning all the output named nodes within the dependency graph, to their resolved value,
-    and also the side-effects (entity label mutations) that should take place as result of this
-    execution.
+    If the plan has nodes that are `blocking`, they are resolved on a thread pool, as
+    `execute_async` would, and this waits for the result.
     """
+    plan = plan.select(outputs, actions)
+    if plan.blocking:
+        return execute_async(plan, data).result()
 
-    # This is a mapping of node (by identity) to its resolved value.
+    # The resolved value of every node, indexed by the slot the plan numbered it with.
     # Initially the only node that is resolved is the magic "Data" node, which is resolved to
     # the data that will seed this evaluation.
-    resolved = {
-        Data: data
-    }
+    values = list(plan.initial_values)
+    values[DATA_SLOT] = data
+    for slot, value in izip(plan.extracted_slots, plan.json_extractor.extract(data)):
+        values[slot] = value
 
-    def resolve(node):
-        """
-        Resolves the value of a node by recursively resolving its dependent nodes until the node is 
-        able to be resolved.
-        """
-        deps = node.get_dependent_nodes()
-        args = []
-        for dep in deps:
-            args.append(memoized_resolve(dep))
+    # Since the steps are in topological order, every argument of a step has been resolved
+    # by the time we reach it (or is deferred, and will be resolved by the lazy node that
+    # needs it).
+    for slot, _, resolve, arg_slots, resolve_lazy in plan.eager_steps:
+        if resolve_lazy is not None:
+            values[slot] = resolve_lazy(Operands(plan, values, arg_slots))
+            continue
 
-        if args and all(a is None for a in args):
-            return None
+        if not arg_slots:
+            values[slot] = resolve()
+            continue
 
-        return node.resolve(*args)
+        args = [values[arg_slot] for arg_slot in arg_slots]
 
-    def memoized_resolve(node):
-        """
-        Resolves a node, storing the value of the resolve in `resolved`, essentially memoizing
-        the resulting computation of said node.
-        """
-        if node not in resolved:
-            resolved[node] = resolve(node)
+        # If every dependency resolved to None, so does this node.
+        for arg in args:
+            if arg is not None:
+                values[slot] = resolve(*args)
+                break
 
-        return resolved[node]
+    return extract_result(plan, values)
 
-    # Execute the dependency graph.
-    for parent_node, dependent_nodes in dependency_graph.items():
-        for node in dependent_nodes:
-            memoized_resolve(node)
 
-        memoized_resolve(parent_node)
+def execute_async(plan, data, outputs=None, actions=True):
+    """
+    Given an execution plan and input data, start evaluating the rules for a given event,
+    returning a `Future` that will resolve to its `ExecutionResult`. `outputs` and `actions`
+    select what to evaluate, like they do for `execute`.
 
+    Unlike `execute`, nodes are started as soon as their dependencies have resolved, and nodes
+    that implement `resolve_async` are awaited concurrently, see `PlanExecution`.
+    """
+    plan = plan.select(outputs, actions)
+    execution = PlanExecution(plan, data)
+    return then(execution.start(), lambda values: extract_result(plan, values))
+
+
+def extract_result(plan, values):
+    """
+    Extract the output named nodes, and the actions of the `WhenRules` nodes, out of the
+    resolved values of a plan.
+    """
     result = {}
     actions = []
 
-    # Extract values out of the resolved nodes.
-    for node, resolved_value in resolved.items():
-        # If encountering a WhenRules node, the evaluation result are actions,
-        # which we want to collect.
-        if isinstance(node, WhenRules) and resolved_value:
-            actions.extend(resolved_value)
-        # If encountering a NamedNode, we want to store the resolved value,
-        # and return it to the caller.
-        elif isinstance(node, NamedNode):
-            result[node.name] = resolved_value
+    for name, slot in plan.outputs:
+        result[name] = values[slot]
+
+    # The evaluation result of `WhenRules` nodes are actions, which we want to collect.
+    for slot in plan.action_slots:
+        if values[slot]:
+            actions.extend(values[slot])
 
     return ExecutionResult(result, actions)
 
 
+def execute_many(plan, events, outputs=None, actions=True):
+    """
+    Given an execution plan and a batch of input data, evaluate the rules for every event in
+    the batch, returning a list of `ExecutionResult`, one for each event, in order. `outputs`
+    and `actions` select what to evaluate, like they do for `execute`.
+
+    Rather than executing the plan once per event, this evaluates the batch node by node: each
+    step resolves a whole column of values (one per event) at once. Nodes may implement
+    `resolve_many` to resolve a column more efficiently than one event at a time.
+    """
+    plan = plan.select(outputs, actions)
+    count = len(events)
+
+    # The resolved columns of every node, indexed by the slot the plan numbered it with.
+    columns = [[value] * count for value in plan.initial_values]
+    columns[DATA_SLOT] = list(events)
+
+    extracted = map(plan.json_extractor.extract, columns[DATA_SLOT])
+    for index, slot in enumerate(plan.extracted_slots):
+        columns[slot] = [values[index] for values in extracted]
+
+    for step in plan.eager_steps:
+        arg_columns = [columns[arg_slot] for arg_slot in step.arg_slots]
+
+        # Lazy nodes resolve their deferred dependencies for one event at a time.
+        if step.resolve_lazy is not None:
+            columns[step.slot] = [
+                step.resolve_lazy(Operands(plan, ColumnRow(columns, row), step.arg_slots))
+                for row in xrange(count)
+            ]
+            continue
+
+        resolve_many = get_batch_resolver(step.node)
+        if resolve_many is not None:
+            columns[step.slot] = resolve_many(count, *arg_columns)
+        elif is_blocking(step.node):
+            # The events of the batch are resolved on the blocking pool at the same time.
+            rows = izip(*arg_columns) if arg_columns else [()] * count
+            columns[step.slot] = get_blocking_pool().map(partial(resolve_row, step.resolve), rows)
+        else:
+            columns[step.slot] = resolve_column(step.resolve, count, arg_columns)
+
+    names = [name for name, _ in plan.outputs]
+    output_rows = izip(*[columns[slot] for _, slot in plan.outputs]) if names else [()] * count
+    action_columns = [columns[slot] for slot in plan.action_slots]
+
+    results = []
+    for row, output_row in enumerate(output_rows):
+        actions = []
+        for action_column in action_columns:
+            if action_column[row]:
+                actions.extend(action_column[row])
+
+        results.append(ExecutionResult(dict(izip(names, output_row)), actions))
+
+    return results
+
+
+def resolve_row(resolve, args):
+    """
+    Resolves the value of a single event, given the values of its dependencies, used for blocking
+    nodes, which resolve the events of a batch on a thread pool.
+    """
+    if not args:
+        return resolve()
+
+    # If every dependency resolved to None, so does this node.
+    for arg in args:
+        if arg is not None:
+            return resolve(*args)
+
+
+def resolve_column(resolve, count, arg_columns):
+    """
+    Resolves a column of `count` values, by calling `resolve` once for each event, used for
+    nodes that do not implement `resolve_many`.
+    """
+    if not arg_columns:
+        return [resolve() for _ in xrange(count)]
+
+    column = []
+    for args in izip(*arg_columns):
+        # If every dependency resolved to None, so does this node.
+        for arg in args:
+            if arg is not None:
+                column.append(resolve(*args))
+                break
+        else:
+            column.append(None)
+
+    return column
+
+
+class ColumnRow(object):
+    """
+    The values of a single event within the columns of `execute_many`, indexed by slot.
+    """
+
+    __slots__ = ('columns', 'row')
+
+    def __init__(self, columns, row):
+        self.columns = columns
+        self.row = row
+
+    def __getitem__(self, slot):
+        return self.columns[slot][self.row]
+
+    def __setitem__(self, slot, value):
+        self.columns[slot][self.row] = value
+
+
 class ExecutionResult(object):
     def __init__(self, data, actions):
         self.data = data
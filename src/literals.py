@@ -1,3 +1,5 @@
+from itertools import izip
+
 from node import AnonymousNode, BaseNode, ContainsNode
 from utils import expect, Checker
 
@@ -7,9 +9,18 @@ class Literal(AnonymousNode):
     A literal represents a node that resolves to a specific literal value, e.g. a number, string or list of nodes.
     """
 
+    pure = True
+
     def get_dependent_nodes(self):
         return []
 
+    def get_literal_args(self):
+        # The type is part of the key, as e.g. 1 and 1.0 are equal, but should not be merged.
+        return (type(self.value), self.value)
+
+    def resolve_many(self, count):
+        return [self.resolve()] * count
+
     def __repr__(self):
         return '<%s %r>' % (
             self.__class__.__name__,
@@ -67,9 +78,26 @@ class ListLiteral(Literal):
     def get_dependent_nodes(self):
         return self.value
 
+    def get_literal_args(self):
+        return ()
+
     def resolve(self, *args):
         return list(args)
 
+    def resolve_many(self, count, *columns):
+        if not columns:
+            return [[] for _ in xrange(count)]
+
+        column = map(list, izip(*columns))
+        for i, values in enumerate(column):
+            for value in values:
+                if value is not None:
+                    break
+            else:
+                column[i] = None
+
+        return column
+
     def contains(self, item):
         return ContainsNode(self, item)
 
@@ -1,3 +1,6 @@
+import operator
+from itertools import izip
+
 from utils import expect, Checker
 
 
@@ -8,31 +11,31 @@ class ComparisonMixin(object):
     """
 
     def __eq__(self, other):
-        return CmpNode(self, other, lambda a, b: a == b)
+        return CmpNode(self, other, operator.eq)
 
     def __ne__(self, other):
-        return InvertNode(CmpNode(self, other, lambda a, b: a == b))
+        return InvertNode(CmpNode(self, other, operator.eq))
 
     def in_(self, collection):
         return ContainsNode(collection, self)
 
     def __or__(self, other):
-        return CmpNode(self, other, lambda a, b: bool(a or b))
+        return OrNode(self, other)
 
     def __and__(self, other):
-        return CmpNode(self, other, lambda a, b: bool(a and b))
+        return AndNode(self, other)
 
     def __gt__(self, other):
-        return CmpNode(self, other, lambda a, b: a > b)
+        return CmpNode(self, other, operator.gt)
 
     def __ge__(self, other):
-        return CmpNode(self, other, lambda a, b: a >= b)
+        return CmpNode(self, other, operator.ge)
 
     def __lt__(self, other):
-        return CmpNode(self, other, lambda a, b: a < b)
+        return CmpNode(self, other, operator.lt)
 
     def __le__(self, other):
-        return CmpNode(self, other, lambda a, b: a <= b)
+        return CmpNode(self, other, operator.le)
 
     def __invert__(self):
         return InvertNode(self)
@@ -58,6 +61,59 @@ class BaseNode(object):
         """
         raise NotImplementedError(self)
 
+    # Whether this node is pure: its resolved value only depends on the values of its
+    # dependencies, and resolving it has no side effects. Pure nodes that do not depend on the
+    # data of the event are resolved once, when the plan is compiled, rather than for each event.
+    pure = False
+
+    # Pure nodes that are expensive to resolve (e.g. a geoip lookup) may set `memoize` to the
+    # number of resolved values to keep in an `LRUCache`, keyed on the values of their
+    # dependencies, and shared by every event (and every plan). Its hits and misses are counted,
+    # see `plan.get_resolve_cache`. Resolved values are then shared between events, and must not
+    # be mutated. `execute_many` then resolves them with `resolve` rather than `resolve_many`, and
+    # `resolve_async` is not memoized.
+    memoize = None
+
+    def get_literal_args(self):
+        """
+        Return the arguments of this node that are not nodes (e.g. the `reason` of a `Rule`), as
+        a hashable value, if any two nodes of the same class, with the same literal arguments and the
+        same dependencies, always resolve to the same value. Such nodes are merged when the graph is
+        built, and resolved only once.
+
+        The default, None, means that the node must never be merged with other nodes, e.g.
+        because it keeps state, or its resolved value is mutated later on.
+        """
+        return None
+
+    # Nodes may optionally implement `resolve_many(self, count, *columns)`, which is used by
+    # `execute_many` to resolve this node for `count` events at once. Each column is a list of
+    # the resolved values of a dependency, one per event, and it must return a list of `count`
+    # resolved values. Like the executor does for `resolve`, it must resolve an event to None if
+    # all of the dependencies of that event resolved to None. Subclasses that override `resolve`
+    # (but not `resolve_many`) are resolved with their `resolve`, see `plan.get_batch_resolver`.
+
+    # Nodes may optionally implement `resolve_lazy(self, operands)`, which is used instead of
+    # `resolve` when some of their dependencies are only needed by this node, and can be skipped.
+    # `operands` is a sequence of the dependencies that resolves each one the first time it is
+    # accessed, so that the node can stop early, e.g. at the first truthy operand. Unlike
+    # `resolve`, it is called even if all of the dependencies would resolve to None, and must
+    # then resolve to whatever `resolve` would have. As it may be interrupted at any operand, and
+    # called again once that operand is resolved (see `plan.force`), it must not have side effects.
+
+    # Nodes which wait on I/O may optionally implement `resolve_async(self, *args)`, which is
+    # used by `execute_async` instead of `resolve`, and must return a `futures.Future` of the
+    # resolved value, so that the executor can resolve other nodes while it is pending.
+
+    # Nodes which wait on I/O, but can not implement `resolve_async` (e.g. because their client
+    # only has a blocking API), may instead set `blocking`, so that their `resolve` is called on a
+    # thread pool (see `scheduler.run_blocking`), while the executor resolves the nodes that do not
+    # depend on them. `execute` then waits for the pool, so its API does not change.
+    blocking = False
+
+    # Nodes which keep state may optionally implement `bind_name(self, name)`, which is called
+    # with the name the node is bound to in the rules (if any), to key their state by it.
+
 
 class AnonymousNode(BaseNode, ComparisonMixin):
     """
@@ -68,16 +124,44 @@ class AnonymousNode(BaseNode, ComparisonMixin):
 
 
 class ContainsNode(AnonymousNode):
+    pure = True
+
     def __init__(self, collection, item):
         from literals import Literal
+        from nodes.file_list import FileList
 
-        self.collection = expect(Literal.List, collection)
+        self.collection = expect((Literal.List, FileList), collection)
         self.item = expect(BaseNode, item)
 
+        # If the collection is made of literals, membership can be checked with a set lookup
+        # rather than comparing the item with each member.
+        self.members = None
+        if isinstance(collection, NamedNode):
+            collection = collection.node
+
+        if isinstance(collection, Literal.List) and all(
+            isinstance(c, Literal) and not isinstance(c, Literal.List) for c in collection.value
+        ):
+            self.members = frozenset(c.unwrap() for c in collection.value)
+
     def get_dependent_nodes(self):
         return [self.collection, self.item]
 
+    def get_literal_args(self):
+        return ()
+
     def resolve(self, collection, item):
+        if self.members is not None:
+            try:
+                return item in self.members
+            except TypeError:
+                # The item is not hashable, fall back to comparing it against each member.
+                pass
+
+        if not isinstance(collection, list):
+            # The members of a `FileList`, which do their own lookups.
+            return item in collection
+
         return any(
             c == item
             for c in collection
@@ -89,29 +173,105 @@ class CmpNode(AnonymousNode):
     A node that executes the `comparitor` against the resolved values of the provided nodes (a, b).
     """
 
+    pure = True
+
     def __init__(self, a, b, comparitor):
         self.a = expect(BaseNode, a)
         self.b = expect(BaseNode, b)
+        self.comparitor = comparitor
         self.resolve = comparitor
 
     def get_dependent_nodes(self):
         return [self.a, self.b]
 
+    def get_literal_args(self):
+        return (self.comparitor,)
+
+    def resolve_many(self, count, a, b):
+        column = map(self.comparitor, a, b)
+
+        # Only if both columns have a None can there be an event where both sides are None.
+        if None in a and None in b:
+            for i, (value_a, value_b) in enumerate(izip(a, b)):
+                if value_a is None and value_b is None:
+                    column[i] = None
+
+        return column
+
+
+def logical_or(a, b):
+    return bool(a or b)
+
+
+def logical_and(a, b):
+    return bool(a and b)
+
+
+class OrNode(CmpNode):
+    """
+    A node that resolves to whether either of the provided nodes (a, b) resolved to a truthy value.
+    When resolved lazily, `b` is only resolved if `a` is not truthy.
+    """
+
+    def __init__(self, a, b):
+        super(OrNode, self).__init__(a, b, logical_or)
+
+    def resolve_lazy(self, operands):
+        a = operands[0]
+        if a:
+            return True
+
+        b = operands[1]
+        if a is None and b is None:
+            return None
+
+        return bool(b)
+
+
+class AndNode(CmpNode):
+    """
+    A node that resolves to whether both of the provided nodes (a, b) resolved to a truthy value.
+    When resolved lazily, `b` is only resolved if `a` is truthy, or None.
+    """
+
+    def __init__(self, a, b):
+        super(AndNode, self).__init__(a, b, logical_and)
+
+    def resolve_lazy(self, operands):
+        a = operands[0]
+        # If `a` is None, we still need `b` to know whether we resolve to None or False.
+        if a is not None and not a:
+            return False
+
+        b = operands[1]
+        if a is None and b is None:
+            return None
+
+        return bool(a and b)
+
 
 class InvertNode(AnonymousNode):
     """
     A node that does a bool not against the resolved value of the provided nodes.
     """
 
+    pure = True
+
     def __init__(self, a):
         self.a = expect(BaseNode, a)
 
     def get_dependent_nodes(self):
         return [self.a]
 
+    def get_literal_args(self):
+        return ()
+
     def resolve(self, a):
         return bool(not a)
 
+    def resolve_many(self, count, a):
+        return [None if value is None else not value for value in a]
+
 
 class NamedNode(BaseNode, ComparisonMixin):
     """
@@ -5,6 +5,9 @@ from .has_label import HasLabel
 from .rate_limit import RateLimit
 from .coalesce import Coalesce
 from .interval import Interval
+from .file_list import FileList
+from .count_distinct import CountDistinct
+from .aggregate import Sum, Avg, Max
 
 GLOBAL_ENTITIES = {
     'Coalesce': Coalesce,
@@ -16,4 +19,9 @@ GLOBAL_ENTITIES = {
     'Label': Label,
     'RateLimit': RateLimit,
     'Interval': Interval,
+    'FileList': FileList,
+    'CountDistinct': CountDistinct,
+    'Sum': Sum,
+    'Avg': Avg,
+    'Max': Max,
 }
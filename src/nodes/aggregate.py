@@ -0,0 +1,96 @@
+from numbers import Number
+
+from node import AnonymousNode, BaseNode
+from utils import expect
+from stores import aggregate as aggregate_stores
+from stores.windows import Window
+
+from .entity import Entity
+from .interval import Interval
+from .rate_limit import describe_node
+
+
+class WindowedAggregate(AnonymousNode):
+    """
+    The base of the nodes that aggregate the values `of` resolved to, for the events of the
+    entity `by`, within the sliding window of the last `per`, including the current event.
+
+    Their state is keyed by the name the node is bound to (or, for anonymous nodes, by what they
+    aggregate), so that graphs built from the same rules share it. Subclasses implement
+    `add(key, value)`, returning the aggregate.
+    """
+
+    def __init__(self, by, of, per):
+        self.by = expect(Entity, by)
+        self.of = expect(BaseNode, of)
+        self.per = expect(Interval, per).unwrap()
+
+        self.window = Window(self.per.total_seconds())
+        # Anonymous aggregates are keyed by what they aggregate, like anonymous rate limits, so
+        # that they keep their state when the rules are built again.
+        self.name = u'%s(%s, of=%s, per=%r)' % (
+            type(self).__name__, describe_node(self.by), describe_node(self.of), self.window.seconds)
+        self.is_named = False
+
+    def bind_name(self, name):
+        if not self.is_named:
+            self.name = name
+            self.is_named = True
+
+    def get_dependent_nodes(self):
+        return [self.by, self.of]
+
+    def resolve(self, by, of):
+        # The entity could not be resolved, so there is nothing to aggregate.
+        if by is None:
+            return None
+
+        return self.add((self.name, by.entity_path()), of)
+
+    def add(self, key, value):
+        raise NotImplementedError(self)
+
+
+class NumericAggregate(WindowedAggregate):
+    """
+    The base of `Sum`, `Avg` and `Max`, which keep their aggregate of type `aggregate` in
+    `stores.aggregate.store`. Values that are not numbers (including booleans) are not
+    aggregated.
+    """
+
+    aggregate = None
+
+    def add(self, key, value):
+        if not isinstance(value, Number) or isinstance(value, bool):
+            value = None
+
+        return aggregate_stores.store.add(key, value, self.window, self.aggregate)
+
+
+class Sum(NumericAggregate):
+    """
+    A node that resolves to the sum of the values `of` resolved to for the entity `by` in the
+    last `per`, e.g. the total amount a user paid in the last hour:
+
+        PaymentsPerHour = Sum(by=User, of=JsonData('$.payment.amount'), per=Interval.Hours(1))
+    """
+
+    aggregate = aggregate_stores.SUM
+
+
+class Avg(NumericAggregate):
+    """
+    A node that resolves to the average of the values `of` resolved to for the entity `by` in
+    the last `per`, or None if there were none.
+    """
+
+    aggregate = aggregate_stores.AVERAGE
+
+
+class Max(NumericAggregate):
+    """
+    A node that resolves to the maximum of the values `of` resolved to for the entity `by` in
+    the last `per`, or None if there were none.
+    """
+
+    aggregate = aggregate_stores.MAXIMUM
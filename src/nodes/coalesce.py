@@ -1,3 +1,5 @@
+from itertools import izip
+
 from node import BaseNode, AnonymousNode
 from utils import expect
 
@@ -8,13 +10,34 @@ class Coalesce(AnonymousNode):
     or None if all nodes resolve to None.
     """
 
+    pure = True
+
     def __init__(self, *nodes):
         self.nodes = [expect(BaseNode, node) for node in nodes]
 
     def get_dependent_nodes(self):
         return self.nodes
 
+    def get_literal_args(self):
+        return ()
+
     def resolve(self, *nodes):
+        return self.resolve_lazy(nodes)
+
+    def resolve_lazy(self, nodes):
         for node in nodes:
             if node is not None:
                 return node
+
+    def resolve_many(self, count, *columns):
+        column = list(columns[0])
+        for next_column in columns[1:]:
+            if None not in column:
+                break
+
+            column = [
+                value if value is not None else next_value
+                for value, next_value in izip(column, next_column)
+            ]
+
+        return column
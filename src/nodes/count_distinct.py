@@ -0,0 +1,28 @@
+import json
+
+from stores import count_distinct as count_distinct_stores
+
+from .aggregate import WindowedAggregate
+
+
+class CountDistinct(WindowedAggregate):
+    """
+    A node that resolves to the (estimated) number of distinct values that `of` resolved to, for
+    the events of the entity `by`, within the sliding window of the last `per`, including the
+    current event.
+
+    Example usage may look like:
+
+        EmailsPerIp = CountDistinct(by=Ip, of=UserEmail, per=Interval.Days(1))
+
+    The estimates come from HyperLogLog sketches kept in `stores.count_distinct.store`.
+    """
+
+    def add(self, key, value):
+        try:
+            hash(value)
+        except TypeError:
+            # Lists and objects of the event are counted by their JSON encoding.
+            value = (u'json', json.dumps(value, sort_keys=True))
+
+        return int(round(count_distinct_stores.store.add(key, value, self.window)))
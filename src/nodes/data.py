@@ -30,12 +30,18 @@ class JsonData(AnonymousNode):
     Given the data: {"user": {"id": 5}}, would resolve to `5`.
     """
 
+    pure = True
+
     def __init__(self, selector):
-        self.selector = jsonpath_rw.parse(
-            expect(Literal.String, selector).unwrap()
-        )
+        self.source = expect(Literal.String, selector).unwrap()
+        self.selector = jsonpath_rw.parse(self.source)
+        # For plain selectors like `$.a.b.c`, the keys to look up, in order.
+        self.path = get_simple_path(self.selector)
 
     def resolve(self, data):
+        if self.path is not None:
+            return lookup_path(data, self.path)
+
         result = self.selector.find(data)
         if not result:
             return None
@@ -44,3 +50,119 @@ class JsonData(AnonymousNode):
 
     def get_dependent_nodes(self):
         return [Data]
+
+    def get_literal_args(self):
+        if self.path is not None:
+            return self.path
+
+        return self.source
+
+
+# The errors that mean that a key is not present in a value, the same ones that jsonpath_rw
+# treats as the field not being found.
+LOOKUP_ERRORS = (TypeError, KeyError, AttributeError)
+
+
+def get_simple_path(selector):
+    """
+    If the parsed jsonpath `selector` only selects plain fields starting from the root, e.g.
+    `$.a.b.c`, returns the tuple of fields to look up, e.g. ('a', 'b', 'c'). Otherwise None.
+    """
+    def get_field(expression):
+        if isinstance(expression, jsonpath_rw.Fields) and len(expression.fields) == 1:
+            field = expression.fields[0]
+            if field != '*':
+                return field
+
+    path = []
+    while isinstance(selector, jsonpath_rw.Child):
+        field = get_field(selector.right)
+        if field is None:
+            return None
+
+        path.append(field)
+        selector = selector.left
+
+    if not isinstance(selector, jsonpath_rw.Root):
+        field = get_field(selector)
+        if field is None:
+            return None
+
+        path.append(field)
+
+    return tuple(reversed(path))
+
+
+def lookup_path(data, path):
+    """
+    Looks up a path returned by `get_simple_path` in the data, returning None if it is not there.
+    """
+    for key in path:
+        try:
+            data = data[key]
+        except LOOKUP_ERRORS:
+            return None
+
+    return data
+
+
+class JsonExtractor(object):
+    """
+    Extracts the values of many `JsonData` nodes at once.
+
+    The plain paths of the nodes are merged into a trie, so that the data is walked only once,
+    and each key shared by several paths (e.g. `user` in `$.user.id` and `$.user.email`) is only
+    looked up once. The nodes with selectors that are not plain paths are resolved separately.
+    """
+
+    def __init__(self, nodes):
+        # Each trie node is a tuple of (indexes of the nodes whose path ends here, children),
+        # where the children are a dict of key to trie node, later frozen into tuples of
+        # (key, trie node) pairs.
+        root = ([], {})
+        self.fallbacks = []
+
+        for index, node in enumerate(nodes):
+            if node.path is None:
+                self.fallbacks.append((index, node))
+                continue
+
+            trie = root
+            for key in node.path:
+                trie = trie[1].setdefault(key, ([], {}))
+
+            trie[0].append(index)
+
+        def freeze(trie):
+            indexes, children = trie
+            return tuple(indexes), tuple(
+                (key, freeze(child)) for key, child in children.iteritems()
+            )
+
+        self.trie = freeze(root)
+        self.size = len(nodes)
+
+    def extract(self, data):
+        """
+        Returns the values of each node, in the order the nodes were given.
+        """
+        values = [None] * self.size
+        if data is None:
+            return values
+
+        stack = [(data, self.trie)]
+        while stack:
+            value, (indexes, children) = stack.pop()
+            for index in indexes:
+                values[index] = value
+
+            for key, child in children:
+                try:
+                    stack.append((value[key], child))
+                except LOOKUP_ERRORS:
+                    pass
+
+        for index, node in self.fallbacks:
+            values[index] = node.resolve(data)
+
+        return values
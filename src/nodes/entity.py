@@ -16,6 +16,8 @@ class Entity(AnonymousNode):
 
     """
 
+    pure = True
+
     def __init__(self, entity_type, entity_id):
         self.type = expect(Literal.String, entity_type).unwrap()
         self.id = expect(AnonymousNode, entity_id)
@@ -23,6 +25,9 @@ class Entity(AnonymousNode):
     def get_dependent_nodes(self):
         return [self.id]
 
+    def get_literal_args(self):
+        return (self.type,)
+
     def resolve(self, entity_id):
         return EntityRef(self.type, entity_id)
 
@@ -50,3 +55,7 @@ class EntityRef(object):
 
         # Otherwise, equality is implicit upon comparing against the ID.
         return self.id == other
+
+    def __hash__(self):
+        # Hashes like the ID, as an entity ref is equal to its ID.
+        return hash(self.id)
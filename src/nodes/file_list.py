@@ -0,0 +1,212 @@
+import mmap
+import os
+import threading
+
+from node import AnonymousNode, ContainsNode
+from utils import expect
+from literals import Literal
+
+from .entity import EntityRef
+
+
+class FileList(AnonymousNode):
+    """
+    A node that resolves to the members of a list stored in a local file, with one member per
+    line, for lists that are too large to inline into the rules, e.g. denylists of domains or
+    IPs. It is meant to be used as the collection of `in_`:
+
+        IsDeniedDomain = EmailDomain.in_(FileList('lists/email_domains.txt'))
+
+    By default, the file is loaded into a set. Blank lines, and lines starting with `#`, are
+    ignored. For lists that do not fit into memory, `sorted=True` will instead memory map the
+    file, and look members up with a binary search. The file must then be sorted by byte value
+    (e.g. with `LC_ALL=C sort -u`), with no comments, and be updated by writing the new list to
+    another file, and renaming it over the old one, rather than by rewriting it in place.
+
+    The file is loaded once per process, when the graph is built, and the loaded list is shared
+    by every graph that uses the same file. `reload_file_lists` picks up changes to the files
+    without rebuilding the graphs.
+    """
+
+    pure = True
+
+    def __init__(self, path, sorted=None):
+        sorted = expect(Literal.Bool, sorted).unwrap() if sorted is not None else False
+        self.members = load_file_list(expect(Literal.String, path).unwrap(), sorted)
+
+    def get_dependent_nodes(self):
+        return []
+
+    def get_literal_args(self):
+        return (self.members.path, type(self.members))
+
+    def resolve(self):
+        return self.members
+
+    def contains(self, item):
+        return ContainsNode(self, item)
+
+
+def member_key(item):
+    """
+    Converts the value being looked up into the unicode string that would be its line in the file.
+    """
+    if isinstance(item, EntityRef):
+        item = item.id
+
+    if isinstance(item, str):
+        return item.decode('utf-8', 'replace')
+
+    if item is None or isinstance(item, unicode):
+        return item
+
+    return unicode(item)
+
+
+class MemberFile(object):
+    """
+    The members of a list file. Subclasses implement `load` and `__contains__`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stat = None
+        self.reload()
+
+    def __repr__(self):
+        return '<%s path=%r>' % (type(self).__name__, self.path)
+
+    def reload(self):
+        """
+        Loads the file again if it has changed since it was last loaded. Returns whether it was.
+        """
+        stat = os.stat(self.path)
+        stat = (stat.st_ino, stat.st_size, stat.st_mtime)
+        if stat == self._stat:
+            return False
+
+        # The new members are swapped in with a single assignment, so that concurrent lookups
+        # see either all of the old members, or all of the new ones.
+        self.load()
+        self._stat = stat
+        return True
+
+    def load(self):
+        raise NotImplementedError(self)
+
+
+class MemberSet(MemberFile):
+    """
+    The members of a list file, loaded into a set.
+    """
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            members = frozenset(
+                line.decode('utf-8', 'replace')
+                for line in (line.strip() for line in f)
+                if line and not line.startswith('#')
+            )
+
+        self._members = members
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, item):
+        return member_key(item) in self._members
+
+
+class SortedMemberFile(MemberFile):
+    """
+    The members of a sorted list file, memory mapped, and looked up with a binary search, so
+    that the list does not need to fit in memory.
+
+    A map reflects any change to the file it maps, so lookups would see a file that is being
+    rewritten in place half written (or, if it was truncated, crash the process). A file that
+    is replaced by a rename is safe to map, as the map keeps the old file alive until it is
+    loaded again. Should the file still be rewritten in place, it is read into memory instead,
+    from then on.
+    """
+
+    _inode = None
+    # Whether the file was rewritten in place, and so is read into memory rather than mapped.
+    rewritten = False
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino == self._inode:
+                self.rewritten = True
+
+            if stat.st_size == 0:
+                # Empty files can not be mapped, but a str supports the same lookups.
+                data = ''
+            elif self.rewritten:
+                data = f.read()
+            else:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._data = data
+        self._inode = stat.st_ino
+
+    def __contains__(self, item):
+        key = member_key(item)
+        if key is None:
+            return False
+
+        key = key.encode('utf-8')
+        data = self._data
+
+        # Lines starting within [low, high) are yet to be searched, and `low` is always the
+        # start of a line.
+        low, high = 0, len(data)
+        while low < high:
+            middle = (low + high) // 2
+            start = data.rfind('\n', low, middle)
+            start = low if start == -1 else start + 1
+            end = data.find('\n', start)
+            if end == -1:
+                end = len(data)
+
+            line = data[start:end].strip()
+            if line == key:
+                return True
+
+            if line < key:
+                low = end + 1
+            else:
+                high = start
+
+        return False
+
+
+# The list files loaded by this process, keyed by their path and type, shared by every graph.
+_file_lists = {}
+_file_lists_lock = threading.Lock()
+
+
+def load_file_list(path, sorted=False):
+    """
+    Returns the members of the list file at `path`, loading it if it was not loaded already.
+    """
+    member_file_class = SortedMemberFile if sorted else MemberSet
+    key = (os.path.abspath(path), member_file_class)
+
+    with _file_lists_lock:
+        member_file = _file_lists.get(key)
+        if member_file is None:
+            member_file = _file_lists[key] = member_file_class(key[0])
+
+    return member_file
+
+
+def reload_file_lists():
+    """
+    Loads the list files that have changed since they were loaded. Graphs that use them see the
+    new members from their next execution, without having to be rebuilt.
+    """
+    with _file_lists_lock:
+        member_files = _file_lists.values()
+
+    return [member_file for member_file in member_files if member_file.reload()]
@@ -1,17 +1,17 @@
-from collections import defaultdict
 from node import AnonymousNode
 from nodes.entity import Entity
 from literals import Literal
+from stores import labels as label_stores
 from utils import expect
 
-# XX: Hack, need actual entity label implementation.
-entity_labels = defaultdict(dict)
-
 
 class HasLabel(AnonymousNode):
     """
     A node which will take an entity + label + status, and resolve a boolean as to
     whether or not the entity the given label in the status provided.
+
+    The labels are looked up by a `LabelLookup`, shared by every `HasLabel` of the graph (see
+    `prefetch_labels`), so that the labels of all of the entities are looked up at once.
     """
 
     def __init__(self, entity, label, status):
@@ -21,12 +21,81 @@ class HasLabel(AnonymousNode):
 
         assert self.status in {'ADDED', 'REMOVED'}
 
+        self.lookup = LabelLookup([self.entity])
+
+    def get_dependent_nodes(self):
+        return [self.lookup, self.entity]
+
+    def get_literal_args(self):
+        return (self.label, self.status)
+
+    def resolve(self, labels, entity):
+        if entity is None:
+            return None
+
+        return labels.get(entity.entity_path(), {}).get(self.label) == self.status
+
+
+class LabelLookup(AnonymousNode):
+    """
+    A node that looks up the labels of all of the given entities in `stores.labels.store`, with
+    a single `get_many`, resolving to the dict it returns.
+
+    Like any other node, it is only resolved if one of the `HasLabel` nodes that need it is: if
+    they are all deferred (e.g. behind a `Rule` that short-circuits), the store is only hit when
+    the first of them is resolved. There is then a single lookup per event, or per batch, if the
+    lookup is not deferred.
+    """
+
+    def __init__(self, entities):
+        self.entities = entities
+
     def get_dependent_nodes(self):
-        return [self.entity]
+        return self.entities
+
+    def resolve(self, *entities):
+        return label_stores.store.get_many(set(
+            entity.entity_path() for entity in entities
+            if entity is not None
+        ))
+
+    def resolve_many(self, count, *columns):
+        rows = [[] for _ in xrange(count)]
+        for column in columns:
+            for row, entity in enumerate(column):
+                if entity is not None:
+                    rows[row].append(entity.entity_path())
+
+        labels = label_stores.store.get_many(set(
+            entity_path for entity_paths in rows
+            for entity_path in entity_paths
+        ))
+
+        # The labels of the whole batch are shared by the events that have any entity.
+        return [labels if entity_paths else None for entity_paths in rows]
+
+
+def prefetch_labels(nodes):
+    """
+    Given the nodes of a graph, makes every `HasLabel` node share a single `LabelLookup`, of all
+    of their entities.
+    """
+    from plan import unwrap
+
+    has_labels = [node for node in map(unwrap, nodes) if isinstance(node, HasLabel)]
+    if not has_labels:
+        return
+
+    entities = []
+    seen = set()
+    for has_label in has_labels:
+        if has_label.entity not in seen:
+            seen.add(has_label.entity)
+            entities.append(has_label.entity)
 
-    def resolve(self, entity):
-        k = entity.entity_path()
-        return entity_labels.get(k, {}).get(self.label) == self.status
+    lookup = LabelLookup(entities)
+    for has_label in has_labels:
+        has_label.lookup = lookup
 
 
 def has_label_added(entity, label):
@@ -37,5 +106,5 @@ def has_label_removed(entity, label):
     return HasLabel(entity, label, Literal.String('REMOVED'))
 
 
-HasLabel.Added = has_label_added
-HasLabel.Removed = has_label_removed
+HasLabel.Added = staticmethod(has_label_added)
+HasLabel.Removed = staticmethod(has_label_removed)
@@ -15,6 +15,9 @@ class Interval(AnonymousNode):
     def __init__(self, seconds):
         self.seconds = expect(Literal.Number, seconds).unwrap()
 
+    def get_literal_args(self):
+        return (self.seconds,)
+
     def resolve(self):
         return timedelta(seconds=self.seconds)
 
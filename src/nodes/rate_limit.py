@@ -1,33 +1,154 @@
-from collections import defaultdict
+from collections import OrderedDict
 
-from node import AnonymousNode, BaseNode
+from node import AnonymousNode, BaseNode, NamedNode
 from utils import expect
 from literals import Literal
+from stores import rate_limit as rate_limit_stores
+from stores.windows import Window
 
 from .entity import Entity
 from .interval import Interval
 
 
 class RateLimit(AnonymousNode):
-    def __init__(self, by, max, per, where=None):
-        # XX: Hack, need actual rate limit implementation.
-        self._state = defaultdict(int)
+    """
+    A node that counts the events of the entity `by` (for which every node in `where` resolved
+    to a truthy value), resolving to whether more than `max` of them were counted within the
+    sliding window of the last `per`.
 
+    If `approx`, the events are counted approximately, in a fixed amount of memory, no matter how
+    many entities are counted, but may be overcounted (see `stores.rate_limit.approximate_store`).
+    This is meant for entities with a very large number of ids, such as IPs.
+
+    The counting is done by a `RateLimitCounter`, which is shared by the rate limits with the
+    same `by` and `where` when the graph is built (see `group_rate_limits`), so that each event
+    is only counted once for all of their windows.
+    """
+
+    def __init__(self, by, max, per, where=None, approx=None):
         where = where or Literal.List([])
+        approx = approx or Literal.Bool(False)
         self.by = expect(Entity, by)
         self.max = expect(Literal.Number, max).unwrap()
         self.per = expect(Interval, per).unwrap()
         self.where = expect(Literal.List.Of(BaseNode), where)
+        self.approx = expect(Literal.Bool, approx).unwrap()
+
+        self.window = Window(self.per.total_seconds())
+        # Anonymous rate limits are keyed by what they count, so that they keep their counts
+        # when the rules are built again, but never pick up the counts of another rate limit.
+        self.name = u'RateLimit(%s, max=%r, per=%r, where=%s)' % (
+            describe_node(self.by), self.max, self.window.seconds, describe_node(self.where))
+        self.is_named = False
+        self.use_counter(RateLimitCounter(self.by, self.where, self.approx, [self]))
+
+    def bind_name(self, name):
+        if not self.is_named:
+            self.name = name
+            self.is_named = True
+
+    def use_counter(self, counter):
+        self.counter = counter
+        self.window_index = counter.windows.index(self.window)
+
+    def get_dependent_nodes(self):
+        return [self.counter]
+
+    def resolve(self, counts):
+        # The event was not counted, as it did not match `where`.
+        if not counts:
+            return False
+
+        return counts[self.window_index] > self.max
+
+
+class RateLimitCounter(AnonymousNode):
+    """
+    Counts the events of the entity `by` for which every node in `where` resolved to a truthy
+    value, over the windows of the given rate limits. Resolves to the counts of each of its
+    `windows`, or to an empty tuple if the event was not counted.
+
+    The counters are kept in `stores.rate_limit.store` (or `approximate_store`, if `approx`),
+    keyed by the name of the counter (see `get_counter_name`), so that graphs built from the
+    same rules share them.
+    """
+
+    def __init__(self, by, where, approx, rate_limits):
+        self.by = by
+        self.where = where
+        self.approx = approx
+        windows = set(rate_limit.window for rate_limit in rate_limits)
+        self.windows = tuple(sorted(windows, key=lambda window: window.seconds))
+        self.name = get_counter_name(by, where, rate_limits)
 
     def get_dependent_nodes(self):
         return [self.by, self.where]
 
     def resolve(self, by, where):
         if where and not any(where):
-            return False
+            return ()
+
+        # The entity could not be resolved, so there is nothing to count.
+        if by is None:
+            return None
+
+        store = rate_limit_stores.approximate_store if self.approx else rate_limit_stores.store
+        return store.increment((self.name, by.entity_path()), self.windows)
+
+
+def get_counter_name(by, where, rate_limits):
+    """
+    Counters are named after what they count, if it is named (e.g. `User[IsPost]`), so that
+    they keep their counts when rate limits are added to, or removed from, the rules. Otherwise,
+    after the rate limits that use them.
+    """
+    if isinstance(by, NamedNode) and all(isinstance(node, NamedNode) for node in where.value):
+        return u'%s[%s]' % (by.name, u','.join(node.name for node in where.value))
+
+    return u','.join(sorted(rate_limit.name for rate_limit in rate_limits))
+
+
+def describe_node(node):
+    """
+    Describes the computation of `node` the same way every time the same rules are built (unlike
+    its `id`): named nodes by their name, and other nodes by their type, literal arguments and
+    dependencies.
+    """
+    if isinstance(node, NamedNode):
+        return node.name
+
+    parts = [describe_literal(arg) for arg in node.get_literal_args() or ()]
+    parts.extend(describe_node(dependency) for dependency in node.get_dependent_nodes())
+    return u'%s(%s)' % (type(node).__name__, u', '.join(parts))
+
+
+def describe_literal(value):
+    # Functions (e.g. the comparitor of a `CmpNode`) are described by name, not by address.
+    if callable(value) and hasattr(value, '__name__'):
+        return unicode(value.__name__)
+
+    return unicode(repr(value))
+
 
-        k = by.entity_path()
+def group_rate_limits(nodes):
+    """
+    Given the nodes of a graph in topological order, makes the rate limits which count the same
+    events the same way, that is, with structurally identical `by` and `where`, and the same
+    `approx`, share one counter.
+    """
+    from plan import find_canonical_nodes, unwrap
 
-        self._state[k] += 1
+    canonical = find_canonical_nodes(nodes)
+    groups = OrderedDict()
+    for node in nodes:
+        rate_limit = unwrap(node)
+        if isinstance(rate_limit, RateLimit):
+            key = canonical[rate_limit.by], canonical[rate_limit.where], rate_limit.approx
+            groups.setdefault(key, OrderedDict())[rate_limit] = None
 
-        return self._state[k] > self.max
+    for rate_limits in groups.itervalues():
+        rate_limits = list(rate_limits)
+        first = rate_limits[0]
+        counter = RateLimitCounter(first.by, first.where, first.approx, rate_limits)
+        for rate_limit in rate_limits:
+            rate_limit.use_counter(counter)
@@ -1,3 +1,5 @@
+from itertools import izip
+
 from node import AnonymousNode, NamedNode
 from utils import expect
 from literals import Literal
@@ -22,16 +24,51 @@ class LabelAction(object):
 
 
 class Rule(AnonymousNode):
+    pure = True
+
     def __init__(self, when, reason=None):
         self.when = expect(Literal.List, when)
         self.reason = expect(Literal.String, reason).unwrap()
 
     def get_dependent_nodes(self):
-        return [self.when]
+        return self.when.value
+
+    def get_literal_args(self):
+        return (self.reason,)
 
-    def resolve(self, when):
+    def resolve(self, *when):
         return any(when)
 
+    def resolve_many(self, count, *columns):
+        column = [False] * count
+        for i, next_column in enumerate(columns):
+            if i == 0:
+                column = [None if value is None else bool(value) for value in next_column]
+                continue
+
+            column = [
+                True if (value or next_value) else
+                None if (value is None and next_value is None) else
+                False
+                for value, next_value in izip(column, next_column)
+            ]
+
+        return column
+
+    def resolve_lazy(self, when):
+        all_none = True
+        for value in when:
+            if value:
+                return True
+
+            if value is not None:
+                all_none = False
+
+        if when and all_none:
+            return None
+
+        return False
+
 
 class WhenRules(object):
     def __init__(self, rules, then):
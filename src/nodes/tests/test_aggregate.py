@@ -0,0 +1,63 @@
+import graph
+
+
+def dedent(c):
+    return '\n'.join(c.strip() for c in c.splitlines())
+
+
+execute = graph.execute
+
+
+def build(code):
+    return graph.build(dedent(code))
+
+
+def test_windowed_aggregates(monkeypatch, aggregate_store):
+    now = [1000000.0]
+    monkeypatch.setattr(aggregate_store, 'clock', lambda: now[0])
+
+    graph = build('''
+        User = Entity('User', JsonData('$.user'))
+        Amount = JsonData('$.amount')
+        PaidPerHour = Sum(by=User, of=Amount, per=Interval.Hours(1))
+        AveragePaymentPerHour = Avg(by=User, of=Amount, per=Interval.Hours(1))
+        LargestPaymentPerHour = Max(by=User, of=Amount, per=Interval.Hours(1))
+        PaidALot = PaidPerHour > 100
+    ''')
+
+    def run(data):
+        data = execute(graph, data).data
+        return tuple(data[name] for name in (
+            'PaidPerHour', 'AveragePaymentPerHour', 'LargestPaymentPerHour', 'PaidALot'
+        ))
+
+    assert run({'user': 1}) == (0, None, None, False)
+    assert run({'user': 1, 'amount': 10}) == (10, 10, 10, False)
+    assert run({'user': 1, 'amount': 50.5}) == (60.5, 30.25, 50.5, False)
+    assert run({'user': 2, 'amount': -5}) == (-5, -5, -5, False)
+    assert run({'user': 1, 'amount': 'lots'}) == (60.5, 30.25, 50.5, False)
+    assert run({'user': 1, 'amount': True}) == (60.5, 30.25, 50.5, False)
+
+    now[0] += 1800
+    assert run({'user': 1, 'amount': 60}) == (120.5, 40.166666666666664, 60, True)
+    assert run({'amount': 60}) == (None, None, None, False)
+
+    # The first two payments fall out of the window, and so do the aggregates of the second user.
+    now[0] += 1800
+    assert run({'user': 1, 'amount': 1}) == (61, 30.5, 60, False)
+    assert len(aggregate_store) == 3
+
+
+def test_anonymous_aggregate_names():
+    code = '''
+        User = Entity('User', JsonData('$.user'))
+        PaidALot = Rule(when=[Sum(by=User, of=JsonData('$.%s'), per=Interval.Hours(1)) > 100], reason='paid')
+    '''
+
+    def run(field, amount):
+        return execute(build(code % field), {'user': 1, field: amount}).data['PaidALot']
+
+    # Building the same rules again keeps adding up the same sum, while another sum keeps its own.
+    assert run('amount', 60) == False
+    assert run('amount', 60) == True
+    assert run('fee', 60) == False
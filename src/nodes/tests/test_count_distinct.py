@@ -0,0 +1,83 @@
+import graph
+
+
+def dedent(c):
+    return '\n'.join(c.strip() for c in c.splitlines())
+
+
+execute = graph.execute
+
+
+def build(code):
+    return graph.build(dedent(code))
+
+
+def test_count_distinct(monkeypatch, count_distinct_store):
+    now = [1000000.0]
+    monkeypatch.setattr(count_distinct_store, 'clock', lambda: now[0])
+
+    graph = build('''
+        Ip = Entity('Ip', JsonData('$.ip'))
+        Email = Entity('Email', JsonData('$.email'))
+        EmailsPerIp = CountDistinct(by=Ip, of=Email, per=Interval.Days(1))
+        IsAccountFarm = EmailsPerIp > 2
+    ''')
+
+    def run(data):
+        data = execute(graph, data).data
+        return data['EmailsPerIp'], data['IsAccountFarm']
+
+    assert run({'ip': '10.0.0.1', 'email': 'a@jh.gg'}) == (1, False)
+    assert run({'ip': '10.0.0.1', 'email': 'a@jh.gg'}) == (1, False)
+    assert run({'ip': '10.0.0.1', 'email': 'b@jh.gg'}) == (2, False)
+    assert run({'ip': '10.0.0.1'}) == (2, False)
+    assert run({'ip': '10.0.0.2', 'email': 'c@jh.gg'}) == (1, False)
+    assert run({'ip': '10.0.0.1', 'email': 'c@jh.gg'}) == (3, True)
+    assert run({'email': 'c@jh.gg'}) == (None, False)
+
+    now[0] += 86400
+    assert run({'ip': '10.0.0.1', 'email': 'c@jh.gg'}) == (1, False)
+
+
+def test_count_distinct_unhashable_values():
+    graph = build('''
+        User = Entity('User', JsonData('$.user'))
+        Devices = CountDistinct(by=User, of=JsonData('$.device'), per=Interval.Days(1))
+    ''')
+
+    devices = [{'os': 'ios'}, {'os': 'ios'}, ['android'], {'os': 'android'}, 'android']
+    assert [execute(graph, {'user': 1, 'device': device}).data['Devices'] for device in devices] == [
+        1, 1, 2, 3, 4]
+
+
+def test_count_distinct_window_changed():
+    code = '''
+        User = Entity('User', JsonData('$.user'))
+        Emails = CountDistinct(by=User, of=JsonData('$.email'), per=Interval.%s)
+    '''
+
+    for email in ('a', 'b', 'c'):
+        execute(build(code % 'Days(1)'), {'user': 1, 'email': email})
+
+    # The same node, counting over another window, does not pick up the other window's sketch.
+    assert execute(build(code % 'Hours(1)'), {'user': 1, 'email': 'a'}).data['Emails'] == 1
+    assert execute(build(code % 'Days(1)'), {'user': 1, 'email': 'a'}).data['Emails'] == 3
+
+
+def test_anonymous_count_distinct_names():
+    code = '''
+        User = Entity('User', JsonData('$.user'))
+        ManyEmails = Rule(
+            when=[CountDistinct(by=User, of=JsonData('$.%s'), per=Interval.Days(1)) > 1],
+            reason='emails'
+        )
+    '''
+
+    def run(field, value):
+        return execute(build(code % field), {'user': 1, field: value}).data['ManyEmails']
+
+    # Building the same rules again keeps counting in the same sketch, while another count keeps
+    # its own.
+    assert run('email', 'a') == False
+    assert run('email', 'b') == True
+    assert run('phone', 'c') == False
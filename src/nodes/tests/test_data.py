@@ -45,3 +45,49 @@ def test_data_extraction():
         'T2': True,
         'T3': True,
     }
+
+
+def test_simple_paths():
+    from nodes.data import JsonData
+    from literals import Literal
+
+    def path(selector):
+        return JsonData(Literal.String(selector)).path
+
+    assert path('$') == ()
+    assert path('$.a') == ('a',)
+    assert path('$.a.b.c') == ('a', 'b', 'c')
+    assert path('a.b') == ('a', 'b')
+    assert path('$."a.b"') == ('a.b',)
+    assert path('$.a[0]') is None
+    assert path('$.*') is None
+    assert path('$..a') is None
+    assert path('$.a,b') is None
+
+
+def test_json_extractor_matches_jsonpath():
+    from nodes.data import JsonData, JsonExtractor
+    from literals import Literal
+
+    selectors = [
+        '$', '$.a', '$.a.b', '$.a.b.c', '$.a.c', '$.b', '$.b[0]', '$.b[1].x', '$.s.x', '$.n.x',
+        '$.l.x', 'a.b',
+    ]
+    nodes = [JsonData(Literal.String(selector)) for selector in selectors]
+    extractor = JsonExtractor(nodes)
+
+    for data in [
+        {},
+        {'a': {'b': {'c': 1}, 'c': None}, 'b': [{'x': 1}, {'x': 2}], 's': 'str', 'n': None, 'l': [1]},
+        {'a': 5, 'b': 'not a list'},
+        {'a': {'b': 'str'}},
+        [1, 2, 3],
+        'str',
+    ]:
+        expected = []
+        for node in nodes:
+            found = node.selector.find(data)
+            expected.append(found[0].value if found else None)
+
+        assert extractor.extract(data) == expected
+        assert [node.resolve(data) for node in nodes] == expected
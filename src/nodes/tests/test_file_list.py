@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+import graph
+from nodes import file_list
+from nodes.file_list import MemberSet, SortedMemberFile, load_file_list, reload_file_lists
+
+
+def dedent(c):
+    return '\n'.join(c.strip() for c in c.splitlines())
+
+
+execute = graph.execute
+
+
+def build(code):
+    return graph.build(dedent(code))
+
+
+@pytest.fixture(autouse=True)
+def file_lists(monkeypatch):
+    monkeypatch.setattr(file_list, '_file_lists', {})
+
+
+def write_list(tmpdir, name, lines):
+    path = str(tmpdir.join(name))
+    with open(path, 'wb') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    return path
+
+
+CODE = '''
+    Domain = Entity('Domain', JsonData('$.domain'))
+    Ip = JsonData('$.ip')
+    DomainDenied = Domain.in_(FileList('%(domains)s'))
+    IpDenied = FileList('%(ips)s', sorted=True).contains(Ip)
+'''
+
+
+def test_file_list(tmpdir):
+    domains = write_list(tmpdir, 'domains.txt', [
+        '# Disposable e-mail domains', '', 'mailinator.com', u'\xe9xample.com'.encode('utf-8')
+    ])
+    ips = write_list(tmpdir, 'ips.txt', sorted('10.0.0.%d' % i for i in xrange(1, 100)))
+    plan = build(CODE % {'domains': domains, 'ips': ips})
+
+    def run(data):
+        data = execute(plan, data).data
+        return data['DomainDenied'], data['IpDenied']
+
+    assert run({'domain': 'mailinator.com', 'ip': '10.0.0.1'}) == (True, True)
+    assert run({'domain': u'\xe9xample.com', 'ip': '10.0.0.99'}) == (True, True)
+    assert run({'domain': '# Disposable e-mail domains', 'ip': '10.0.0.100'}) == (False, False)
+    assert run({'domain': 'jh.gg', 'ip': '10.0.0.0'}) == (False, False)
+    assert run({}) == (False, False)
+
+
+def test_sorted_file_list_lookups(tmpdir):
+    members = sorted(str(i) for i in xrange(0, 2000, 2))
+    member_file = SortedMemberFile(write_list(tmpdir, 'members.txt', members))
+
+    for i in xrange(-1, 2001):
+        assert (i in member_file) == (str(i) in members)
+
+    assert '' not in member_file
+    assert None not in member_file
+    assert 'x' not in SortedMemberFile(str(tmpdir.join('empty.txt').ensure()))
+
+
+def test_file_lists_are_shared_and_reloadable(tmpdir):
+    domains = write_list(tmpdir, 'domains.txt', ['mailinator.com'])
+    ips = write_list(tmpdir, 'ips.txt', ['10.0.0.1'])
+    plans = [build(CODE % {'domains': domains, 'ips': ips}) for _ in xrange(2)]
+
+    assert load_file_list(domains) is load_file_list(os.path.join(str(tmpdir), '.', 'domains.txt'))
+    assert isinstance(load_file_list(domains), MemberSet)
+    assert reload_file_lists() == []
+
+    data = {'domain': 'jh.gg', 'ip': '10.0.0.2'}
+    assert execute(plans[0], data).data['DomainDenied'] == False
+
+    write_list(tmpdir, 'domains.txt', ['mailinator.com', 'jh.gg'])
+    write_list(tmpdir, 'ips.txt', ['10.0.0.1', '10.0.0.2'])
+    assert len(reload_file_lists()) == 2
+
+    for plan in plans:
+        result = execute(plan, data).data
+        assert result['DomainDenied'] == result['IpDenied'] == True
+
+
+def test_missing_file_list(tmpdir):
+    with pytest.raises(OSError):
+        build("A = FileList('%s')" % tmpdir.join('missing.txt'))
+
+
+def test_sorted_file_list_rewritten_in_place(tmpdir):
+    path = write_list(tmpdir, 'ips.txt', ['10.0.0.1 ', '10.0.0.3'])
+    member_file = SortedMemberFile(path)
+    assert '10.0.0.1' in member_file
+    assert not member_file.rewritten
+
+    # Replaced by a rename: the old map stays valid until the new file is mapped.
+    os.rename(write_list(tmpdir, 'ips.txt.new', ['10.0.0.2', '10.0.0.3']), path)
+    assert member_file.reload()
+    assert ('10.0.0.1' in member_file, '10.0.0.2' in member_file) == (False, True)
+    assert not member_file.rewritten
+
+    # Rewritten in place: the file is read into memory rather than mapped.
+    write_list(tmpdir, 'ips.txt', ['10.0.0.1', '10.0.0.4\r'])
+    assert member_file.reload()
+    assert member_file.rewritten
+    assert isinstance(member_file._data, str)
+    assert ('10.0.0.1' in member_file, '10.0.0.2' in member_file, '10.0.0.4' in member_file) == (
+        True, False, True)
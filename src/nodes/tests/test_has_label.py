@@ -0,0 +1,122 @@
+import graph
+from stores.labels import CachingLabelStore, DictLabelStore
+
+
+def dedent(c):
+    return '\n'.join(c.strip() for c in c.splitlines())
+
+
+execute = graph.execute
+
+
+def build(code):
+    return graph.build(dedent(code))
+
+
+class CountingLabelStore(DictLabelStore):
+    def __init__(self, labels):
+        super(CountingLabelStore, self).__init__(labels)
+        self.lookups = []
+
+    def get_many(self, entity_paths):
+        self.lookups.append(sorted(entity_paths))
+        return super(CountingLabelStore, self).get_many(entity_paths)
+
+
+CODE = '''
+    User = Entity('User', JsonData('$.user'))
+    Ip = Entity('Ip', JsonData('$.ip'))
+    IsPost = JsonData('$.action') == 'post'
+    UserBanned = HasLabel.Added(User, 'banned')
+    UserUnbanned = HasLabel.Removed(User, 'banned')
+    IpBanned = HasLabel.Added(Ip, 'banned')
+    BannedPost = Rule(when=[IsPost & UserBanned, IsPost & HasLabel.Added(Ip, 'banned')], reason='Banned')
+'''
+
+LABELS = {
+    u'User/1': {'banned': 'ADDED'},
+    u'User/2': {'banned': 'REMOVED'},
+    u'Ip/10.0.0.1': {'banned': 'ADDED'},
+}
+
+
+def test_has_label(monkeypatch):
+    store = CountingLabelStore(LABELS)
+    monkeypatch.setattr('stores.labels.store', store)
+    plan = build(CODE)
+
+    def run(data):
+        data = execute(plan, data).data
+        return tuple(data[name] for name in ('UserBanned', 'UserUnbanned', 'IpBanned', 'BannedPost'))
+
+    assert run({'user': 1, 'ip': '10.0.0.2', 'action': 'post'}) == (True, False, False, True)
+    assert run({'user': 2, 'ip': '10.0.0.1', 'action': 'post'}) == (False, True, True, True)
+    assert run({'user': 3, 'ip': '10.0.0.2', 'action': 'view'}) == (False, False, False, False)
+    assert run({'ip': '10.0.0.1'}) == (None, None, True, False)
+
+    # The labels of every entity are looked up at once.
+    assert store.lookups == [
+        [u'Ip/10.0.0.2', u'User/1'],
+        [u'Ip/10.0.0.1', u'User/2'],
+        [u'Ip/10.0.0.2', u'User/3'],
+        [u'Ip/10.0.0.1'],
+    ]
+
+
+def test_has_label_lookup_is_skipped(monkeypatch):
+    store = CountingLabelStore(LABELS)
+    monkeypatch.setattr('stores.labels.store', store)
+    plan = build(CODE)
+
+    def run(data, outputs):
+        return execute(plan, data, outputs=outputs, actions=False).data
+
+    # The labels are not looked up for outputs that do not check any, or if the rule
+    # short-circuits before any of its labels are checked.
+    assert run({'user': 1, 'action': 'post'}, ['IsPost']) == {'IsPost': True}
+    assert run({'user': 1, 'action': 'view'}, ['BannedPost']) == {'BannedPost': False}
+    assert store.lookups == []
+
+    assert run({'user': 1, 'ip': '10.0.0.2', 'action': 'post'}, ['BannedPost']) == {'BannedPost': True}
+    assert store.lookups == [[u'Ip/10.0.0.2', u'User/1']]
+
+
+def test_has_label_lookups_are_batched(monkeypatch):
+    store = CountingLabelStore(LABELS)
+    monkeypatch.setattr('stores.labels.store', store)
+    plan = build(CODE)
+
+    events = [
+        {'user': 1, 'action': 'post'},
+        {'user': 2, 'ip': '10.0.0.1', 'action': 'view'},
+        {},
+    ]
+    results = graph.execute_many(plan, events)
+
+    assert [result.data['BannedPost'] for result in results] == [True, False, False]
+    assert [result.data['IpBanned'] for result in results] == [None, True, None]
+    assert store.lookups == [[u'Ip/10.0.0.1', u'User/1', u'User/2']]
+
+
+def test_caching_label_store():
+    now = [0]
+    backing_store = CountingLabelStore(LABELS)
+    store = CachingLabelStore(backing_store, max_size=2, ttl=10, clock=lambda: now[0])
+
+    assert store.get_many([u'User/1', u'User/3']) == {u'User/1': {'banned': 'ADDED'}}
+    assert store.get_many([u'User/1', u'User/3']) == {u'User/1': {'banned': 'ADDED'}}
+    assert store.get_many([u'User/1', u'User/2']) == {
+        u'User/1': {'banned': 'ADDED'},
+        u'User/2': {'banned': 'REMOVED'},
+    }
+    assert backing_store.lookups == [[u'User/1', u'User/3'], [u'User/2']]
+    assert (store.cache.hits, store.cache.misses) == (3, 3)
+
+    # User/3 was evicted, as the least recently used.
+    store.get_many([u'User/3'])
+    assert backing_store.lookups[-1] == [u'User/3']
+
+    now[0] += 10
+    store.invalidate([u'User/2'])
+    store.get_many([u'User/1', u'User/2'])
+    assert backing_store.lookups[-1] == [u'User/1', u'User/2']
@@ -1,4 +1,6 @@
 import graph
+from nodes.rate_limit import RateLimit
+from plan import unwrap
 
 
 def dedent(c):
@@ -29,3 +31,152 @@ def test_rate_limit_basic():
 
     b = execute(graph, {}).data
     assert b['RateLimitSimple'] == True
+
+
+def test_rate_limit_window(monkeypatch, rate_limit_store):
+    now = [1000000.0]
+    monkeypatch.setattr(rate_limit_store, 'clock', lambda: now[0])
+
+    graph = build('''
+        User = Entity('User', JsonData('$.user'))
+        IsPost = JsonData('$.action') == 'post'
+
+        PostsPerMinute = RateLimit(
+            by=User,
+            max=1,
+            per=Interval.Minutes(1),
+            where=[IsPost]
+        )
+    ''')
+
+    def run(data):
+        return execute(graph, data).data['PostsPerMinute']
+
+    assert run({'user': 1, 'action': 'post'}) == False
+    assert run({'user': 1, 'action': 'view'}) == False
+    assert run({'user': 1, 'action': 'post'}) == True
+    assert run({'user': 2, 'action': 'post'}) == False
+    assert run({'action': 'post'}) == None
+
+    now[0] += 60
+    assert run({'user': 1, 'action': 'post'}) == False
+
+
+def test_rate_limit_counters_are_shared_by_name():
+    code = '''
+        User = Entity('User', 1)
+        A = RateLimit(by=User, max=1, per=Interval.Minutes(1))
+        B = RateLimit(by=User, max=1, per=Interval.Minutes(1), where=[JsonData('$.b') == None])
+    '''
+
+    assert execute(build(code), {}, outputs=['A']).data['A'] == False
+    data = execute(build(code), {}).data
+    assert (data['A'], data['B']) == (True, False)
+
+
+def test_rate_limits_share_counters(rate_limit_store):
+    graph = build('''
+        User = Entity('User', JsonData('$.user'))
+        IsPost = JsonData('$.action') == 'post'
+        PostsPerMinute = RateLimit(by=User, max=1, per=Interval.Minutes(1), where=[IsPost])
+        PostsPerHour = RateLimit(by=User, max=2, per=Interval.Hours(1), where=[IsPost])
+        PostsPerDay = RateLimit(by=User, max=3, per=Interval.Days(1), where=[IsPost])
+        SameUser = Entity('User', JsonData('$.user'))
+        SamePostsPerDay = RateLimit(by=SameUser, max=4, per=Interval.Days(1), where=[IsPost])
+        IsLogin = JsonData('$.action') == 'login'
+        Logins = RateLimit(by=User, max=1, per=Interval.Days(1), where=[IsLogin])
+    ''')
+
+    counters = set(
+        graph.nodes[step.arg_slots[0]] for step in graph.steps
+        if isinstance(unwrap(step.node), RateLimit)
+    )
+    assert sorted(counter.name for counter in counters) == ['User[IsLogin]', 'User[IsPost]']
+
+    results = []
+    for _ in xrange(5):
+        data = execute(graph, {'user': 1, 'action': 'post'}).data
+        results.append([
+            data[name] for name in ('PostsPerMinute', 'PostsPerHour', 'PostsPerDay', 'SamePostsPerDay', 'Logins')
+        ])
+
+    assert results == [
+        [False, False, False, False, False],
+        [True, False, False, False, False],
+        [True, True, False, False, False],
+        [True, True, True, False, False],
+        [True, True, True, True, False],
+    ]
+
+    # One key holds the counts of every window.
+    assert len(rate_limit_store) == 1
+
+
+def test_approximate_rate_limit(rate_limit_store):
+    graph = build('''
+        Ip = Entity('Ip', JsonData('$.ip'))
+        Exact = RateLimit(by=Ip, max=3, per=Interval.Hours(1))
+        Approximate = RateLimit(by=Ip, max=3, per=Interval.Hours(1), approx=True)
+    ''')
+
+    results = []
+    for i in xrange(5):
+        data = execute(graph, {'ip': '10.0.0.1'}).data
+        results.append((data['Exact'], data['Approximate']))
+        execute(graph, {'ip': '10.0.1.%d' % i})
+
+    assert results == [(False, False)] * 3 + [(True, True)] * 2
+    # The approximate counts are not kept per key.
+    assert len(rate_limit_store) == 6
+
+
+def test_anonymous_rate_limit_names():
+    code = '''
+        User = JsonData('$.user')
+        Limited = Rule(
+            when=[RateLimit(by=Entity('User', User), max=%d, per=Interval.Minutes(1))],
+            reason='limited'
+        )
+    '''
+
+    def get_counter_names(graph):
+        return [
+            graph.nodes[step.arg_slots[0]].name for step in graph.steps
+            if isinstance(unwrap(step.node), RateLimit)
+        ]
+
+    # Building the same rules again keeps counting the same events, while a different limit
+    # counts its own.
+    names = get_counter_names(build(code % 1))
+    assert names == get_counter_names(build(code % 1))
+    assert names != get_counter_names(build(code % 2))
+
+    assert execute(build(code % 1), {'user': 1}).data['Limited'] == False
+    assert execute(build(code % 1), {'user': 1}).data['Limited'] == True
+    assert execute(build(code % 2), {'user': 1}).data['Limited'] == False
+
+
+def test_rate_limits_share_counters_where_labels(label_store, rate_limit_store):
+    label_store.labels.update({u'User/1': {'trusted': 'ADDED'}, u'Ip/10.0.0.1': {'banned': 'ADDED'}})
+    graph = build('''
+        User = Entity('User', JsonData('$.user'))
+        IpBanned = HasLabel.Added(Entity('Ip', JsonData('$.ip')), 'banned')
+        PerMinute = RateLimit(by=User, max=1, per=Interval.Minutes(1),
+            where=[HasLabel.Added(User, 'trusted')])
+        PerHour = RateLimit(by=User, max=2, per=Interval.Hours(1),
+            where=[HasLabel.Added(User, 'trusted')])
+    ''')
+
+    counters = set(
+        graph.nodes[step.arg_slots[0]] for step in graph.steps
+        if isinstance(unwrap(step.node), RateLimit)
+    )
+    assert len(counters) == 1
+
+    results = []
+    for user in (1, 1, 2, 1):
+        data = execute(graph, {'user': user, 'ip': '10.0.0.1'}).data
+        results.append((data['PerMinute'], data['PerHour'], data['IpBanned']))
+
+    assert results == [(False, False, True), (True, False, True), (False, False, True), (True, True, True)]
+    assert len(rate_limit_store) == 1
@@ -0,0 +1,677 @@
+from collections import namedtuple
+
+from cache import LRUCache, MISSING
+from nodes.data import Data, JsonData, JsonExtractor
+from nodes.rule import WhenRules
+from node import NamedNode
+
+# The magic `Data` node is always numbered first, so the executor can seed it without a lookup.
+DATA_SLOT = 0
+
+# Marks the value of a deferred slot which has not been resolved (yet).
+UNRESOLVED = object()
+
+# A single unit of work within a plan: resolve the node numbered `slot` by calling `resolve`
+# with the values found in `arg_slots`, or, if the node is resolved lazily, by calling
+# `resolve_lazy` with the `Operands` found in `arg_slots`.
+Step = namedtuple('Step', ['slot', 'node', 'resolve', 'arg_slots', 'resolve_lazy'])
+
+
+def topological_order(nodes):
+    """
+    Orders the given nodes (and everything they transitively depend on) such that every node
+    comes after all of its dependencies.
+
+    This is done iteratively rather than recursively, so that arbitrarily deep dependency
+    chains do not run into Python's recursion limit, and each node is expanded exactly once,
+    so shared subgraphs are not re-traversed once per path that reaches them.
+
+    Raises a `RuntimeError` if the nodes contain a dependency cycle.
+    """
+    ordered = []
+    visited = set()
+    # The nodes on the current path of the traversal, encountering one of these again means
+    # that we have found a cycle.
+    in_progress = set()
+
+    for root in nodes:
+        if root in visited:
+            continue
+
+        visited.add(root)
+        in_progress.add(root)
+        stack = [(root, iter(root.get_dependent_nodes()))]
+        while stack:
+            node, dependencies = stack[-1]
+            for dependency in dependencies:
+                if dependency in in_progress:
+                    raise RuntimeError('Dependency cycle detected: %r' % (
+                        [n for n, _ in stack] + [dependency],
+                    ))
+
+                if dependency not in visited:
+                    visited.add(dependency)
+                    in_progress.add(dependency)
+                    stack.append((dependency, iter(dependency.get_dependent_nodes())))
+                    break
+            else:
+                stack.pop()
+                in_progress.discard(node)
+                ordered.append(node)
+
+    return ordered
+
+
+def unwrap(node):
+    """
+    Returns the node wrapped by `node`, if it is a named node, otherwise `node` itself.
+    """
+    if isinstance(node, NamedNode):
+        return node.node
+
+    return node
+
+
+def is_json_data(node):
+    return isinstance(unwrap(node), JsonData)
+
+
+def is_pure(node):
+    return getattr(unwrap(node), 'pure', False)
+
+
+def is_blocking(node):
+    return getattr(unwrap(node), 'blocking', False)
+
+
+def is_async(node):
+    """
+    Whether `node` is resolved asynchronously by `execute_async`, that is if it implements
+    `resolve_async`, or is `blocking`.
+    """
+    return getattr(unwrap(node), 'resolve_async', None) is not None or is_blocking(node)
+
+
+def is_memoized(node):
+    return is_pure(node) and bool(getattr(unwrap(node), 'memoize', None))
+
+
+def get_resolver(node):
+    """
+    Returns the callable used to resolve `node`. Named nodes are unwrapped so that the
+    executor does not pay for the extra delegation on every event.
+    """
+    if is_memoized(node):
+        return memoize_resolver(unwrap(node))
+
+    if type(node) is NamedNode:
+        return node.node.resolve
+
+    return node.resolve
+
+
+def get_batch_resolver(node):
+    """
+    Returns the `resolve_many` that `execute_many` resolves `node` with, or None if it must be
+    resolved one event at a time: if it is memoized, or if its `resolve` is overridden by a
+    subclass of the class that implements its `resolve_many`, which would then resolve it with
+    the semantics of the parent class.
+    """
+    node = unwrap(node)
+    resolve_many = getattr(node, 'resolve_many', None)
+    if resolve_many is None or is_memoized(node):
+        return None
+
+    # A `resolve` set on the node itself (e.g. the comparitor of a `CmpNode`) is set up by the
+    # class that implements `resolve_many`.
+    if 'resolve' in getattr(node, '__dict__', ()):
+        return resolve_many
+
+    mro = type(node).__mro__
+    defined_by = dict(
+        (name, next(index for index, cls in enumerate(mro) if name in vars(cls)))
+        for name in ('resolve', 'resolve_many')
+    )
+    if defined_by['resolve_many'] > defined_by['resolve']:
+        return None
+
+    return resolve_many
+
+
+def get_resolve_cache(node):
+    """
+    Returns the `LRUCache` that the resolved values of `node` are memoized in, creating it if
+    needed, see `BaseNode.memoize`.
+    """
+    node = unwrap(node)
+    cache = node.__dict__.get('_resolve_cache')
+    if cache is None:
+        cache = node._resolve_cache = LRUCache(node.memoize)
+
+    return cache
+
+
+def memoize_resolver(node):
+    """
+    Returns a callable that resolves `node`, serving the values it was already resolved with from
+    its cache, see `get_resolve_cache`.
+    """
+    resolve = node.resolve
+    cache = get_resolve_cache(node)
+
+    def memoized_resolve(*args):
+        # Equal values of different types (e.g. 1 and True) may not resolve the same.
+        key = (args, tuple(type(arg) for arg in args))
+        try:
+            value = cache.get(key)
+        except TypeError:
+            # Some of the values are not hashable, e.g. lists.
+            return resolve(*args)
+
+        if value is MISSING:
+            value = resolve(*args)
+            cache.put(key, value)
+
+        return value
+
+    return memoized_resolve
+
+
+class ExecutionPlan(object):
+    """
+    An immutable, flattened form of a dependency graph.
+
+    Every node is numbered once, in topological order, and the slots holding the arguments of each
+    node are precomputed, so that executing the plan is a single pass over `eager_steps`, filling
+    in a preallocated list of values, rather than a recursive walk over the graph for each event.
+
+    Nodes that are only ever needed as operands of nodes that implement `resolve_lazy` are
+    deferred: they are not part of `eager_steps`, and are only resolved (see `force`) if the lazy
+    node asks for them.
+    """
+
+    def __init__(self, dependency_graph, outputs=None, actions=True):
+        """
+        Compiles the plan for `dependency_graph`, resolving the named nodes in `outputs` (or all
+        of them, if None), and the actions of the `WhenRules` nodes, if `actions`. Anything that
+        is not needed for those is left out of the plan.
+        """
+        if outputs is not None:
+            outputs = tuple(outputs)
+        # What the plan was selected for, see `select`.
+        selection = (outputs, actions)
+
+        all_nodes = topological_order(dependency_graph)
+        named_nodes = dict(
+            (node.name, node) for node in all_nodes
+            if isinstance(node, NamedNode)
+        )
+
+        if outputs is None:
+            outputs = [node.name for node in all_nodes if isinstance(node, NamedNode)]
+        else:
+            outputs = list(outputs)
+            for name in outputs:
+                if name not in named_nodes:
+                    raise KeyError('Unknown output %r' % name)
+
+        roots = [named_nodes[name] for name in outputs]
+        if actions:
+            roots.extend(node for node in all_nodes if isinstance(node, WhenRules))
+
+        # Structurally identical nodes are only resolved once: each is numbered with the slot of
+        # the first of them, and only that one gets a step.
+        selected = topological_order(roots)
+        canonical = find_canonical_nodes(selected)
+
+        nodes = [Data]
+        nodes.extend(
+            node for node in selected
+            if node is not Data and canonical[node] is node
+        )
+
+        slots, arg_slots = number_nodes(nodes, selected, canonical)
+
+        # Pure nodes that do not depend on `Data`, even indirectly, resolve to the same value for
+        # every event, so they are resolved once, now, rather than by a step.
+        constants = fold_constants(
+            Step(slot, node, get_resolver(node), arg_slots[slot], None)
+            for slot, node in enumerate(nodes) if slot != DATA_SLOT
+        )
+
+        # Once folded, the constants that only other constants depend on (e.g. the members of a
+        # literal list) are not needed anymore, and are left out of the plan, so that they do not
+        # take up a slot each, to be copied for every event. The nodes are numbered again without
+        # them, and the remaining constants no longer have dependencies.
+        roots = set(slots[named_nodes[name]] for name in outputs)
+        roots.update(slot for slot, node in enumerate(nodes) if isinstance(node, WhenRules))
+        folded = find_folded_slots(constants, arg_slots, roots)
+        if folded:
+            values = dict((nodes[slot], value) for slot, value in constants.iteritems() if slot not in folded)
+            nodes = [node for slot, node in enumerate(nodes) if slot not in folded]
+            slots, arg_slots = number_nodes(nodes, selected, canonical, values)
+            constants = dict((slots[node], value) for node, value in values.iteritems())
+
+        outputs = tuple((name, slots[named_nodes[name]]) for name in outputs)
+        action_slots = [
+            slot for slot, node in enumerate(nodes)
+            if isinstance(node, WhenRules)
+        ]
+
+        roots = [slot for _, slot in outputs] + action_slots
+        demanded, lazy = find_demanded_slots(nodes, arg_slots, roots)
+
+        steps = []
+        for slot, node in enumerate(nodes):
+            if slot == DATA_SLOT:
+                continue
+
+            steps.append(Step(
+                slot=slot,
+                node=node,
+                resolve=get_resolver(node),
+                arg_slots=arg_slots[slot],
+                resolve_lazy=node.resolve_lazy if lazy[slot] else None,
+            ))
+
+        # Every `JsonData` node is extracted from the data at once, before any step runs, rather
+        # than being resolved by steps of its own.
+        extracted = [step for step in steps if is_json_data(step.node)]
+        self.json_extractor = JsonExtractor([step.node for step in extracted])
+        self.extracted_slots = tuple(step.slot for step in extracted)
+
+        self.constant_slots = tuple(sorted(constants))
+
+        # The slots which are resolved before any step runs.
+        sources = set((DATA_SLOT,) + self.extracted_slots + self.constant_slots)
+        for slot in sources:
+            demanded[slot] = True
+
+        self.nodes = tuple(nodes)
+        # The number of nodes which were merged into a structurally identical node.
+        self.deduplicated = sum(1 for node in selected if canonical[node] is not node)
+        self.steps = tuple(steps)
+        self.eager_steps = tuple(
+            step for step in steps
+            if demanded[step.slot] and step.slot not in sources
+        )
+        # Whether any of the eager steps are resolved on a thread pool, see `BaseNode.blocking`.
+        self.blocking = any(
+            is_blocking(step.node) and step.resolve_lazy is None
+            for step in self.eager_steps
+        )
+        self.outputs = outputs
+        self.action_slots = tuple(action_slots)
+        # The values every execution starts with: the constants, None for the slots that are
+        # always resolved, and `UNRESOLVED` for the deferred ones. Note that the values of
+        # constants are shared between executions, and must not be mutated.
+        self.initial_values = tuple(
+            constants[slot] if slot in constants else
+            None if demanded[slot] else
+            UNRESOLVED
+            for slot in xrange(len(nodes))
+        )
+        # For each deferred slot that a lazy node may ask for, the slots that must be resolved
+        # (in order) to resolve it.
+        self.closures = find_closures(steps, demanded)
+        # For each slot, the slots of the eager nodes that must wait for it to resolve before they
+        # can resolve, and for each slot the number of slots it has to wait on. This is what
+        # an executor resolving nodes out of order needs, see `PlanExecution`.
+        self.dependents, self.waiting_on = find_dependents(steps, demanded, sources)
+        self.dependency_graph = dependency_graph
+        self._slots = slots
+        self._selection = selection
+        self._selections = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __repr__(self):
+        return '<ExecutionPlan nodes=%d, outputs=%d, actions=%d>' % (
+            len(self.nodes),
+            len(self.outputs),
+            len(self.action_slots),
+        )
+
+    def select(self, outputs=None, actions=True):
+        """
+        Returns the plan that only resolves what is needed for the named nodes in `outputs`, and
+        the actions of the `WhenRules` nodes, if `actions`. For example, `plan.select([])` will
+        only resolve what is needed to compute actions.
+
+        The selected plan is compiled once, and reused by subsequent calls. Selecting what a plan
+        was selected for returns the plan itself, so that a selected plan (e.g. the plan of the
+        workers of a `WorkerPool`) can be executed with the same `outputs` and `actions`, without
+        being compiled again.
+        """
+        key = (None if outputs is None else tuple(outputs), actions)
+        if key == (None, True) or key == self._selection:
+            return self
+
+        plan = self._selections.get(key)
+        if plan is None:
+            plan = ExecutionPlan(self.dependency_graph, outputs, actions)
+            self._selections[key] = plan
+
+        return plan
+
+    def step_of(self, slot):
+        """
+        Returns the step that resolves the node numbered `slot`.
+        """
+        # Every slot but the `Data` slot has a step, and they are stored in slot order.
+        return self.steps[slot - 1]
+
+    def slot_of(self, node):
+        """
+        Returns the slot number that `node` was assigned in this plan.
+        """
+        return self._slots[node]
+
+
+def get_structural_key(node, canonical):
+    """
+    Returns a key identifying the computation `node` performs, such that nodes with equal keys
+    always resolve to the same value, or None if the node must not be merged with others (see
+    `BaseNode.get_literal_args`). Named nodes have the key of the node they wrap, their name only
+    matters to the output of the execution.
+
+    `canonical` must map every dependency of the node to its canonical node.
+    """
+    inner = unwrap(node)
+    get_literal_args = getattr(inner, 'get_literal_args', None)
+    literal_args = get_literal_args() if get_literal_args else None
+    if literal_args is None:
+        return None
+
+    return (
+        type(inner),
+        literal_args,
+        tuple(id(canonical[dep]) for dep in node.get_dependent_nodes()),
+    )
+
+
+def find_canonical_nodes(nodes):
+    """
+    Given nodes in topological order, maps each node to the first of the nodes that is
+    structurally identical to it (which is, more often than not, itself).
+    """
+    canonical = {}
+    by_key = {}
+
+    for node in nodes:
+        key = get_structural_key(node, canonical)
+        if key is None:
+            canonical[node] = node
+        else:
+            canonical[node] = by_key.setdefault(key, node)
+
+    return canonical
+
+
+def number_nodes(nodes, selected, canonical, constants=()):
+    """
+    Numbers `nodes` (in topological order) with their slot, returning a dict of every selected
+    node to the slot of its canonical node, and the slots of the dependencies of each node, but
+    for the `constants`, which are not resolved by the plan.
+    """
+    slots = {}
+    for slot, node in enumerate(nodes):
+        slots[node] = slot
+
+    for node in selected:
+        if canonical[node] in slots:
+            slots[node] = slots[canonical[node]]
+
+    arg_slots = [()]
+    for node in nodes[DATA_SLOT + 1:]:
+        if node in constants:
+            arg_slots.append(())
+        else:
+            arg_slots.append(tuple(slots[dep] for dep in node.get_dependent_nodes()))
+
+    return slots, arg_slots
+
+
+def find_folded_slots(constants, arg_slots, roots):
+    """
+    Finds the slots of the constants that are only needed to fold other constants: those that
+    are not among the `roots`, and have no dependents that are not constants.
+    """
+    needed = set(roots)
+    for slot, args in enumerate(arg_slots):
+        if slot not in constants:
+            needed.update(args)
+
+    return set(slot for slot in constants if slot not in needed)
+
+
+def fold_constants(steps):
+    """
+    Resolves the pure nodes that (transitively) depend on nothing but other pure nodes, returning
+    a dict of their slot to their resolved value.
+
+    Nodes that raise while being resolved are left to raise when (and if) they are resolved
+    while executing the plan.
+    """
+    constants = {}
+    for step in steps:
+        if not is_pure(step.node):
+            continue
+
+        args = []
+        for arg_slot in step.arg_slots:
+            if arg_slot not in constants:
+                break
+
+            args.append(constants[arg_slot])
+        else:
+            try:
+                if args and all(arg is None for arg in args):
+                    constants[step.slot] = None
+                else:
+                    constants[step.slot] = step.resolve(*args)
+            except Exception:
+                pass
+
+    return constants
+
+
+def find_demanded_slots(nodes, arg_slots, roots):
+    """
+    Finds the slots that must always be resolved to resolve the given roots, and the slots of
+    the nodes that will be resolved lazily.
+
+    A node is resolved lazily if it implements `resolve_lazy`, and at least one of its
+    dependencies is not demanded by anything else (there is no point otherwise).
+
+    Nodes that are resolved asynchronously (see `is_async`) are never deferred: lazy nodes resolve
+    their operands one after another, so deferred lookups would no longer be in flight at the same
+    time, while they are started as soon as they can be otherwise.
+    """
+    demanded = [is_async(node) for node in nodes]
+    demanded[DATA_SLOT] = True
+    for slot in roots:
+        demanded[slot] = True
+
+    can_be_lazy = [hasattr(node, 'resolve_lazy') for node in nodes]
+
+    # Since the slots are in topological order, walking them backwards visits every node after
+    # all of the nodes that depend on it.
+    for slot in xrange(len(nodes) - 1, DATA_SLOT, -1):
+        if demanded[slot] and not can_be_lazy[slot]:
+            for arg_slot in arg_slots[slot]:
+                demanded[arg_slot] = True
+
+    # Nodes that turned out to have all their dependencies demanded anyways are resolved
+    # eagerly after all.
+    lazy = [
+        can_be_lazy[slot] and not all(demanded[arg_slot] for arg_slot in arg_slots[slot])
+        for slot in xrange(len(nodes))
+    ]
+
+    return demanded, lazy
+
+
+def find_closures(steps, demanded):
+    """
+    For each deferred slot that is an operand of a lazy node, finds the deferred slots that
+    must be resolved to resolve it, in topological order.
+    """
+    closures = {}
+    for step in steps:
+        if step.resolve_lazy is None:
+            continue
+
+        for operand_slot in step.arg_slots:
+            if demanded[operand_slot] or operand_slot in closures:
+                continue
+
+            closure = set()
+            stack = [operand_slot]
+            while stack:
+                slot = stack.pop()
+                if slot in closure:
+                    continue
+
+                closure.add(slot)
+                deferred_step = steps[slot - 1]
+                # The operands of nested lazy nodes are resolved when they ask for them.
+                if deferred_step.resolve_lazy is not None:
+                    continue
+
+                stack.extend(
+                    arg_slot for arg_slot in deferred_step.arg_slots
+                    if not demanded[arg_slot]
+                )
+
+            closures[operand_slot] = tuple(sorted(closure))
+
+    return closures
+
+
+def find_dependents(steps, demanded, sources):
+    """
+    Finds, for each slot, the eager slots that need it to have resolved before they can
+    resolve, and how many slots each slot needs. The `sources` are the slots which are resolved
+    before any step runs.
+
+    For most nodes, this is just their dependencies, but lazy nodes may need to resolve deferred
+    nodes, and so also need every eager slot that those deferred nodes depend on.
+    """
+    # For every slot, the eager slots that need to resolve before it can resolve.
+    needs = [None] * (len(steps) + 1)
+    dependents = [[] for _ in needs]
+    waiting_on = [0] * len(needs)
+
+    for slot in sources:
+        needs[slot] = frozenset([slot])
+
+    for step in steps:
+        if needs[step.slot] is not None:
+            continue
+
+        waits_for = set()
+        for arg_slot in step.arg_slots:
+            waits_for.update(needs[arg_slot])
+
+        if demanded[step.slot]:
+            needs[step.slot] = frozenset([step.slot])
+            waiting_on[step.slot] = len(waits_for)
+            for slot in waits_for:
+                dependents[slot].append(step.slot)
+        else:
+            needs[step.slot] = frozenset(waits_for)
+
+    return tuple(tuple(d) for d in dependents), tuple(waiting_on)
+
+
+def resolve_step(plan, step, values, nested=False):
+    """
+    Resolves the node of a single step, given the values resolved so far. Lazy nodes that are
+    `nested` within the deferred slots `force` resolves are handed operands that raise
+    `Unresolved`, rather than resolve their deferred operands themselves.
+    """
+    if step.resolve_lazy is not None:
+        return step.resolve_lazy(Operands(plan, values, step.arg_slots, nested))
+
+    if not step.arg_slots:
+        return step.resolve()
+
+    args = [values[arg_slot] for arg_slot in step.arg_slots]
+
+    # If every dependency resolved to None, so does this node.
+    for arg in args:
+        if arg is not None:
+            return step.resolve(*args)
+
+
+def force(plan, values, slot):
+    """
+    Resolves the deferred `slot`, and whatever it depends on that is not yet resolved, storing
+    the resolved values in `values`, and returning the value of `slot`.
+
+    Deferred lazy nodes may need deferred operands of their own (and so on, e.g. for a chain of
+    rules). Rather than resolving those recursively, which would be limited by the depth of the
+    stack, the lazy node stops at the first operand that is not resolved yet (see `Unresolved`),
+    which is pushed onto an explicit stack of slots to resolve first, and the lazy node is
+    resolved again once it is.
+    """
+    stack = [slot]
+    while stack:
+        try:
+            for closure_slot in plan.closures[stack[-1]]:
+                if values[closure_slot] is UNRESOLVED:
+                    values[closure_slot] = resolve_step(plan, plan.step_of(closure_slot), values, nested=True)
+        except Unresolved as e:
+            stack.append(e.slot)
+        else:
+            stack.pop()
+
+    return values[slot]
+
+
+class Unresolved(BaseException):
+    """
+    Raised by the operands of a lazy node resolved by `force`, when the node accesses a deferred
+    operand that is not resolved yet. It derives from `BaseException`, as it is not an error, and
+    must reach `force` through whatever the node catches.
+    """
+
+    def __init__(self, slot):
+        super(Unresolved, self).__init__(slot)
+        self.slot = slot
+
+
+class Operands(object):
+    """
+    The dependencies of a node being resolved lazily. Each dependency is resolved the first time
+    it is accessed, either by index, or by iterating over the operands (or, if `nested`, raises
+    `Unresolved`, for `force` to resolve it).
+    """
+
+    __slots__ = ('plan', 'values', 'slots', 'nested')
+
+    def __init__(self, plan, values, slots, nested=False):
+        self.plan = plan
+        self.values = values
+        self.slots = slots
+        self.nested = nested
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __getitem__(self, index):
+        slot = self.slots[index]
+        value = self.values[slot]
+        if value is UNRESOLVED:
+            if self.nested:
+                raise Unresolved(slot)
+
+            value = force(self.plan, self.values, slot)
+
+        return value
+
+    def __iter__(self):
+        for index in xrange(len(self.slots)):
+            yield self[index]
@@ -0,0 +1,193 @@
+import os
+import sys
+import threading
+from collections import deque
+from itertools import izip
+from multiprocessing.pool import ThreadPool
+
+from futures import Future
+from plan import DATA_SLOT, is_blocking, resolve_step
+
+# The number of threads that the `resolve` of blocking nodes is called on, at most, by default.
+DEFAULT_BLOCKING_THREADS = 16
+
+_blocking_pool = None
+_blocking_pool_pid = None
+_blocking_pool_lock = threading.Lock()
+
+
+def get_blocking_pool():
+    """
+    Returns the thread pool that blocking nodes are resolved on, starting it on first use, and
+    in each process forked from this one (e.g. the workers of a `workers.WorkerPool`), as the
+    threads of the pool do not survive the fork.
+    """
+    global _blocking_pool, _blocking_pool_pid
+
+    with _blocking_pool_lock:
+        pid = os.getpid()
+        if _blocking_pool is None or _blocking_pool_pid != pid:
+            _blocking_pool = ThreadPool(DEFAULT_BLOCKING_THREADS)
+            _blocking_pool_pid = pid
+
+        return _blocking_pool
+
+
+def run_blocking(resolve, *args):
+    """
+    Calls `resolve(*args)` on the blocking pool, returning a `Future` of its result.
+    """
+    future = Future()
+
+    def run():
+        try:
+            value = resolve(*args)
+        except Exception as e:
+            future.set_exception(e, sys.exc_info()[2])
+        else:
+            future.set_result(value)
+
+    get_blocking_pool().apply_async(run)
+    return future
+
+
+class PlanExecution(object):
+    """
+    Executes a plan for a single event, starting every node as soon as all of its dependencies
+    have resolved, rather than strictly in plan order.
+
+    Nodes may implement `resolve_async(*args)`, returning a `Future` rather than a value. Those
+    nodes are started, and while their results are pending, every other node that does not
+    depend on them keeps resolving, so independent lookups are in flight at the same time and the
+    latency of an event is that of its slowest path through the graph, rather than the sum of
+    all of its lookups.
+
+    Nodes that are `blocking` are resolved likewise, with their `resolve` called on a thread
+    pool, see `run_blocking`.
+
+    Nodes are only ever resolved by one thread at a time (but for blocking nodes), even though
+    futures may resolve on other threads.
+    """
+
+    def __init__(self, plan, data):
+        self.plan = plan
+        self.values = list(plan.initial_values)
+        self.values[DATA_SLOT] = data
+        self.future = Future()
+
+        # The number of slots that each slot is still waiting on.
+        self._waiting_on = list(plan.waiting_on)
+        self._remaining = len(plan.eager_steps)
+
+        self._lock = threading.Lock()
+        self._ready = deque()
+        self._running = False
+
+    def start(self):
+        """
+        Starts executing the plan, returning a future of the resolved values of every slot.
+        """
+        extracted = self.plan.json_extractor.extract(self.values[DATA_SLOT])
+
+        with self._lock:
+            self._ready.extend(
+                step.slot for step in self.plan.eager_steps
+                if not self._waiting_on[step.slot]
+            )
+            self._record(DATA_SLOT, self.values[DATA_SLOT])
+            for slot, value in izip(self.plan.extracted_slots, extracted):
+                self._record(slot, value)
+
+            for slot in self.plan.constant_slots:
+                self._record(slot, self.values[slot])
+
+            self._running = True
+
+        self._run()
+        return self.future
+
+    def _record(self, slot, value):
+        """
+        Records the value of `slot`, queueing up the nodes which became ready as a result. Must be
+        called with the lock held.
+        """
+        self.values[slot] = value
+        for dependent in self.plan.dependents[slot]:
+            self._waiting_on[dependent] -= 1
+            if not self._waiting_on[dependent]:
+                self._ready.append(dependent)
+
+    def _complete(self, slot, value):
+        """
+        Records the value of a node that resolved asynchronously, and resolves whatever became
+        ready as a result. If some other thread is already resolving nodes, the ready nodes are
+        left for it to pick up.
+        """
+        with self._lock:
+            self._record(slot, value)
+            self._remaining -= 1
+            if self._running:
+                return
+
+            self._running = True
+
+        self._run()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self.future.done():
+                    self._running = False
+                    return
+
+                if not self._ready:
+                    self._running = False
+                    finished = not self._remaining
+                    break
+
+                slot = self._ready.popleft()
+
+            try:
+                self._resolve(self.plan.step_of(slot))
+            except Exception as e:
+                self._fail(e, sys.exc_info()[2])
+
+        if finished:
+            self.future.set_result(self.values)
+
+    def _resolve(self, step):
+        args = [self.values[arg_slot] for arg_slot in step.arg_slots]
+        resolve_async = getattr(step.node, 'resolve_async', None)
+        if resolve_async is None and is_blocking(step.node):
+            resolve_async = lambda *args: run_blocking(step.resolve, *args)
+
+        # Lazy nodes resolve their deferred dependencies synchronously, with `resolve`.
+        if resolve_async is None or step.resolve_lazy is not None:
+            value = resolve_step(self.plan, step, self.values)
+        # If every dependency resolved to None, so does this node.
+        elif args and all(arg is None for arg in args):
+            value = None
+        else:
+            return self._resolve_async(step.slot, resolve_async, args)
+
+        with self._lock:
+            self._record(step.slot, value)
+            self._remaining -= 1
+
+    def _resolve_async(self, slot, resolve_async, args):
+        def on_done(future):
+            try:
+                value = future.result()
+            except Exception as e:
+                self._fail(e, sys.exc_info()[2])
+            else:
+                self._complete(slot, value)
+
+        resolve_async(*args).add_done_callback(on_done)
+
+    def _fail(self, exception, traceback):
+        try:
+            self.future.set_exception(exception, traceback)
+        except RuntimeError:
+            # Some other node already failed the execution.
+            pass
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from .rate_limit import DEFAULT_MAX_KEYS
+from .windows import NO_MAXIMUM, BucketRing, ExpiringKeys, MaxRing
+
+SUM = 'sum'
+AVERAGE = 'average'
+MAXIMUM = 'maximum'
+
+
+class AggregateStore(object):
+    """
+    The interface of the stores that keep the windowed aggregates of `Sum`, `Avg` and `Max` nodes.
+    """
+
+    def add(self, key, value, window, aggregate):
+        """
+        Adds the number `value` (unless it is None) to the values of `key` now, returning the
+        `aggregate` (one of SUM, AVERAGE or MAXIMUM) of the values of `key` within the sliding
+        `window` (a `stores.windows.Window`) ending now, including this one. The average and
+        maximum of no values are None, their sum is 0.
+
+        `key` is a tuple of unicode strings and numbers.
+        """
+        raise NotImplementedError(self)
+
+
+class WindowedAggregate(object):
+    """
+    The rings needed to compute one aggregate of the values of a key over a sliding window.
+    """
+
+    __slots__ = ('window', 'aggregate', 'rings')
+
+    def __init__(self, window, bucket, aggregate):
+        self.window = window
+        self.aggregate = aggregate
+        if aggregate == SUM:
+            self.rings = (BucketRing(window, bucket, 'd'),)
+        elif aggregate == AVERAGE:
+            self.rings = (BucketRing(window, bucket, 'd'), BucketRing(window, bucket, 'l'))
+        elif aggregate == MAXIMUM:
+            self.rings = (MaxRing(window, bucket),)
+        else:
+            raise ValueError('Unknown aggregate %r' % aggregate)
+
+    def expires_at(self):
+        return self.window.expires_at(self.rings[0].latest)
+
+    def add(self, bucket, value):
+        for ring in self.rings:
+            ring.advance(bucket)
+
+        if value is not None:
+            self.rings[0].add(value)
+            if self.aggregate == AVERAGE:
+                self.rings[1].add(1)
+
+        if self.aggregate == SUM:
+            return self.rings[0].total
+
+        if self.aggregate == AVERAGE:
+            count = self.rings[1].total
+            return self.rings[0].total / count if count else None
+
+        maximum = self.rings[0].total
+        return None if maximum == NO_MAXIMUM else maximum
+
+
+class LocalAggregateStore(AggregateStore):
+    """
+    Keeps the aggregates in the memory of this process, as fixed size rings of buckets per key,
+    evicting keys like `stores.rate_limit.LocalRateLimitStore` does.
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, clock=time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._aggregates = ExpiringKeys(max_keys)
+
+    def __len__(self):
+        return len(self._aggregates)
+
+    def add(self, key, value, window, aggregate):
+        now = self.clock()
+        bucket = window.bucket_of(now)
+
+        with self._lock:
+            # The rings of a key are only valid for the window and aggregate they were created for,
+            # e.g. if the rules changed the window of a node, without changing its name.
+            windowed = self._aggregates.update(
+                (key, window, aggregate), lambda: WindowedAggregate(window, bucket, aggregate))
+            result = windowed.add(bucket, value)
+            self._aggregates.evict(now)
+            return result
+
+
+# The store that `Sum`, `Avg` and `Max` nodes keep their aggregates in.
+store = LocalAggregateStore()
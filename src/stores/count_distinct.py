@@ -0,0 +1,58 @@
+import threading
+import time
+
+from .rate_limit import DEFAULT_MAX_KEYS
+from .sketches import DEFAULT_PRECISION, WindowedHyperLogLog
+from .windows import ExpiringKeys
+
+
+class CountDistinctStore(object):
+    """
+    The interface of the stores that keep the sketches of `CountDistinct` nodes.
+    """
+
+    def add(self, key, value, window):
+        """
+        Adds `value` (unless it is None) to the values seen for `key` now, returning the estimated
+        number of distinct values seen for `key` within the sliding `window` (a
+        `stores.windows.Window`) ending now, including this one.
+
+        `key` is a tuple of unicode strings and numbers.
+        """
+        raise NotImplementedError(self)
+
+
+class LocalCountDistinctStore(CountDistinctStore):
+    """
+    Keeps a `WindowedHyperLogLog` per key in the memory of this process, evicting keys like
+    `stores.rate_limit.LocalRateLimitStore` does.
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, precision=DEFAULT_PRECISION, clock=time.time):
+        self.precision = precision
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sketches = ExpiringKeys(max_keys)
+
+    def __len__(self):
+        return len(self._sketches)
+
+    def add(self, key, value, window):
+        now = self.clock()
+        bucket = window.bucket_of(now)
+
+        with self._lock:
+            # The sketch of a key is only valid for the window it was created for, e.g. if the rules
+            # changed the window of a node, without changing its name.
+            sketch = self._sketches.update(
+                (key, window), lambda: WindowedHyperLogLog(window, bucket, self.precision))
+            sketch.advance(bucket)
+            if value is not None:
+                sketch.add(value)
+
+            self._sketches.evict(now)
+            return sketch.estimate()
+
+
+# The store that `CountDistinct` nodes keep their sketches in.
+store = LocalCountDistinctStore()
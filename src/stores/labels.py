@@ -0,0 +1,524 @@
+import re
+import threading
+import time
+from collections import defaultdict
+
+from cache import LRUCache, MISSING
+from utils import paused_gc
+
+from .sketches import DEFAULT_ERROR_RATE, BloomFilter
+
+# By default, the caching label store keeps the labels of this many entities, for this long.
+DEFAULT_CACHE_SIZE = 100000
+DEFAULT_CACHE_TTL = 60
+
+# The least number of entities the filter of `BloomFilteredLabelStore` is sized for.
+MIN_FILTER_CAPACITY = 1024
+
+# By default, the write behind label store flushes once this many label changes are pending, or
+# once the oldest of them has been pending for this long.
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# XX: Hack, need actual entity label implementation.
+entity_labels = defaultdict(dict)
+
+
+class LabelStore(object):
+    """
+    The interface of the stores that `HasLabel` nodes look the labels of entities up in.
+    """
+
+    def get_many(self, entity_paths):
+        """
+        Looks up the labels of the entities with the given paths (see `EntityRef.entity_path`),
+        returning a dict of the path of each entity that has labels, to a dict of its labels to
+        their status (`ADDED` or `REMOVED`). The returned dicts must not be mutated.
+        """
+        raise NotImplementedError(self)
+
+    def entity_paths(self):
+        """
+        Returns an iterable of the paths of every entity that has labels, for the stores that can
+        list them (see `BloomFilteredLabelStore`).
+        """
+        raise NotImplementedError(self)
+
+    def set(self, entity_path, label, status):
+        """
+        Sets the status of `label` on the entity with the given path to `status`, either `ADDED`,
+        `REMOVED`, or None to forget about the label altogether, for the stores that can be changed.
+        """
+        raise NotImplementedError(self)
+
+    def set_many(self, changes):
+        """
+        Applies the given (entity path, label, status) changes, as `set` would, in order.
+        """
+        for entity_path, label, status in changes:
+            self.set(entity_path, label, status)
+
+
+class DictLabelStore(LabelStore):
+    """
+    Looks labels up in a dict of entity paths to their labels, by default `entity_labels`.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = entity_labels if labels is None else labels
+
+    def get_many(self, entity_paths):
+        labels = self.labels
+        return dict(
+            (entity_path, labels[entity_path])
+            for entity_path in entity_paths
+            if labels.get(entity_path)
+        )
+
+    def entity_paths(self):
+        return [entity_path for entity_path, labels in self.labels.items() if labels]
+
+    def set(self, entity_path, label, status):
+        labels = dict(self.labels.get(entity_path, {}))
+        if status is None:
+            labels.pop(label, None)
+        else:
+            labels[label] = status
+
+        # A new dict is swapped in, as the dicts returned by `get_many` must not change.
+        self.labels[entity_path] = labels
+
+
+class CachingLabelStore(LabelStore):
+    """
+    Serves the labels of recently looked up entities (including the ones without labels) from an
+    `LRUCache`, only looking the others up in `store`, in a single `get_many`.
+    """
+
+    def __init__(self, store, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, clock=time.time):
+        self.store = store
+        self.cache = LRUCache(max_size, ttl, clock)
+
+    def get_many(self, entity_paths):
+        found = {}
+        missing = []
+        for entity_path in entity_paths:
+            labels = self.cache.get(entity_path)
+            if labels is MISSING:
+                missing.append(entity_path)
+            elif labels:
+                found[entity_path] = labels
+
+        if missing:
+            looked_up = self.store.get_many(missing)
+            for entity_path in missing:
+                labels = looked_up.get(entity_path, {})
+                self.cache.put(entity_path, labels)
+                if labels:
+                    found[entity_path] = labels
+
+        return found
+
+    def invalidate(self, entity_paths):
+        """
+        Drops the cached labels of the given entities, e.g. once they were changed.
+        """
+        for entity_path in entity_paths:
+            self.cache.discard(entity_path)
+
+    def set_many(self, changes):
+        changes = list(changes)
+        self.store.set_many(changes)
+        self.invalidate(set(entity_path for entity_path, _, _ in changes))
+
+
+class BloomFilteredLabelStore(LabelStore):
+    """
+    Keeps a `BloomFilter` of the entities that have labels in `store`, so that the entities that
+    do not (which is most of them) are not looked up in `store` at all. Only a small fraction of
+    them, the false positives of the filter, are looked up.
+
+    The filter is built from `store.entity_paths()`. Labels must be added through `set`, which
+    adds the entity to the filter before setting the label in `store`, or the filter must be
+    rebuilt with `rebuild` once labels were added otherwise. Entities whose labels are all
+    forgotten stay in the filter until it is rebuilt. The filter is rebuilt, twice as large, once
+    more entities than it was sized for are added.
+    """
+
+    def __init__(self, store, error_rate=DEFAULT_ERROR_RATE):
+        self.store = store
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self, capacity=None):
+        """
+        Builds the filter again from the entities that have labels in `store`, for at least
+        `capacity` entities (by default, twice as many as there are).
+        """
+        with self._lock:
+            self._rebuild(capacity)
+
+    def _rebuild(self, capacity):
+        entity_paths = list(self.store.entity_paths())
+        if capacity is None:
+            capacity = 2 * len(entity_paths)
+
+        bloom_filter = BloomFilter(max(capacity, MIN_FILTER_CAPACITY), self.error_rate)
+        for entity_path in entity_paths:
+            bloom_filter.add(entity_path)
+
+        # Lookups see either the old filter, or the complete new one.
+        self.filter = bloom_filter
+
+    def get_many(self, entity_paths):
+        bloom_filter = self.filter
+        entity_paths = [entity_path for entity_path in entity_paths if entity_path in bloom_filter]
+        if not entity_paths:
+            return {}
+
+        return self.store.get_many(entity_paths)
+
+    def entity_paths(self):
+        return self.store.entity_paths()
+
+    def set(self, entity_path, label, status):
+        self.set_many([(entity_path, label, status)])
+
+    def set_many(self, changes):
+        changes = list(changes)
+        with self._lock:
+            added = []
+            for entity_path, _, status in changes:
+                if status is not None and entity_path not in self.filter:
+                    if len(self.filter) >= self.filter.capacity:
+                        # The entities added so far are not in `store` yet, so they are not in
+                        # the rebuilt filter either, until they are added to it again.
+                        self._rebuild(2 * self.filter.capacity)
+                        for added_path in added:
+                            self.filter.add(added_path)
+
+                    self.filter.add(entity_path)
+                    added.append(entity_path)
+
+            # The labels are written with the lock held, as the filter would otherwise be rebuilt
+            # (by a concurrent `set_many`) without the entities that are not yet in `store`.
+            self.store.set_many(changes)
+
+
+class WriteBehindLabelStore(LabelStore):
+    """
+    Buffers the label changes of the `LabelAction`s of many events (see `apply`), and writes them
+    to `store` in batches, with a single `set_many`, once `max_pending` changes are pending, or
+    once the oldest of them has been pending for `flush_interval` seconds. Only the last change to
+    each label of each entity is written.
+
+    Lookups (see `get_many`) see the pending changes, on top of the labels in `store`, so that
+    `HasLabel` nodes see the labels added by earlier events as soon as they are applied, if this
+    is `stores.labels.store`.
+
+    The thresholds are checked as changes are applied, rather than in the background (or as labels
+    are looked up, which would make an event pay for the write): call `flush` to write whatever is
+    pending, e.g. before exiting. Should a write fail, its changes are pending again, to be
+    written by the next flush.
+    """
+
+    def __init__(self, store, max_pending=DEFAULT_MAX_PENDING, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 clock=time.time):
+        self.store = store
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # The pending changes, as a dict of entity paths to dicts of their labels to their status
+        # (None for the labels to forget about), and the number of them.
+        self._pending = {}
+        self._pending_count = 0
+        self._pending_since = None
+        # The changes being written by `flush`, that lookups still need to see until they are.
+        self._flushing = {}
+
+    def __len__(self):
+        return self._pending_count
+
+    def apply(self, actions):
+        """
+        Buffers the changes of the given `LabelAction`s (e.g. the `actions` of an
+        `ExecutionResult`), in order, flushing them if a threshold was reached.
+        """
+        self.set_many(
+            (action.entity.entity_path(), action.label, action.status)
+            for action in actions
+            if action.entity is not None
+        )
+
+    def set(self, entity_path, label, status):
+        self.set_many([(entity_path, label, status)])
+
+    def set_many(self, changes):
+        with self._lock:
+            pending = self._pending
+            for entity_path, label, status in changes:
+                labels = pending.get(entity_path)
+                if labels is None:
+                    labels = pending[entity_path] = {}
+                if label not in labels:
+                    self._pending_count += 1
+                labels[label] = status
+
+            if self._pending_count and self._pending_since is None:
+                self._pending_since = self.clock()
+
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        pending_since = self._pending_since
+        if pending_since is None:
+            return
+
+        if self._pending_count >= self.max_pending or self.clock() - pending_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the pending changes to `store`, returning the number of changes written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending_since = self._pending_since
+                flushing = self._flushing = self._pending
+                self._pending = {}
+                self._pending_count = 0
+                self._pending_since = None
+
+            if not flushing:
+                return 0
+
+            changes = [
+                (entity_path, label, status)
+                for entity_path, labels in flushing.iteritems()
+                for label, status in labels.iteritems()
+            ]
+
+            try:
+                self.store.set_many(changes)
+            except Exception:
+                with self._lock:
+                    self._restore(flushing, pending_since)
+                    self._flushing = {}
+                raise
+
+            with self._lock:
+                self._flushing = {}
+
+            self.flushes += 1
+            return len(changes)
+
+    def _restore(self, flushing, pending_since):
+        """
+        Makes the changes of a failed flush pending again, under the changes made since, which
+        are newer. Must be called with the lock held.
+        """
+        pending = self._pending
+        for entity_path, labels in flushing.iteritems():
+            labels = dict(labels)
+            labels.update(pending.get(entity_path, ()))
+            pending[entity_path] = labels
+
+        self._pending_count = sum(len(labels) for labels in pending.itervalues())
+        if self._pending_since is None or pending_since < self._pending_since:
+            self._pending_since = pending_since
+
+    def get_many(self, entity_paths):
+        # The pending changes are copied before `store` is read, so that changes that are flushed
+        # in between are seen in either.
+        entity_paths = list(entity_paths)
+        with self._lock:
+            overlays = [self._flushing, self._pending]
+            changed = [
+                (entity_path, [dict(overlay[entity_path]) for overlay in overlays if entity_path in overlay])
+                for entity_path in entity_paths
+                if any(entity_path in overlay for overlay in overlays)
+            ]
+
+        found = self.store.get_many(entity_paths)
+        if not changed:
+            return found
+
+        found = dict(found)
+        for entity_path, changes in changed:
+            labels = dict(found.get(entity_path, {}))
+            for change in changes:
+                labels.update(change)
+
+            labels = dict((label, status) for label, status in labels.iteritems() if status is not None)
+            if labels:
+                found[entity_path] = labels
+            else:
+                found.pop(entity_path, None)
+
+        return found
+
+    def entity_paths(self):
+        return self.store.entity_paths()
+
+
+# The ids that `InternedLabelStore` keeps as ints, as they are turned back into the same string.
+DECIMAL = re.compile(r'\A(0|[1-9][0-9]*)\Z')
+
+# The status of a label in the bits of `InternedLabelStore`, and back.
+STATUS_BITS = {'ADDED': 1, 'REMOVED': 2}
+STATUSES = {1: 'ADDED', 2: 'REMOVED'}
+
+
+class InternedLabelStore(LabelStore):
+    """
+    Keeps labels in the memory of this process, compactly enough for tens of millions of entities.
+
+    Entity types and label names are interned to small integers, and the labels of an entity are
+    packed into a single int, two bits per label (whether it is added, or removed), so that most
+    entities cost a single dict entry, in the dict of the ids of their type. Ids that are plain
+    decimal numbers are kept as ints, rather than strings.
+
+    The store can be bulk loaded from a snapshot file (see `load`), and changed with `set`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._type_indexes = {}
+        # For each entity type, a dict of entity ids to the bits of their labels.
+        self._entities = []
+        self._label_indexes = {}
+        self._label_names = []
+
+    def __len__(self):
+        return sum(len(entities) for entities in self._entities)
+
+    def _get_entities(self, entity_type, create=False):
+        index = self._type_indexes.get(entity_type)
+        if index is None:
+            if not create:
+                return None
+
+            index = self._type_indexes[entity_type] = len(self._entities)
+            self._entities.append({})
+
+        return self._entities[index]
+
+    def _get_label_index(self, label):
+        index = self._label_indexes.get(label)
+        if index is None:
+            index = self._label_indexes[label] = len(self._label_names)
+            self._label_names.append(label)
+
+        return index
+
+    def _decode(self, bits):
+        labels = {}
+        index = 0
+        while bits:
+            status = bits & 3
+            if status:
+                labels[self._label_names[index]] = STATUSES[status]
+            bits >>= 2
+            index += 1
+
+        return labels
+
+    def get_many(self, entity_paths):
+        found = {}
+        for entity_path in entity_paths:
+            entity_type, _, entity_id = entity_path.partition(u'/')
+            entities = self._get_entities(entity_type)
+            if entities is None:
+                continue
+
+            bits = entities.get(get_id_key(entity_id))
+            if bits:
+                found[entity_path] = self._decode(bits)
+
+        return found
+
+    def set(self, entity_path, label, status):
+        self.set_many([(entity_path, label, status)])
+
+    def set_many(self, changes):
+        with self._lock:
+            for entity_path, label, status in changes:
+                entity_type, _, entity_id = entity_path.partition(u'/')
+                entities = self._get_entities(entity_type, create=True)
+                self._set(entities, get_id_key(entity_id), label, status)
+
+    def entity_paths(self):
+        for entity_type, type_index in self._type_indexes.items():
+            for key in self._entities[type_index].keys():
+                entity_id = get_entity_id(key)
+                yield u'%s/%s' % (entity_type, entity_id)
+
+    def _set(self, entities, key, label, status):
+        shift = 2 * self._get_label_index(label)
+        bits = entities.get(key, 0) & ~(3 << shift)
+        if status is not None:
+            bits |= STATUS_BITS[status] << shift
+
+        if bits:
+            entities[key] = bits
+        else:
+            entities.pop(key, None)
+
+    def load(self, path):
+        """
+        Loads the labels in the snapshot file at `path`, a tab separated file of the type, id,
+        label and status of a label of an entity per line (see `dump`), returning the number of
+        labels loaded.
+        """
+        loaded = 0
+        with paused_gc(), self._lock, open(path, 'rb') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if not line:
+                    continue
+
+                entity_type, entity_id, label, status = line.decode('utf-8').split(u'\t')
+                entities = self._get_entities(entity_type, create=True)
+                self._set(entities, get_id_key(entity_id), label, status)
+                loaded += 1
+
+        return loaded
+
+    def dump(self, path):
+        """
+        Writes the labels of the store to a snapshot file at `path`, that `load` can load.
+        """
+        with self._lock, open(path, 'wb') as f:
+            for entity_type, type_index in sorted(self._type_indexes.iteritems()):
+                for key, bits in self._entities[type_index].iteritems():
+                    entity_id = get_entity_id(key)
+                    for label, status in sorted(self._decode(bits).iteritems()):
+                        f.write(u'\t'.join((entity_type, entity_id, label, status)).encode('utf-8'))
+                        f.write('\n')
+
+
+def get_id_key(entity_id):
+    """
+    Returns the key an entity id is kept under by `InternedLabelStore`: ids that are plain
+    decimal numbers take much less memory as ints, and others as utf-8 encoded strings, rather
+    than unicode strings, with 4 bytes per character.
+    """
+    if DECIMAL.match(entity_id):
+        return int(entity_id)
+
+    return entity_id.encode('utf-8')
+
+
+def get_entity_id(key):
+    """
+    Returns the entity id kept under `key` by `InternedLabelStore` (see `get_id_key`).
+    """
+    return key.decode('utf-8') if isinstance(key, str) else unicode(key)
+
+
+# The store that `HasLabel` nodes look the labels of entities up in.
+store = DictLabelStore()
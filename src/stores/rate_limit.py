@@ -0,0 +1,211 @@
+import threading
+import time
+
+from .shared_memory import DEFAULT_CAPACITY, DEFAULT_REGIONS, SharedCounterTable
+from .sketches import DEFAULT_DEPTH, DEFAULT_WIDTH, WindowedCountMinSketch
+from .windows import ExpiringKeys, WindowedRings
+
+# By default, the local store keeps the counters of this many keys at most.
+DEFAULT_MAX_KEYS = 1000000
+
+
+class RateLimitStore(object):
+    """
+    The interface of the stores that keep the counters of `RateLimit` nodes.
+    """
+
+    def increment(self, key, windows):
+        """
+        Counts an event for `key` now, returning, for each of the sliding `windows` (a tuple of
+        `stores.windows.Window`), the number of events counted for `key` within the window ending
+        now, including this one.
+
+        `key` is a tuple of unicode strings and numbers.
+        """
+        raise NotImplementedError(self)
+
+
+class LocalRateLimitStore(RateLimitStore):
+    """
+    Keeps the counters in the memory of this process, as fixed size rings of buckets per key, one
+    for each of the windows the key is counted over.
+
+    Keys are evicted once all of their counts fall out of their windows, and the least recently
+    counted keys are evicted when there are more than `max_keys`, so that memory stays bounded.
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, clock=time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._counters = ExpiringKeys(max_keys)
+
+    def __len__(self):
+        return len(self._counters)
+
+    def increment(self, key, windows):
+        now = self.clock()
+
+        with self._lock:
+            counts = self._counters.update(key, WindowedRings).add(windows, now, 1)
+            self._counters.evict(now)
+            return counts
+
+
+class KeyValueRateLimitStore(RateLimitStore):
+    """
+    Keeps the counters in an external key value store, e.g. redis or memcached, with one key per
+    bucket of each window, that expires once the bucket falls out of the window.
+
+    `client` must implement `incr(key, ttl)`, incrementing the integer at `key`, and setting it to
+    expire in `ttl` seconds if it did not exist, and `get_many(keys)`, returning a list of the
+    values of the keys, or None for the keys that do not exist, e.g. as a pipeline of redis
+    commands would. `LocalKeyValueClient` is an in-process stand-in for one.
+    """
+
+    def __init__(self, client, clock=time.time):
+        self.client = client
+        self.clock = clock
+
+    def increment(self, key, windows):
+        now = self.clock()
+        prefix = u':'.join(unicode(part) for part in key)
+
+        bucket_keys = []
+        for window in windows:
+            bucket = window.bucket_of(now)
+            window_prefix = u'%s:%s' % (prefix, window.seconds)
+            self.client.incr(u'%s:%d' % (window_prefix, bucket), ttl=window.seconds + window.width)
+            bucket_keys.extend(
+                u'%s:%d' % (window_prefix, expired)
+                for expired in xrange(bucket - window.buckets + 1, bucket + 1)
+            )
+
+        counts = self.client.get_many(bucket_keys)
+
+        totals = []
+        start = 0
+        for window in windows:
+            totals.append(sum(count for count in counts[start:start + window.buckets] if count is not None))
+            start += window.buckets
+
+        return totals
+
+
+class CountMinSketchRateLimitStore(RateLimitStore):
+    """
+    Keeps approximate counters, in a `WindowedCountMinSketch` per window, shared by every key. Memory
+    does not grow with the number of keys, at the cost of overestimating counts, which makes it a
+    fit for rate limits of entities with a very large number of ids (e.g. IPs), with `max` well
+    above the expected error (see `stores.sketches`).
+    """
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, clock=time.time):
+        self.width = width
+        self.depth = depth
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sketches = {}
+
+    @property
+    def memory(self):
+        return sum(sketch.memory for sketch in self._sketches.itervalues())
+
+    def increment(self, key, windows):
+        now = self.clock()
+
+        with self._lock:
+            counts = []
+            for window in windows:
+                sketch = self._sketches.get(window)
+                if sketch is None:
+                    sketch = self._sketches[window] = WindowedCountMinSketch(window, self.width, self.depth)
+
+                sketch.advance(window.bucket_of(now))
+                counts.append(sketch.increment(key))
+
+            return counts
+
+
+class SharedMemoryRateLimitStore(RateLimitStore):
+    """
+    Keeps the counters in a `SharedCounterTable`, in memory shared by this process and the
+    processes forked from it once the store is created, e.g. the workers of a `workers.WorkerPool`,
+    so that they all count the same events without going over the network. The store must be
+    created (and made `store`) before the workers are started.
+
+    The table has room for the counters of `capacity` keys (one per window they are counted over).
+    Once it is full, the keys counted least recently start over (see `SharedCounterTable`), so
+    their rate limits undercount, and fail open, unlike those of `CountMinSketchRateLimitStore`,
+    which overcount, and fail closed.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, regions=DEFAULT_REGIONS, clock=time.time):
+        self.clock = clock
+        self.table = SharedCounterTable(capacity, regions)
+
+    @property
+    def memory(self):
+        return self.table.memory
+
+    def increment(self, key, windows):
+        now = self.clock()
+        return [self.table.increment(key, window, now) for window in windows]
+
+
+class LocalKeyValueClient(object):
+    """
+    An in-process stand-in for the client of an external key value store, for
+    `KeyValueRateLimitStore`. Expired keys are removed as they are looked up, and swept every
+    `sweep_every` increments.
+    """
+
+    def __init__(self, clock=time.time, sweep_every=10000):
+        self.clock = clock
+        self.sweep_every = sweep_every
+        self._lock = threading.Lock()
+        self._increments = 0
+        # Maps each key to its (value, expiry timestamp).
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def incr(self, key, ttl):
+        now = self.clock()
+        with self._lock:
+            value, expires_at = self._get(key, now)
+            if value is None:
+                value, expires_at = 0, now + ttl
+
+            self._values[key] = value + 1, expires_at
+
+            self._increments += 1
+            if self._increments % self.sweep_every == 0:
+                self._sweep(now)
+
+            return value + 1
+
+    def get_many(self, keys):
+        now = self.clock()
+        with self._lock:
+            return [self._get(key, now)[0] for key in keys]
+
+    def _get(self, key, now):
+        value, expires_at = self._values.get(key, (None, None))
+        if expires_at is not None and expires_at <= now:
+            del self._values[key]
+            return None, None
+
+        return value, expires_at
+
+    def _sweep(self, now):
+        for key, (_, expires_at) in self._values.items():
+            if expires_at <= now:
+                del self._values[key]
+
+
+# The store that `RateLimit` nodes keep their counters in.
+store = LocalRateLimitStore()
+
+# The store that `RateLimit` nodes keep their counters in, if they are `approx`.
+approximate_store = CountMinSketchRateLimitStore()
@@ -0,0 +1,122 @@
+import hashlib
+import mmap
+import multiprocessing
+import struct
+
+from .windows import DEFAULT_BUCKETS
+
+# By default, the shared counter table has room for the counters of this many keys (and windows),
+# split into this many regions, each with its own lock.
+DEFAULT_CAPACITY = 2 ** 18
+DEFAULT_REGIONS = 64
+
+# A key is looked up in at most this many slots, from the slot its hash maps it to.
+MAX_PROBES = 16
+
+# The most buckets a window counted in the table may have.
+MAX_BUCKETS = DEFAULT_BUCKETS
+
+# A slot of the table: the fingerprint of its key (0 if the slot was never used), the latest
+# bucket counted, the timestamp from which its counts are all out of the window, the timestamp it
+# was last counted at, and the count of each bucket of the window, in a ring.
+SLOT = struct.Struct('<Qqdd%dI' % MAX_BUCKETS)
+COUNTS = 4
+
+
+def get_fingerprint(key, window):
+    """
+    Hashes a key and a window to a non-zero 64 bit integer, the same way in every process (unlike
+    `hash`).
+    """
+    parts = [unicode(part) for part in key] + [unicode(window.seconds), unicode(window.buckets)]
+    digest = hashlib.md5(u'\x00'.join(parts).encode('utf-8')).digest()
+    return struct.unpack('<Q', digest[:8])[0] or 1
+
+
+class SharedCounterTable(object):
+    """
+    The bucketed counters of keys over sliding windows (see `stores.windows.BucketRing`), in a
+    fixed size, open addressed hash table, in memory shared with the processes forked after it is
+    created (e.g. the workers of a `workers.WorkerPool`), so that they all count the same events.
+
+    The table is split into `regions`, each with its own lock, and keys are only probed for within
+    the region their hash maps them to, so that processes only contend for the locks of the
+    regions of the keys they count. Slots whose counts all fell out of their window are reused.
+    Should every slot a key may be in be taken, the slot counted least recently is reused, and
+    the counts of its key start over: its rate limits fail open, until it is counted again past
+    their `max`. The table must then be sized for the keys counted within the longest window.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, regions=DEFAULT_REGIONS):
+        self.regions = regions
+        self.region_size = max(capacity // regions, 1)
+        self.capacity = self.region_size * regions
+        self.memory = self.capacity * SLOT.size
+        # An anonymous map is shared with child processes, rather than copied on write.
+        self._map = mmap.mmap(-1, self.memory)
+        self._locks = [multiprocessing.Lock() for _ in xrange(regions)]
+        self._probes = min(MAX_PROBES, self.region_size)
+
+    def increment(self, key, window, now):
+        """
+        Counts an event for `key` at timestamp `now`, returning the number of events counted for
+        `key` within `window`, ending now.
+        """
+        if window.buckets > MAX_BUCKETS:
+            raise ValueError('Windows of at most %d buckets can be counted, got %r.' % (MAX_BUCKETS, window))
+
+        fingerprint = get_fingerprint(key, window)
+        bucket = window.bucket_of(now)
+        region, home = divmod(fingerprint % self.capacity, self.region_size)
+        start = region * self.region_size
+
+        with self._locks[region]:
+            offset, counts = self._find(fingerprint, start, home, now)
+
+            size = window.buckets
+            latest = counts[1]
+            if counts[0] != fingerprint or bucket - latest >= size:
+                counts[COUNTS:] = [0] * MAX_BUCKETS
+                latest = bucket
+            elif bucket > latest:
+                for expired in xrange(latest + 1, bucket + 1):
+                    counts[COUNTS + expired % size] = 0
+                latest = bucket
+
+            # Buckets before the latest bucket are counted as the latest bucket.
+            counts[COUNTS + latest % size] += 1
+            counts[0] = fingerprint
+            counts[1] = latest
+            counts[2] = window.expires_at(latest)
+            counts[3] = now
+            SLOT.pack_into(self._map, offset, *counts)
+
+            return sum(counts[COUNTS:COUNTS + size])
+
+    def _find(self, fingerprint, start, home, now):
+        """
+        Returns the offset of the slot of `fingerprint`, and its fields, as a list. If the key has
+        no slot, the slot it should take is returned instead, along with the fields of its
+        previous key.
+        """
+        free = None
+        oldest = None
+        for probe in xrange(self._probes):
+            offset = (start + (home + probe) % self.region_size) * SLOT.size
+            fields = SLOT.unpack_from(self._map, offset)
+            if fields[0] == fingerprint:
+                return offset, list(fields)
+
+            if fields[0] == 0:
+                # The key can not be further along than a slot that was never used.
+                if free is None:
+                    free = offset, fields
+                break
+
+            if free is None and fields[2] <= now:
+                free = offset, fields
+            elif oldest is None or fields[3] < oldest[1][3]:
+                oldest = offset, fields
+
+        offset, fields = free or oldest
+        return offset, list(fields)
@@ -0,0 +1,249 @@
+import math
+from array import array
+
+# The default precision of HyperLogLog sketches: they have 2 ** DEFAULT_PRECISION registers,
+# of one byte each, and a standard error of 1.04 / sqrt(2 ** DEFAULT_PRECISION) (~6.5%).
+DEFAULT_PRECISION = 8
+
+# The default dimensions of count-min sketches. With these, a count is overestimated by more
+# than e / DEFAULT_WIDTH (~0.02%) of the total of the counts in the sketch with a probability
+# of e ** -DEFAULT_DEPTH (~2%), in 256KB per bucket.
+DEFAULT_WIDTH = 2 ** 14
+DEFAULT_DEPTH = 4
+
+# The default false positive rate of Bloom filters, at their capacity.
+DEFAULT_ERROR_RATE = 0.01
+
+
+def get_cells(key, width, depth):
+    """
+    Returns the index of the cell of `key` in each of the `depth` rows of a sketch `width` wide,
+    as offsets into the array holding all of the rows, one after another.
+
+    The rows are indexed by `depth` hashes derived from the two halves of the hash of the key
+    (see Kirsch and Mitzenmacher, "Less Hashing, Same Performance"). Note that hashing the key
+    again, e.g. along with a seed, would not do: the low bits of a hash of a tuple only depend
+    on the low bits of the hashes of its items.
+    """
+    hashed = hash(key)
+    first = hashed & 0xffffffff
+    second = (hashed >> 32) | 1
+    return [row * width + (first + row * second) % width for row in xrange(depth)]
+
+
+class WindowedCountMinSketch(object):
+    """
+    Approximate counts of any number of keys over a sliding `window` (a `stores.windows.Window`),
+    in a fixed amount of memory: a count-min sketch for each bucket of the window, in a ring.
+
+    Counts are never underestimated, and are overestimated by at most the error described by
+    `DEFAULT_WIDTH`, relative to the total of all counts within the window.
+    """
+
+    def __init__(self, window, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH):
+        self.window = window
+        self.width = width
+        self.depth = depth
+        self._zeros = array('I', [0]) * (width * depth)
+        self.buckets = [array('I', self._zeros) for _ in xrange(window.buckets)]
+        self.latest = None
+
+    @property
+    def memory(self):
+        """
+        The number of bytes taken by the counts of the sketch.
+        """
+        return sum(bucket.itemsize * len(bucket) for bucket in self.buckets)
+
+    def advance(self, bucket):
+        """
+        Moves the window forward to end at `bucket`, clearing the sketches that fall out of it.
+        """
+        latest = self.latest
+        if latest is not None and bucket <= latest:
+            return
+
+        size = len(self.buckets)
+        if latest is None or bucket - latest >= size:
+            expired = xrange(size)
+        else:
+            expired = (i % size for i in xrange(latest + 1, bucket + 1))
+
+        for i in expired:
+            self.buckets[i][:] = self._zeros
+
+        self.latest = bucket
+
+    def increment(self, key):
+        """
+        Counts `key` in the latest bucket, returning its estimated count within the window.
+        """
+        cells = get_cells(key, self.width, self.depth)
+        latest = self.buckets[self.latest % len(self.buckets)]
+        for cell in cells:
+            latest[cell] += 1
+
+        return min(sum(bucket[cell] for bucket in self.buckets) for cell in cells)
+
+
+def get_error_bounds(width, depth):
+    """
+    Returns (epsilon, delta) for a count-min sketch of the given dimensions: a count is
+    overestimated by more than `epsilon` times the total of all counts with probability `delta`.
+    """
+    return math.e / width, math.exp(-depth)
+
+
+def mix(hashed):
+    """
+    Scrambles the bits of a hash, as the hashes of python ints are the ints themselves, so their
+    bits are nowhere near uniformly distributed (using the finalizer of MurmurHash3).
+    """
+    hashed &= 0xffffffffffffffff
+    hashed = ((hashed ^ (hashed >> 33)) * 0xff51afd7ed558ccd) & 0xffffffffffffffff
+    hashed = ((hashed ^ (hashed >> 33)) * 0xc4ceb9fe1a85ec53) & 0xffffffffffffffff
+    return hashed ^ (hashed >> 33)
+
+
+class WindowedHyperLogLog(object):
+    """
+    An estimate of the number of distinct values seen over a sliding `window` (a
+    `stores.windows.Window`), in a bounded amount of memory: a HyperLogLog sketch for each bucket
+    of the window that saw values, in a ring, along with the sketch of the whole window (the
+    maximum of their registers), so that estimating is O(1).
+
+    The sketch of the whole window is recomputed when a bucket expires, rather than on each
+    estimate, and the sum the estimate is computed from is maintained as registers change.
+    """
+
+    __slots__ = ('window', 'precision', 'buckets', 'latest', 'registers', 'inverse_sum', 'zeros')
+
+    def __init__(self, window, bucket, precision=DEFAULT_PRECISION):
+        self.window = window
+        self.precision = precision
+        self.buckets = [None] * window.buckets
+        self.latest = bucket
+        self._merge()
+
+    def expires_at(self):
+        return self.window.expires_at(self.latest)
+
+    def _merge(self):
+        size = 1 << self.precision
+        buckets = [bucket for bucket in self.buckets if bucket is not None]
+        if not buckets:
+            registers = bytearray(size)
+        elif len(buckets) == 1:
+            registers = bytearray(buckets[0])
+        else:
+            registers = bytearray(map(max, *buckets))
+
+        self.registers = registers
+        self.inverse_sum = sum(2.0 ** -register for register in registers)
+        self.zeros = registers.count('\x00')
+
+    def advance(self, bucket):
+        """
+        Moves the window forward to end at `bucket`, dropping the sketches that fall out of it.
+        Buckets before the latest bucket are treated as the latest bucket.
+        """
+        latest = self.latest
+        if bucket <= latest:
+            return
+
+        size = len(self.buckets)
+        expired = False
+        for i in xrange(latest + 1, min(bucket, latest + size) + 1):
+            i %= size
+            if self.buckets[i] is not None:
+                self.buckets[i] = None
+                expired = True
+
+        self.latest = bucket
+        if expired:
+            self._merge()
+
+    def add(self, value):
+        hashed = mix(hash(value))
+        index = hashed & ((1 << self.precision) - 1)
+        bits = 64 - self.precision
+        rank = bits - (hashed >> self.precision).bit_length() + 1
+
+        i = self.latest % len(self.buckets)
+        bucket = self.buckets[i]
+        if bucket is None:
+            bucket = self.buckets[i] = bytearray(1 << self.precision)
+
+        if rank > bucket[index]:
+            bucket[index] = rank
+
+        previous = self.registers[index]
+        if rank > previous:
+            self.registers[index] = rank
+            self.inverse_sum += 2.0 ** -rank - 2.0 ** -previous
+            if previous == 0:
+                self.zeros -= 1
+
+    def estimate(self):
+        size = 1 << self.precision
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / self.inverse_sum
+
+        # For small cardinalities, counting the empty registers is more accurate.
+        if estimate <= 2.5 * size and self.zeros:
+            return size * math.log(float(size) / self.zeros)
+
+        return estimate
+
+
+class BloomFilter(object):
+    """
+    A set of keys that can only be added to, in a fixed amount of memory: a key that was added is
+    always found in it, while a key that was not is found in it with a probability of about
+    `error_rate`, as long as no more than `capacity` keys were added.
+
+    Keys are hashed with `hash`, so a filter only makes sense within a single process.
+    """
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(float(self.size) / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __repr__(self):
+        return '<BloomFilter count=%r, capacity=%r, error_rate=%r>' % (
+            self.count, self.capacity, self.error_rate)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def memory(self):
+        return len(self._bits)
+
+    def _indexes(self, key):
+        # As in `get_cells`, the indexes are derived from the two halves of a single hash.
+        hashed = mix(hash(key))
+        first = hashed & 0xffffffff
+        second = (hashed >> 32) | 1
+        size = self.size
+        return [(first + i * second) % size for i in xrange(self.hashes)]
+
+    def add(self, key):
+        bits = self._bits
+        for index in self._indexes(key):
+            bits[index >> 3] |= 1 << (index & 7)
+
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        for index in self._indexes(key):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+
+        return True
@@ -0,0 +1,67 @@
+import pytest
+
+from stores.aggregate import AVERAGE, MAXIMUM, SUM, LocalAggregateStore
+from stores.windows import MaxRing, Window
+
+
+def test_max_ring():
+    window = Window(10, buckets=5)
+    ring = MaxRing(window, 0)
+    assert ring.total == float('-inf')
+
+    ring.add(3)
+    ring.advance(2)
+    ring.add(-1)
+    ring.add(1)
+    assert ring.total == 3
+
+    ring.advance(5)
+    assert ring.total == 1
+    ring.advance(100)
+    assert ring.total == float('-inf')
+
+
+def test_local_aggregate_store():
+    now = [0]
+    store = LocalAggregateStore(max_keys=2, clock=lambda: now[0])
+    window = Window(60)
+
+    for aggregate, expected in ((SUM, [1, 3, 6]), (AVERAGE, [1, 1.5, 2]), (MAXIMUM, [1, 2, 3])):
+        assert [store.add((aggregate, 'User/1'), value, window, aggregate) for value in (1, 2, 3)] == expected
+
+    assert len(store) == 2
+
+    now[0] += 60
+    assert store.add((SUM, 'User/1'), None, window, SUM) == 0
+
+    with pytest.raises(ValueError):
+        store.add(('Median', 'User/1'), 1, window, 'median')
+
+
+def test_local_aggregate_store_window_changed():
+    store = LocalAggregateStore(clock=lambda: 0)
+    key = ('Total', 'User/1')
+    assert store.add(key, 5, Window(60), SUM) == 5
+
+    # Under the same key, another window or aggregate does not pick up the values added before.
+    assert store.add(key, 3, Window(3600), MAXIMUM) == 3
+    assert store.add(key, 1, Window(3600), SUM) == 1
+    assert store.add(key, 1, Window(60), SUM) == 6
+
+
+def test_local_aggregate_store_sum_does_not_drift():
+    now = [0]
+    store = LocalAggregateStore(clock=lambda: now[0])
+    window = Window(10)
+
+    for _ in xrange(100):
+        for value in (0.1, 0.2, 0.7):
+            store.add(('Total', 'User/1'), value, window, SUM)
+        now[0] += 1
+
+    # Once the values all expire, one bucket at a time, the sum is exactly 0, with none of their
+    # rounding errors.
+    for _ in xrange(10):
+        total = store.add(('Total', 'User/1'), None, window, SUM)
+        now[0] += 1
+    assert total == 0
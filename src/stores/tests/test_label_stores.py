@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+import graph
+from stores.labels import (
+    BloomFilteredLabelStore, DictLabelStore, InternedLabelStore, WriteBehindLabelStore, get_id_key,
+)
+from stores.sketches import BloomFilter
+
+
+def test_interned_label_store():
+    store = InternedLabelStore()
+    store.set(u'User/1', 'banned', 'ADDED')
+    store.set(u'User/1', 'require_captcha', 'REMOVED')
+    store.set(u'User/01', 'banned', 'REMOVED')
+    store.set(u'Email/jhgg@jh.gg', 'banned', 'ADDED')
+    store.set(u'Email/ü@jh.gg', 'verified', 'ADDED')
+
+    assert store.get_many([u'User/1', u'User/01', u'User/2', u'Email/ü@jh.gg', u'Post/1']) == {
+        u'User/1': {'banned': 'ADDED', 'require_captcha': 'REMOVED'},
+        u'User/01': {'banned': 'REMOVED'},
+        u'Email/ü@jh.gg': {'verified': 'ADDED'},
+    }
+
+    store.set(u'User/1', 'banned', 'REMOVED')
+    store.set(u'User/1', 'require_captcha', None)
+    store.set(u'Email/jhgg@jh.gg', 'banned', None)
+    assert store.get_many([u'User/1', u'Email/jhgg@jh.gg']) == {u'User/1': {'banned': 'REMOVED'}}
+    assert len(store) == 3
+
+
+def test_id_keys():
+    assert get_id_key(u'12345') == 12345
+    assert get_id_key(u'0') == 0
+    assert get_id_key(u'012') == '012'
+    assert get_id_key(u'-1') == '-1'
+    assert get_id_key(u'ü') == u'ü'.encode('utf-8')
+
+
+def test_interned_label_store_snapshot(tmpdir):
+    store = InternedLabelStore()
+    for i in xrange(100):
+        store.set(u'User/%d' % i, 'banned', 'ADDED' if i % 2 else 'REMOVED')
+    store.set(u'Email/ü@jh.gg', 'verified', 'ADDED')
+    store.set(u'Email/ü@jh.gg', 'banned', 'ADDED')
+
+    path = str(tmpdir.join('labels.tsv'))
+    store.dump(path)
+
+    loaded = InternedLabelStore()
+    assert loaded.load(path) == 102
+    paths = [u'User/%d' % i for i in xrange(101)] + [u'Email/ü@jh.gg']
+    assert loaded.get_many(paths) == store.get_many(paths)
+
+
+def test_has_label_with_interned_label_store(monkeypatch, tmpdir):
+    path = tmpdir.join('labels.tsv')
+    path.write('User\t1\tbanned\tADDED\nIp\t10.0.0.1\tbanned\tADDED\n\n')
+
+    store = InternedLabelStore()
+    store.load(str(path))
+    monkeypatch.setattr('stores.labels.store', store)
+
+    plan = graph.build('\n'.join((
+        "User = Entity('User', JsonData('$.user'))",
+        "Ip = Entity('Ip', JsonData('$.ip'))",
+        "Banned = HasLabel.Added(User, 'banned') | HasLabel.Added(Ip, 'banned')",
+    )))
+
+    assert graph.execute(plan, {'user': 1}).data['Banned'] == True
+    assert graph.execute(plan, {'user': '1'}).data['Banned'] == True
+    assert graph.execute(plan, {'user': 2, 'ip': '10.0.0.1'}).data['Banned'] == True
+    assert graph.execute(plan, {'user': 2, 'ip': '10.0.0.2'}).data['Banned'] == False
+
+
+class CountingLabelStore(InternedLabelStore):
+    def __init__(self):
+        super(CountingLabelStore, self).__init__()
+        self.looked_up = []
+
+    def get_many(self, entity_paths):
+        self.looked_up.extend(entity_paths)
+        return super(CountingLabelStore, self).get_many(entity_paths)
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter(1000, error_rate=0.01)
+    for i in xrange(1000):
+        bloom_filter.add(u'User/%d' % i)
+
+    assert len(bloom_filter) == 1000
+    assert all(u'User/%d' % i in bloom_filter for i in xrange(1000))
+
+    false_positives = sum(1 for i in xrange(1000, 101000) if u'User/%d' % i in bloom_filter)
+    assert false_positives < 100000 * 0.02
+
+
+def test_bloom_filtered_label_store():
+    backing_store = CountingLabelStore()
+    backing_store.set(u'User/1', 'banned', 'ADDED')
+    backing_store.set(u'User/2', 'banned', 'REMOVED')
+
+    store = BloomFilteredLabelStore(backing_store)
+    assert store.get_many([u'User/%d' % i for i in xrange(1000)]) == {
+        u'User/1': {'banned': 'ADDED'},
+        u'User/2': {'banned': 'REMOVED'},
+    }
+    assert set([u'User/1', u'User/2']) <= set(backing_store.looked_up)
+    assert len(backing_store.looked_up) < 50
+
+    del backing_store.looked_up[:]
+    assert store.get_many([u'User/1000']) == {}
+    store.set(u'User/1000', 'spammer', 'ADDED')
+    assert store.get_many([u'User/1000']) == {u'User/1000': {'spammer': 'ADDED'}}
+
+
+def test_bloom_filtered_label_store_grows():
+    store = BloomFilteredLabelStore(InternedLabelStore())
+    capacity = store.filter.capacity
+
+    for i in xrange(capacity * 3):
+        store.set(u'User/%d' % i, 'banned', 'ADDED')
+
+    assert store.filter.capacity > capacity * 3
+    paths = [u'User/%d' % i for i in xrange(capacity * 3)]
+    assert len(store.get_many(paths)) == capacity * 3
+
+
+def test_bloom_filtered_label_store_grows_within_a_batch():
+    store = BloomFilteredLabelStore(InternedLabelStore())
+    capacity = store.filter.capacity
+
+    # A single batch fills the filter, which is rebuilt before the batch is written to the store.
+    paths = [u'User/%d' % i for i in xrange(capacity + 10)]
+    store.set_many((path, 'banned', 'ADDED') for path in paths)
+
+    assert store.filter.capacity > capacity
+    assert all(path in store.filter for path in paths)
+    assert len(store.get_many(paths)) == capacity + 10
+
+
+class SlowLabelStore(InternedLabelStore):
+    """
+    Blocks writing the labels of `User/slow` until `resume` is set.
+    """
+
+    def __init__(self):
+        super(SlowLabelStore, self).__init__()
+        self.writing = threading.Event()
+        self.resume = threading.Event()
+
+    def set_many(self, changes):
+        changes = list(changes)
+        if any(entity_path == u'User/slow' for entity_path, _, _ in changes):
+            self.writing.set()
+            self.resume.wait(10)
+
+        super(SlowLabelStore, self).set_many(changes)
+
+
+def test_bloom_filtered_label_store_concurrent_rebuild():
+    backing_store = SlowLabelStore()
+    store = BloomFilteredLabelStore(backing_store)
+    store.set_many((u'User/%d' % i, 'banned', 'ADDED') for i in xrange(store.filter.capacity - 1))
+
+    # The filter is full once `User/slow` is added to it, so the next entity rebuilds it, while
+    # the label of `User/slow` is being written.
+    slow = threading.Thread(target=store.set, args=(u'User/slow', 'banned', 'ADDED'))
+    slow.start()
+    backing_store.writing.wait(10)
+    rebuild = threading.Thread(target=store.set, args=(u'User/new', 'banned', 'ADDED'))
+    rebuild.start()
+    rebuild.join(0.1)
+    backing_store.resume.set()
+    slow.join()
+    rebuild.join()
+
+    assert store.get_many([u'User/slow', u'User/new']) == {
+        u'User/slow': {'banned': 'ADDED'},
+        u'User/new': {'banned': 'ADDED'},
+    }
+
+
+class RecordingLabelStore(DictLabelStore):
+    def __init__(self):
+        super(RecordingLabelStore, self).__init__({})
+        self.written = []
+
+    def set_many(self, changes):
+        self.written.append(changes)
+        super(RecordingLabelStore, self).set_many(changes)
+
+
+def test_write_behind_label_store_coalesces_changes():
+    backing_store = RecordingLabelStore()
+    backing_store.set(u'User/1', 'verified', 'ADDED')
+    store = WriteBehindLabelStore(backing_store, max_pending=4, clock=lambda: 0)
+
+    store.set(u'User/1', 'banned', 'ADDED')
+    store.set(u'User/1', 'banned', 'REMOVED')
+    store.set(u'User/1', 'verified', None)
+    store.set(u'User/2', 'banned', 'ADDED')
+    store.set(u'User/2', 'banned', None)
+
+    # The last change to each label wins, and they are only written to the backing store when flushed.
+    assert len(store) == 3
+    assert backing_store.written == []
+    assert store.get_many([u'User/1', u'User/2']) == {u'User/1': {'banned': 'REMOVED'}}
+    assert backing_store.get_many([u'User/1']) == {u'User/1': {'verified': 'ADDED'}}
+
+    store.set(u'User/3', 'banned', 'ADDED')
+    assert len(store) == 0
+    assert sorted(backing_store.written[0]) == [
+        (u'User/1', 'banned', 'REMOVED'),
+        (u'User/1', 'verified', None),
+        (u'User/2', 'banned', None),
+        (u'User/3', 'banned', 'ADDED'),
+    ]
+    assert store.get_many([u'User/1', u'User/3']) == {
+        u'User/1': {'banned': 'REMOVED'},
+        u'User/3': {'banned': 'ADDED'},
+    }
+
+    store.set(u'User/3', 'banned', 'REMOVED')
+    assert store.flush() == 1
+    assert store.flush() == 0
+    assert backing_store.labels[u'User/3'] == {'banned': 'REMOVED'}
+
+
+def test_write_behind_label_store_flushes_on_time():
+    now = [0]
+    backing_store = RecordingLabelStore()
+    store = WriteBehindLabelStore(backing_store, flush_interval=5, clock=lambda: now[0])
+
+    store.set(u'User/1', 'banned', 'ADDED')
+    now[0] = 4
+    store.set(u'User/2', 'banned', 'ADDED')
+    assert backing_store.written == []
+
+    # Lookups do not flush, only changes do.
+    now[0] = 5
+    assert store.get_many([u'User/1']) == {u'User/1': {'banned': 'ADDED'}}
+    assert backing_store.written == []
+
+    store.set(u'User/3', 'banned', 'ADDED')
+    assert len(backing_store.written[0]) == 3
+    assert store.flushes == 1
+
+
+class FailingLabelStore(RecordingLabelStore):
+    fail = True
+
+    def set_many(self, changes):
+        if self.fail:
+            raise IOError('The label store is down.')
+
+        super(FailingLabelStore, self).set_many(changes)
+
+
+def test_write_behind_label_store_failed_flush():
+    backing_store = FailingLabelStore()
+    store = WriteBehindLabelStore(backing_store, clock=lambda: 0)
+    store.set(u'User/1', 'banned', 'ADDED')
+    store.set(u'User/2', 'banned', 'ADDED')
+
+    with pytest.raises(IOError):
+        store.flush()
+
+    # The changes that failed to be written are pending again, under the changes made since.
+    store.set(u'User/2', 'banned', 'REMOVED')
+    assert len(store) == 2
+    assert store.get_many([u'User/1', u'User/2']) == {
+        u'User/1': {'banned': 'ADDED'},
+        u'User/2': {'banned': 'REMOVED'},
+    }
+
+    backing_store.fail = False
+    assert store.flush() == 2
+    assert backing_store.labels == {u'User/1': {'banned': 'ADDED'}, u'User/2': {'banned': 'REMOVED'}}
+
+
+def test_write_behind_label_store_reads_its_writes(monkeypatch):
+    backing_store = RecordingLabelStore()
+    store = WriteBehindLabelStore(backing_store, clock=lambda: 0)
+    monkeypatch.setattr('stores.labels.store', store)
+
+    plan = graph.build('''
+User = Entity('User', JsonData('$.user'))
+IsSpam = JsonData('$.spam') == True
+IsBanned = HasLabel.Added(User, 'banned')
+Spammer = Rule(when=[IsSpam], reason='Spam')
+
+WhenRules(
+    rules=[Spammer],
+    then=[Label.Add(User, 'banned')]
+)
+''')
+
+    result = graph.execute(plan, {'user': 1, 'spam': True})
+    assert result.data['IsBanned'] == False
+    store.apply(result.actions)
+
+    assert graph.execute(plan, {'user': 1}).data['IsBanned'] == True
+    assert graph.execute(plan, {'user': 2}).data['IsBanned'] == False
+    assert backing_store.written == []
+
+    store.flush()
+    assert backing_store.labels == {u'User/1': {'banned': 'ADDED'}}
+    assert graph.execute(plan, {'user': 1}).data['IsBanned'] == True
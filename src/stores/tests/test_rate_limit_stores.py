@@ -0,0 +1,198 @@
+import multiprocessing
+
+import pytest
+
+from stores.rate_limit import (
+    KeyValueRateLimitStore, LocalKeyValueClient, LocalRateLimitStore, SharedMemoryRateLimitStore,
+)
+from stores.shared_memory import SharedCounterTable
+from stores.windows import BucketRing, Window
+
+
+class Clock(object):
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_local_store(clock):
+    return LocalRateLimitStore(clock=clock)
+
+
+def make_key_value_store(clock):
+    return KeyValueRateLimitStore(LocalKeyValueClient(clock=clock, sweep_every=3), clock=clock)
+
+
+def make_shared_memory_store(clock):
+    return SharedMemoryRateLimitStore(capacity=1024, clock=clock)
+
+
+@pytest.fixture(params=[make_local_store, make_key_value_store, make_shared_memory_store])
+def store_and_clock(request):
+    clock = Clock()
+    return request.param(clock), clock
+
+
+def test_sliding_window(store_and_clock):
+    store, clock = store_and_clock
+    window = (Window(60),)
+
+    # One event every 10 seconds, the window always holds the last 6.
+    counts = []
+    for _ in xrange(10):
+        counts.append(store.increment(('Limit', u'User/1'), window)[0])
+        clock.now += 10
+
+    assert counts == [1, 2, 3, 4, 5, 6, 6, 6, 6, 6]
+
+    # Keys are counted independently.
+    assert store.increment(('Limit', u'User/2'), window)[0] == 1
+    assert store.increment(('Other', u'User/1'), window)[0] == 1
+
+    # Once idle for a whole window, a key starts from scratch.
+    clock.now += 60
+    assert store.increment(('Limit', u'User/1'), window)[0] == 1
+
+
+def test_multiple_windows(store_and_clock):
+    store, clock = store_and_clock
+    windows = (Window(60), Window(3600))
+
+    for _ in xrange(30):
+        counts = store.increment(('Limit', u'User/1'), windows)
+        clock.now += 10
+
+    assert counts == [6, 30]
+
+    # Windows can be counted separately, or added later.
+    assert store.increment(('Limit', u'User/1'), windows[1:]) == [31]
+    assert store.increment(('Limit', u'User/1'), (Window(86400),) + windows) == [1, 6, 32]
+
+
+def test_local_store_evicts_idle_keys():
+    clock = Clock()
+    store = LocalRateLimitStore(clock=clock)
+    minute, hour = (Window(60),), (Window(3600),)
+
+    for i in xrange(100):
+        store.increment(('Limit', i), minute)
+    store.increment(('Hourly', 0), hour)
+    assert len(store) == 101
+
+    clock.now += 61
+    store.increment(('Limit', 0), minute)
+    assert len(store) == 2
+
+    clock.now += 3600
+    store.increment(('Limit', 0), minute)
+    assert len(store) == 1
+
+
+def test_local_store_caps_keys():
+    store = LocalRateLimitStore(max_keys=10, clock=Clock())
+    window = (Window(60),)
+
+    for i in xrange(100):
+        store.increment(('Limit', i), window)
+
+    assert len(store) == 10
+    # The least recently counted keys were evicted.
+    assert store.increment(('Limit', 99), window)[0] == 2
+    assert store.increment(('Limit', 0), window)[0] == 1
+
+
+def test_local_key_value_client_expires_keys():
+    clock = Clock()
+    client = LocalKeyValueClient(clock=clock, sweep_every=2)
+
+    assert client.incr('a', ttl=10) == 1
+    assert client.incr('a', ttl=10) == 2
+    assert client.get_many(['a', 'b']) == [2, None]
+
+    clock.now += 10
+    assert client.get_many(['a']) == [None]
+
+    client.incr('b', ttl=10)
+    clock.now += 10
+    client.incr('c', ttl=10)
+    assert len(client) == 1
+
+
+def test_bucket_ring():
+    window = Window(10, buckets=5)
+    ring = BucketRing(window, 0, typecode='d')
+
+    ring.add(1.5)
+    ring.advance(2)
+    ring.add(2)
+    assert ring.total == 3.5
+
+    # Events in earlier buckets are counted in the latest.
+    ring.advance(1)
+    ring.add(1)
+    assert ring.total == 4.5
+
+    ring.advance(5)
+    assert ring.total == 3
+    ring.advance(100)
+    assert ring.total == 0
+    assert window.expires_at(100) == 210
+
+
+def test_shared_memory_store_is_shared_between_processes():
+    store = SharedMemoryRateLimitStore(capacity=1024)
+    windows = (Window(3600), Window(86400))
+
+    def count(times):
+        for _ in xrange(times):
+            store.increment(('Limit', u'User/1'), windows)
+
+    processes = [multiprocessing.Process(target=count, args=(100,)) for _ in xrange(4)]
+    for process in processes:
+        process.start()
+    count(100)
+    for process in processes:
+        process.join()
+
+    assert store.increment(('Limit', u'User/1'), windows) == [501, 501]
+    assert store.increment(('Limit', u'User/2'), windows) == [1, 1]
+
+
+def test_shared_memory_store_reuses_slots():
+    clock = Clock()
+    # Two regions of four slots each.
+    store = SharedMemoryRateLimitStore(capacity=8, regions=2, clock=clock)
+    window = (Window(60),)
+
+    for i in xrange(8):
+        assert store.increment(('Limit', i), window) == [1]
+
+    # Once the table is full, the least recently counted key of the region starts over.
+    clock.now += 1
+    assert store.increment(('Limit', 8), window) == [1]
+    assert store.increment(('Limit', 8), window) == [2]
+
+    # Once the keys expire, their slots are reused.
+    clock.now += 120
+    assert [store.increment(('Other', i), window) for i in xrange(8)] == [[1]] * 8
+
+    with pytest.raises(ValueError):
+        store.increment(('Limit', 1), (Window(60, buckets=60),))
+
+
+def test_shared_counter_table_evicts_least_recently_counted():
+    # A single region of four slots.
+    table = SharedCounterTable(capacity=4, regions=1)
+    minute, day = Window(60), Window(86400)
+
+    for i in xrange(3):
+        table.increment(('PerDay', i), day, 0)
+    assert table.increment(('PerMinute', 'hot'), minute, 0) == 1
+    assert table.increment(('PerMinute', 'hot'), minute, 50) == 2
+
+    # The key counted just now is kept, even though its window ends first, rather than one of
+    # the idle keys.
+    assert table.increment(('PerDay', 3), day, 55) == 1
+    assert table.increment(('PerMinute', 'hot'), minute, 56) == 3
@@ -0,0 +1,94 @@
+import random
+
+from stores.rate_limit import CountMinSketchRateLimitStore
+from stores.sketches import WindowedCountMinSketch, WindowedHyperLogLog, get_error_bounds
+from stores.windows import Window
+
+
+def test_count_min_sketch_never_underestimates():
+    random.seed(0)
+    sketch = WindowedCountMinSketch(Window(60), width=256, depth=4)
+    sketch.advance(0)
+
+    exact = {}
+    for _ in xrange(5000):
+        key = ('Limit', u'Ip/10.0.%d.%d' % (random.randint(0, 3), random.randint(0, 255)))
+        exact[key] = exact.get(key, 0) + 1
+        estimate = sketch.increment(key)
+        assert estimate >= exact[key]
+
+    epsilon, _ = get_error_bounds(256, 4)
+    overestimated = sum(
+        1 for key, count in exact.iteritems()
+        if sketch.increment(key) - (count + 1) > epsilon * 5000
+    )
+    assert overestimated < len(exact) * 0.05
+
+
+def test_count_min_sketch_window():
+    window = Window(60)
+    sketch = WindowedCountMinSketch(window, width=64, depth=2)
+    memory = sketch.memory
+
+    counts = []
+    for second in xrange(0, 100, 10):
+        sketch.advance(window.bucket_of(second))
+        counts.append(sketch.increment('key'))
+
+    assert counts == [1, 2, 3, 4, 5, 6, 6, 6, 6, 6]
+
+    sketch.advance(window.bucket_of(1000))
+    assert sketch.increment('key') == 1
+    assert sketch.memory == memory == 10 * 64 * 2 * 4
+
+
+def test_count_min_sketch_store():
+    now = [0]
+    store = CountMinSketchRateLimitStore(width=64, depth=2, clock=lambda: now[0])
+    windows = (Window(60), Window(3600))
+
+    for i in xrange(1000):
+        store.increment(('Limit', i), windows)
+
+    assert store.memory == 2 * 10 * 64 * 2 * 4
+    # Counts are never underestimated, and overestimated by at most epsilon of the 1001 counted.
+    epsilon, _ = get_error_bounds(64, 2)
+    counts = store.increment(('Limit', 0), windows)
+    assert len(counts) == 2
+    assert all(2 <= count <= 2 + epsilon * 1001 for count in counts)
+
+    now[0] += 3600
+    assert store.increment(('Limit', 0), windows) == [1, 1]
+
+
+def test_hyper_log_log_accuracy():
+    window = Window(60)
+    sketch = WindowedHyperLogLog(window, 0, precision=10)
+    assert sketch.estimate() == 0
+
+    for cardinality in (1, 10, 100, 1000, 10000, 100000):
+        for i in xrange(cardinality):
+            sketch.add(i)
+            sketch.add(i)
+
+        assert abs(sketch.estimate() - cardinality) <= cardinality * 0.1
+        sketch = WindowedHyperLogLog(window, 0, precision=10)
+
+
+def test_hyper_log_log_window():
+    window = Window(60)
+    sketch = WindowedHyperLogLog(window, 0, precision=12)
+
+    # A new value every 10 seconds, the window always holds the last 6.
+    estimates = []
+    for second in xrange(0, 200, 10):
+        sketch.advance(window.bucket_of(second))
+        sketch.add(u'user%d@jh.gg' % second)
+        estimates.append(int(round(sketch.estimate())))
+
+    assert estimates == [1, 2, 3, 4, 5, 6] + [6] * 14
+    assert sum(1 for bucket in sketch.buckets if bucket is not None) == 6
+
+    sketch.advance(window.bucket_of(1000))
+    assert sketch.estimate() == 0
+    assert sketch.expires_at() == window.expires_at(window.bucket_of(1000))
@@ -0,0 +1,226 @@
+from array import array
+from collections import OrderedDict
+from itertools import izip
+
+# The number of buckets a window is divided into, by default. A sliding window then counts the
+# events of the last `seconds`, to within `seconds / DEFAULT_BUCKETS`.
+DEFAULT_BUCKETS = 10
+
+# The maximum of a bucket no value was added to.
+NO_MAXIMUM = float('-inf')
+
+
+class Window(object):
+    """
+    A sliding window of time, `seconds` long, divided into `buckets` buckets of equal width.
+
+    Timestamps are mapped to the index of the bucket they fall in. The window ending at a
+    timestamp is the last `buckets` buckets, up to and including the bucket of the timestamp.
+    """
+
+    def __init__(self, seconds, buckets=DEFAULT_BUCKETS):
+        self.seconds = seconds
+        self.buckets = buckets
+        self.width = float(seconds) / buckets
+
+    def __repr__(self):
+        return '<Window seconds=%r, buckets=%r>' % (self.seconds, self.buckets)
+
+    def __eq__(self, other):
+        return isinstance(other, Window) and (self.seconds, self.buckets) == (other.seconds, other.buckets)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.seconds, self.buckets))
+
+    def bucket_of(self, timestamp):
+        return int(timestamp // self.width)
+
+    def expires_at(self, bucket):
+        """
+        The timestamp from which the events in `bucket` are no longer within the window.
+        """
+        return (bucket + self.buckets) * self.width
+
+
+class BucketRing(object):
+    """
+    The values of the buckets of a sliding window, kept in a fixed size array used as a ring
+    buffer, along with their total, so that adding to the latest bucket and getting the total
+    over the window are both O(1) (amortized over the buckets that are expired).
+
+    `typecode` is the `array` typecode of the values, e.g. 'l' for counts, or 'd' for sums.
+    """
+
+    __slots__ = ('values', 'latest', 'total')
+
+    def __init__(self, window, bucket, typecode='l'):
+        self.values = array(typecode, [0]) * window.buckets
+        self.latest = bucket
+        self.total = self.values[0]
+
+    def advance(self, bucket):
+        """
+        Moves the window forward to end at `bucket`, expiring the buckets that fall out of it.
+        Buckets before the latest bucket are treated as the latest bucket.
+        """
+        latest = self.latest
+        if bucket <= latest:
+            return
+
+        values = self.values
+        size = len(values)
+        if bucket - latest >= size:
+            for i in xrange(size):
+                values[i] = 0
+            self.total = values[0]
+        elif values.typecode == 'd':
+            for expired in xrange(latest + 1, bucket + 1):
+                values[expired % size] = 0
+
+            # Subtracting the expired floats would leave their rounding errors in the total, to
+            # add up for as long as the key is counted, so it is summed again instead.
+            self.total = sum(values)
+        else:
+            for expired in xrange(latest + 1, bucket + 1):
+                i = expired % size
+                self.total -= values[i]
+                values[i] = 0
+
+        self.latest = bucket
+
+    def add(self, value):
+        self.values[self.latest % len(self.values)] += value
+        self.total += value
+
+
+class MaxRing(BucketRing):
+    """
+    The maximum value of each bucket of a sliding window, in a ring buffer like `BucketRing`, with
+    `total` being the maximum over the window (or -inf, if no value was added within it).
+    """
+
+    __slots__ = ()
+
+    def __init__(self, window, bucket):
+        self.values = array('d', [NO_MAXIMUM]) * window.buckets
+        self.latest = bucket
+
+    @property
+    def total(self):
+        return max(self.values)
+
+    def advance(self, bucket):
+        latest = self.latest
+        if bucket <= latest:
+            return
+
+        values = self.values
+        size = len(values)
+        for expired in xrange(latest + 1, min(bucket, latest + size) + 1):
+            values[expired % size] = NO_MAXIMUM
+
+        self.latest = bucket
+
+    def add(self, value):
+        i = self.latest % len(self.values)
+        if value > self.values[i]:
+            self.values[i] = value
+
+
+class WindowedRings(object):
+    """
+    The bucket rings of a single key, for each of several windows (e.g. the last minute, hour and
+    day), so that one update reaches all of them, and their totals are read at once.
+    """
+
+    __slots__ = ('windows', 'rings', 'typecode')
+
+    def __init__(self, typecode='l'):
+        self.windows = ()
+        self.rings = ()
+        self.typecode = typecode
+
+    def add(self, windows, timestamp, value):
+        """
+        Adds `value` at `timestamp` to the ring of each of `windows`, returning their totals, in
+        the order of `windows`.
+        """
+        if windows is not self.windows and windows != self.windows:
+            totals = [self._add(window, timestamp, value) for window in windows]
+            if self.windows == windows:
+                self.windows = windows
+            return totals
+
+        totals = []
+        for window, ring in izip(windows, self.rings):
+            ring.advance(window.bucket_of(timestamp))
+            ring.add(value)
+            totals.append(ring.total)
+
+        return totals
+
+    def _add(self, window, timestamp, value):
+        bucket = window.bucket_of(timestamp)
+        if window in self.windows:
+            ring = self.rings[self.windows.index(window)]
+            ring.advance(bucket)
+        else:
+            ring = BucketRing(window, bucket, self.typecode)
+            self.windows += (window,)
+            self.rings += (ring,)
+
+        ring.add(value)
+        return ring.total
+
+    def expires_at(self):
+        """
+        The timestamp from which every value added so far is out of its window.
+        """
+        return max(window.expires_at(ring.latest) for window, ring in izip(self.windows, self.rings))
+
+
+class ExpiringKeys(object):
+    """
+    The windowed values of keys (e.g. `WindowedRings`, which must implement `expires_at`), kept
+    from the least to the most recently updated.
+
+    Keys are evicted once all of their values fall out of their windows, and the least recently
+    updated keys are evicted when there are more than `max_keys`, so that memory stays bounded.
+    This is not thread safe.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._values = OrderedDict()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return self._values.iteritems()
+
+    def update(self, key, create):
+        """
+        Returns the value of `key` (or a new one, from `create()`), marking it as the most
+        recently updated. Call `evict` once it is updated.
+        """
+        values = self._values
+        value = values.pop(key, None)
+        if value is None:
+            value = create()
+
+        values[key] = value
+        return value
+
+    def evict(self, now):
+        values = self._values
+        while values:
+            value = values[next(iter(values))]
+            if len(values) <= self.max_keys and value.expires_at() > now:
+                # As this is the least recently updated key, the rest are likely not expired either.
+                break
+
+            values.popitem(last=False)
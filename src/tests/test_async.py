@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+import graph
+import harness
+from futures import Future
+from node import AnonymousNode, BaseNode
+from utils import expect
+
+
+class Lookup(AnonymousNode):
+    """
+    A stand-in for a node which looks up its value in a remote service.
+    """
+
+    delay = 0.2
+
+    def __init__(self, key, table):
+        self.key = expect(BaseNode, key)
+        self.table = table
+
+    def get_dependent_nodes(self):
+        return [self.key]
+
+    def resolve(self, key):
+        time.sleep(self.delay)
+        return self.lookup(key)
+
+    def resolve_async(self, key):
+        future = Future()
+
+        def respond():
+            try:
+                future.set_result(self.lookup(key))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Timer(self.delay, respond).start()
+        return future
+
+    def lookup(self, key):
+        return self.table[key]
+
+
+def GeoIp(ip):
+    return Lookup(ip, {'1.1.1.1': 'AU', '8.8.8.8': 'US'})
+
+
+def IpReputation(ip):
+    return Lookup(ip, {'1.1.1.1': 0.9, '8.8.8.8': 0.1})
+
+
+def EmailReputation(email):
+    return Lookup(email, {'foo@jh.gg': 0.2})
+
+
+CODE = '''
+    Ip = JsonData('$.ip')
+    Email = JsonData('$.email')
+    Country = GeoIp(Ip)
+    IpScore = IpReputation(Ip)
+    EmailScore = EmailReputation(Email)
+    IsSuspicious = Rule(when=[Country == 'AU', IpScore < 0.5, EmailScore > 0.5], reason='Sus')
+'''
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'GeoIp', GeoIp)
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'IpReputation', IpReputation)
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'EmailReputation', EmailReputation)
+
+
+def test_execute_async(lookups):
+    plan = harness.build(CODE)
+    data = {'ip': '1.1.1.1', 'email': 'foo@jh.gg'}
+
+    start = time.time()
+    result = graph.execute_async(plan, data).result(timeout=5)
+    elapsed = time.time() - start
+
+    assert result.data == harness.execute(plan, data).data
+    assert result.data == {
+        'Ip': '1.1.1.1',
+        'Email': 'foo@jh.gg',
+        'Country': 'AU',
+        'IpScore': 0.9,
+        'EmailScore': 0.2,
+        'IsSuspicious': True,
+    }
+
+    # The three lookups should have been in flight at the same time.
+    assert elapsed < Lookup.delay * 2
+
+
+def test_execute_async_skips_none(lookups):
+    plan = harness.build(CODE)
+    result = graph.execute_async(plan, {'ip': '8.8.8.8'}).result(timeout=5)
+
+    assert result.data['EmailScore'] is None
+    assert result.data['Country'] == 'US'
+    assert result.data['IsSuspicious'] == True
+
+
+def test_execute_async_failure(lookups):
+    plan = harness.build(CODE)
+    future = graph.execute_async(plan, {'ip': '8.8.8.8', 'email': 'unknown@jh.gg'})
+
+    with pytest.raises(KeyError):
+        future.result(timeout=5)
+
+
+def test_execute_async_without_async_nodes():
+    plan = harness.build('''
+        A = JsonData('$.a')
+        B = A == 1
+        C = Coalesce(None, B)
+    ''')
+
+    future = graph.execute_async(plan, {'a': 1})
+    assert future.done()
+    assert future.result().data == {'A': 1, 'B': True, 'C': True}
+
+
+class BlockingLookup(Lookup):
+    """
+    A stand-in for a node which looks up its value with a client that only has a blocking API.
+    """
+
+    blocking = True
+    resolve_async = None
+
+
+def test_execute_blocking_nodes(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'GeoIp', lambda ip: BlockingLookup(ip, {'1.1.1.1': 'AU'}))
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'IpReputation', lambda ip: BlockingLookup(ip, {'1.1.1.1': 0.9}))
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'EmailReputation', lambda email: BlockingLookup(email, {}))
+
+    plan = harness.build(CODE)
+    assert plan.blocking
+    assert not plan.select(['Ip']).blocking
+
+    start = time.time()
+    result = graph.execute(plan, {'ip': '1.1.1.1'})
+    elapsed = time.time() - start
+
+    assert result.data['Country'] == 'AU'
+    assert result.data['IpScore'] == 0.9
+    assert result.data['EmailScore'] is None
+    assert result.data['IsSuspicious'] == True
+
+    # Both lookups should have been waited on at the same time.
+    assert elapsed < BlockingLookup.delay * 2
+
+    start = time.time()
+    batch = graph.execute_many(plan, [{'ip': '1.1.1.1'}] * 4)
+    assert time.time() - start < BlockingLookup.delay * 4
+    assert [result.data['Country'] for result in batch] == ['AU'] * 4
+
+    with pytest.raises(KeyError):
+        graph.execute(plan, {'ip': '8.8.8.8'})
+
+
+@pytest.mark.parametrize('lookup', [Lookup, BlockingLookup])
+def test_execute_async_lookups_behind_rule(monkeypatch, lookup):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'Lookup', lambda key: lookup(key, {'foo': 1}))
+    plan = harness.build('''
+        Key = JsonData('$.key')
+        R = Rule(when=[Lookup(Key) == 2, Lookup(Key) == 3, Lookup(Key) == 4], reason='R')
+    ''')
+    # The lookups only feed the rule, yet they are not deferred, so that they are in flight at
+    # the same time, rather than resolved one after another by the rule.
+    assert plan.blocking == (lookup is BlockingLookup)
+
+    start = time.time()
+    assert graph.execute_async(plan, {'key': 'foo'}).result(timeout=5).data['R'] == False
+    assert time.time() - start < Lookup.delay * 2
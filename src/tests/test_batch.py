@@ -0,0 +1,106 @@
+import graph
+import harness
+from graph import execute_many
+from node import InvertNode
+from nodes.entity import EntityRef
+
+CODE = '''
+    A = JsonData('$.a')
+    B = JsonData('$.b')
+    User = Entity('User', JsonData('$.user'))
+
+    AEqB = A == B
+    ANeB = A != B
+    AGt1 = A > 1
+    NotA = ~A
+    AOrB = A | B
+    AAndB = A & B
+    FirstOf = Coalesce(A, B, 'default')
+    AInList = A.in_([1, 2, 3])
+    List = [A, B]
+    IsUser = User == 'jhgg'
+
+    R = Rule(when=[AGt1, IsUser], reason='A > 1 or jhgg')
+
+    WhenRules(
+        rules=[R],
+        then=[
+            Label.Add(User, 'bad_user')
+        ]
+    )
+'''
+
+EVENTS = [
+    {},
+    {'a': 1},
+    {'b': 2},
+    {'a': 2, 'b': 2, 'user': 'other'},
+    {'a': 0, 'b': None, 'user': 'jhgg'},
+    {'a': None, 'b': 3, 'user': 'other'},
+    {'a': 5, 'user': 'jhgg'},
+]
+
+
+def test_execute_many_matches_execute():
+    plan = harness.build(CODE)
+
+    batch_results = execute_many(plan, EVENTS)
+    assert len(batch_results) == len(EVENTS)
+
+    for event, batch_result in zip(EVENTS, batch_results):
+        result = harness.execute(plan, event)
+        assert batch_result.data == result.data
+        assert [(a.entity, a.label, a.status, a.rules_with_reasons) for a in batch_result.actions] == \
+            [(a.entity, a.label, a.status, a.rules_with_reasons) for a in result.actions]
+
+
+def test_execute_many_actions():
+    plan = harness.build(CODE)
+    results = execute_many(plan, EVENTS)
+
+    assert [len(result.actions) for result in results] == [0, 0, 0, 1, 1, 0, 1]
+    assert results[4].actions[0].entity == EntityRef('User', 'jhgg')
+    assert results[6].actions[0].rules_with_reasons == {'R': 'A > 1 or jhgg'}
+
+
+def test_execute_many_empty_batch():
+    plan = harness.build(CODE)
+    assert execute_many(plan, []) == []
+
+
+def test_execute_many_no_outputs():
+    plan = harness.build('''
+        WhenRules(
+            rules=[],
+            then=[]
+        )
+    ''')
+
+    results = execute_many(plan, [{}, {}])
+    assert [(r.data, r.actions) for r in results] == [({}, []), ({}, [])]
+
+
+def test_execute_many_rate_limit():
+    plan = harness.build('''
+        User = Entity('User', JsonData('$.user'))
+        Limited = RateLimit(by=User, max=2, per=Interval.Minutes(1))
+    ''')
+
+    results = execute_many(plan, [{'user': 1}, {'user': 1}, {'user': 2}, {'user': 1}])
+    assert [r.data['Limited'] for r in results] == [False, False, False, True]
+
+
+class Double(InvertNode):
+    def resolve(self, a):
+        return a * 2
+
+
+def test_execute_many_overridden_resolve(monkeypatch):
+    # `Double` inherits the `resolve_many` of `InvertNode`, which does not resolve it.
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'Double', Double)
+    plan = harness.build('''
+        Doubled = Double(JsonData('$.a'))
+    ''')
+
+    results = execute_many(plan, [{'a': 1}, {'a': 0}, {}])
+    assert [r.data['Doubled'] for r in results] == [2, 0, None]
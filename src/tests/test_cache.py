@@ -0,0 +1,32 @@
+from cache import LRUCache, MISSING
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', None)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+    cache.put('c', 3)
+    cache.get('c')
+    assert cache.get('a') is MISSING
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    cache.discard('b')
+    assert cache.get('b') is MISSING
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_lru_cache_ttl():
+    now = [0]
+    cache = LRUCache(10, ttl=5, clock=lambda: now[0])
+    cache.put('a', 1)
+
+    now[0] += 4
+    assert cache.get('a') == 1
+    now[0] += 1
+    assert cache.get('a') is MISSING
+    assert len(cache) == 0
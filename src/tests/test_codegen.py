@@ -0,0 +1,128 @@
+import random
+
+import pytest
+
+import codegen
+import graph
+import harness
+from node import InvertNode
+from stores import rate_limit as rate_limit_stores
+
+CODE = '''
+    Action = JsonData('$.action')
+    User = Entity('User', JsonData('$.user.id'))
+    Email = Entity('Email', JsonData('$.user.email'))
+    Ip = JsonData('$.ip')
+    Length = JsonData('$.post.length')
+    Topic = JsonData('$.post.topic')
+    Tags = JsonData('$.post.tags[*]')
+    Nickname = Coalesce(JsonData('$.user.nickname'), JsonData('$.user.name'), 'anonymous')
+
+    IsPost = Action == 'post'
+    IsLong = Length > 5000
+    IsShort = Length <= 10
+    IsSpammyTopic = Topic.in_(['deals', 'free money'])
+    IsBlockedIp = Ip.in_(['10.0.0.1', '10.0.0.2'])
+    NoEmail = Email == None
+    NotPost = ~IsPost
+    Banned = HasLabel.Added(User, 'banned')
+    PostFlood = RateLimit(by=User, max=2, per=Interval.Minutes(1), where=[IsPost])
+    IsWeird = Weird(Topic)
+
+    SpamRule = Rule(when=[IsPost & IsSpammyTopic, IsBlockedIp], reason='Spam')
+    WeirdRule = Rule(when=[IsPost & (IsLong | IsShort), IsWeird], reason='Weird')
+    FloodRule = Rule(when=[Banned, PostFlood], reason='Flood')
+    AnyRule = Rule(when=[SpamRule, WeirdRule, NoEmail & NotPost], reason='Any')
+
+    WhenRules(
+        rules=[SpamRule, FloodRule],
+        then=[Label.Add(User, 'spammer')]
+    )
+'''
+
+
+class Weird(InvertNode):
+    """
+    A node that is not inlined, and is only resolved lazily.
+    """
+
+    resolved = 0
+
+    def resolve(self, value):
+        Weird.resolved += 1
+        return value == 'weird'
+
+
+def generate_event(i):
+    event = {
+        'action': random.choice(['post', 'login', None]),
+        'user': {
+            'id': random.choice([1, 2, 3]),
+            'email': random.choice(['foo@jh.gg', None]),
+            'name': random.choice(['jhgg', None]),
+        },
+        'ip': random.choice(['10.0.0.1', '10.0.0.3', [1]]),
+        'post': {
+            'length': random.choice([0, 100, 6000, None]),
+            'topic': random.choice(['deals', 'hello', 'weird', None]),
+            'tags': random.choice([['a', 'b'], []]),
+        },
+    }
+    if i % 7 == 0:
+        del event['post']
+
+    return event
+
+
+@pytest.fixture
+def plan(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'Weird', Weird)
+    monkeypatch.setattr(Weird, 'resolved', 0)
+    return harness.build(CODE)
+
+
+def test_compiled_plan_matches_interpreter(monkeypatch, plan, label_store):
+    label_store.labels[u'User/2'] = {'banned': 'ADDED'}
+    random.seed(0)
+    events = [generate_event(i) for i in xrange(500)] + [None, {}, {'user': 5}]
+
+    compiled = codegen.compile_plan(plan)
+    assert '==' in compiled.source
+
+    # Rate limits count every event, so each executor counts with its own store.
+    expected = [graph.execute(plan, event) for event in events]
+    resolved = Weird.resolved
+
+    monkeypatch.setattr(rate_limit_stores, 'store', rate_limit_stores.LocalRateLimitStore())
+    results = [compiled.execute(event) for event in events]
+
+    # Lazy nodes resolved the same operands.
+    assert 0 < resolved < len(events)
+    assert Weird.resolved == 2 * resolved
+    for result, expected_result in zip(results, expected):
+        assert result.data == expected_result.data
+        assert [type(value) for value in result.data.values()] == \
+            [type(value) for value in expected_result.data.values()]
+        assert [(action.entity, action.label) for action in result.actions] == \
+            [(action.entity, action.label) for action in expected_result.actions]
+
+
+def test_compiled_plan_selects_outputs(plan):
+    compiled = codegen.compile_plan(plan, outputs=['IsPost', 'Nickname'], actions=False)
+    result = compiled.execute({'action': 'post', 'user': {'name': 'jhgg'}})
+
+    assert result.data == {'IsPost': True, 'Nickname': 'jhgg'}
+    assert result.actions == []
+    assert 'force_' not in compiled.source
+
+
+def test_compiled_plan_inlines_constants():
+    plan = harness.build('''
+        Inf = JsonData('$.a') < 1e400
+        Always = Rule(when=[1 < 2], reason='Always')
+        Never = (JsonData('$.a') == None) & False
+    ''')
+    compiled = codegen.compile_plan(plan)
+
+    assert compiled.execute({'a': 1}).data == {'Inf': True, 'Always': True, 'Never': False}
+    assert compiled.execute({}).data == graph.execute(plan, {}).data
@@ -0,0 +1,174 @@
+import pytest
+
+import codegen
+import graph
+import harness
+from node import AnonymousNode, BaseNode
+from utils import expect
+
+
+class Counted(AnonymousNode):
+    """
+    Resolves to the value of the provided node, counting how many times it was resolved.
+    """
+
+    resolved = 0
+
+    def __init__(self, node):
+        self.node = expect(BaseNode, node)
+
+    def get_dependent_nodes(self):
+        return [self.node]
+
+    def resolve(self, value):
+        Counted.resolved += 1
+        return value
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'Counted', Counted)
+    monkeypatch.setattr(Counted, 'resolved', 0)
+
+
+def execute_all(plan, data):
+    """
+    Executes the plan with each executor, checking they all agree, and returning how many
+    times `Counted` nodes were resolved by each.
+    """
+    counts = []
+    results = []
+
+    for executor in (
+        lambda: graph.execute(plan, data),
+        lambda: graph.execute_many(plan, [data])[0],
+        lambda: graph.execute_async(plan, data).result(timeout=5),
+    ):
+        Counted.resolved = 0
+        results.append(executor().data)
+        counts.append(Counted.resolved)
+
+    assert results[0] == results[1] == results[2]
+    return results[0], counts
+
+
+def test_rule_short_circuits(counted):
+    plan = harness.build('''
+        A = JsonData('$.a')
+        R = Rule(when=[A == 1, Counted(A == 2)], reason='R')
+    ''')
+
+    data, counts = execute_all(plan, {'a': 1})
+    assert data['R'] == True
+    assert counts == [0, 0, 0]
+
+    data, counts = execute_all(plan, {'a': 2})
+    assert data['R'] == True
+    assert counts == [1, 1, 1]
+
+
+def test_coalesce_short_circuits(counted):
+    plan = harness.build('''
+        A = JsonData('$.a')
+        C = Coalesce(A, Counted(1))
+    ''')
+
+    data, counts = execute_all(plan, {'a': 5})
+    assert data['C'] == 5
+    assert counts == [0, 0, 0]
+
+    data, counts = execute_all(plan, {})
+    assert data['C'] == 1
+    assert counts == [1, 1, 1]
+
+
+@pytest.mark.parametrize('code, data, expected, count', [
+    ('X = A | Counted(True)', {'a': True}, True, 0),
+    ('X = A | Counted(True)', {'a': False}, True, 1),
+    # `Counted(None)` resolves to None without being called.
+    ('X = A | Counted(None)', {}, None, 0),
+    ('X = A & Counted(True)', {'a': False}, False, 0),
+    ('X = A & Counted(True)', {'a': True}, True, 1),
+    # `a` being None still needs `b`, to tell apart None & None from None & True.
+    ('X = A & Counted(None)', {}, None, 0),
+    ('X = A & Counted(True)', {}, False, 1),
+])
+def test_and_or_short_circuits(counted, code, data, expected, count):
+    plan = harness.build('''
+        A = JsonData('$.a')
+    ''' + code)
+
+    result, counts = execute_all(plan, data)
+    assert result['X'] == expected
+    assert counts == [count] * 3
+
+
+def test_named_operands_are_resolved(counted):
+    plan = harness.build('''
+        A = JsonData('$.a')
+        B = Counted(A == 2)
+        R = Rule(when=[A == 1, B], reason='R')
+    ''')
+
+    data, counts = execute_all(plan, {'a': 1})
+    assert data == {'A': 1, 'B': False, 'R': True}
+    assert counts == [1, 1, 1]
+
+
+def test_nested_lazy_operands(counted):
+    plan = harness.build('''
+        A = JsonData('$.a')
+        R = Rule(when=[A == 1, Rule(when=[Counted(A == 2), Counted(A == 3)], reason='Inner')], reason='R')
+    ''')
+
+    data, counts = execute_all(plan, {'a': 1})
+    assert data['R'] == True
+    assert counts == [0, 0, 0]
+
+    data, counts = execute_all(plan, {'a': 2})
+    assert data['R'] == True
+    assert counts == [1, 1, 1]
+
+    data, counts = execute_all(plan, {'a': 4})
+    assert data['R'] == False
+    assert counts == [2, 2, 2]
+
+
+def test_rate_limit_behind_guard():
+    plan = harness.build('''
+        User = Entity('User', 1)
+        IsPost = JsonData('$.action') == 'post'
+        R = Rule(when=[IsPost & RateLimit(by=User, max=1, per=Interval.Minutes(1))], reason='R')
+    ''')
+
+    for _ in xrange(5):
+        assert harness.execute(plan, {'action': 'login'}).data['R'] == False
+
+    assert harness.execute(plan, {'action': 'post'}).data['R'] == False
+    assert harness.execute(plan, {'action': 'post'}).data['R'] == True
+
+
+def test_rule_none_semantics():
+    data = harness.run('''
+        A = JsonData('$.a')
+        B = JsonData('$.b')
+        AllNone = Rule(when=[A, B], reason='AllNone')
+        Empty = Rule(when=[], reason='Empty')
+        Lazy = Rule(when=[A == None, A == 2], reason='Lazy')
+    ''')
+
+    assert data == {'A': None, 'B': None, 'AllNone': None, 'Empty': False, 'Lazy': False}
+
+
+def test_deep_lazy_rule_chain():
+    code = ['A = JsonData("$.a")', 'R0 = Rule(when=[A == 1], reason="R0")']
+    for i in xrange(1, 2000):
+        code.append('R%d = Rule(when=[R%d], reason="R%d")' % (i, i - 1, i))
+
+    # Only the last rule is selected, so every rule before it is deferred, and forced by the next.
+    plan = harness.build('\n'.join(code)).select(['R1999'])
+    for data, expected in (({'a': 1}, True), ({'a': 2}, False)):
+        assert graph.execute(plan, data).data == {'R1999': expected}
+        assert graph.execute_many(plan, [data])[0].data == {'R1999': expected}
+        assert graph.execute_async(plan, data).result(timeout=5).data == {'R1999': expected}
+        assert codegen.compile_plan(plan).execute(data).data == {'R1999': expected}
@@ -0,0 +1,332 @@
+import pytest
+
+import graph
+import harness
+from plan import DATA_SLOT, ExecutionPlan, get_resolve_cache, topological_order
+from literals import Literal
+from node import InvertNode, NamedNode
+from nodes.data import Data, JsonData
+from nodes.entity import EntityRef
+
+
+def test_plan_is_topologically_ordered():
+    plan = harness.build('''
+        A = JsonData('$.a')
+        B = A == 1
+        C = ~B
+        D = Rule(when=[B, C], reason='D')
+    ''')
+
+    assert plan.nodes[DATA_SLOT] is Data
+
+    for step in plan.steps:
+        assert all(arg_slot < step.slot for arg_slot in step.arg_slots)
+
+    assert sorted(name for name, _ in plan.outputs) == ['A', 'B', 'C', 'D']
+
+
+def test_plan_deep_chain():
+    node = JsonData(Literal.String('$.a'))
+    for _ in xrange(5000):
+        node = InvertNode(node)
+
+    plan = ExecutionPlan({NamedNode('Deep', node): set()})
+    assert len(plan) == 5002
+
+    assert harness.execute(plan, {'a': True}).data == {'Deep': True}
+
+
+def test_plan_executes_many_events():
+    plan = harness.build('''
+        A = JsonData('$.a')
+        B = A == 1
+    ''')
+
+    assert harness.execute(plan, {'a': 1}).data == {'A': 1, 'B': True}
+    assert harness.execute(plan, {'a': 2}).data == {'A': 2, 'B': False}
+    assert harness.execute(plan, {}).data == {'A': None, 'B': False}
+
+
+def test_build_deep_rule_chain():
+    code = ['R0 = Rule(when=[True], reason="R0")']
+    for i in xrange(1, 2000):
+        code.append('R%d = Rule(when=[R%d], reason="R%d")' % (i, i - 1, i))
+
+    plan = harness.build('\n'.join(code))
+    assert harness.execute(plan, {}).data['R1999'] == True
+
+
+def test_build_shared_subgraph_visited_once():
+    calls = []
+
+    class CountingInvertNode(InvertNode):
+        def get_dependent_nodes(self):
+            calls.append(self)
+            return super(CountingInvertNode, self).get_dependent_nodes()
+
+    # Every level depends on the previous level twice, so without tracking visited nodes
+    # this would be traversed 2 ** 30 times.
+    node = CountingInvertNode(Literal.Bool(True))
+    for _ in xrange(30):
+        node = CountingInvertNode(node) & node
+
+    assert len(topological_order([node])) == 62
+    assert len(calls) == 31
+
+
+def test_cycle_detection():
+    a = InvertNode(Literal.Bool(True))
+    b = InvertNode(a)
+    a.a = b
+
+    with pytest.raises(RuntimeError) as e:
+        topological_order([b])
+
+    assert 'cycle' in str(e.value)
+
+
+SELECT_CODE = '''
+    A = JsonData('$.a')
+    B = JsonData('$.b')
+    Debug = Counted(B)
+    AIsOne = A == 1
+    R = Rule(when=[AIsOne], reason='A is one')
+
+    WhenRules(
+        rules=[R],
+        then=[
+            Label.Add(Entity('User', A), 'bad_user')
+        ]
+    )
+'''
+
+
+class Counted(InvertNode):
+    resolved = 0
+
+    def resolve(self, value):
+        Counted.resolved += 1
+        return value
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'Counted', Counted)
+    monkeypatch.setattr(Counted, 'resolved', 0)
+
+
+def test_select_outputs(counted):
+    plan = harness.build(SELECT_CODE)
+    data = {'a': 1, 'b': 2}
+
+    result = harness.execute(plan, data, outputs=['AIsOne'])
+    assert result.data == {'AIsOne': True}
+    assert len(result.actions) == 1
+    assert Counted.resolved == 0
+
+    result = harness.execute(plan, data, outputs=['Debug'], actions=False)
+    assert result.data == {'Debug': 2}
+    assert result.actions == []
+    assert Counted.resolved == 1
+
+    result = harness.execute(plan, data)
+    assert result.data == {'A': 1, 'B': 2, 'Debug': 2, 'AIsOne': True, 'R': True}
+    assert len(result.actions) == 1
+    assert Counted.resolved == 2
+
+
+def test_select_actions_only(counted):
+    plan = harness.build(SELECT_CODE)
+    actions_only = plan.select([])
+
+    assert plan.select([]) is actions_only
+    assert plan.select() is plan
+    assert len(actions_only) < len(plan)
+    assert all(not isinstance(node, Counted) for node in actions_only.nodes)
+
+    for executor in (
+        lambda: harness.execute(plan, {'a': 1}, outputs=[]),
+        lambda: graph.execute_many(plan, [{'a': 1}], outputs=[])[0],
+        lambda: graph.execute_async(plan, {'a': 1}, outputs=[]).result(timeout=5),
+    ):
+        result = executor()
+        assert result.data == {}
+        assert result.actions[0].label == 'bad_user'
+
+    assert Counted.resolved == 0
+
+
+def test_select_unknown_output():
+    plan = harness.build(SELECT_CODE.replace('Counted(B)', 'B'))
+
+    with pytest.raises(KeyError):
+        plan.select(['Unknown'])
+
+
+def test_structurally_identical_nodes_are_merged():
+    plan = harness.build('''
+        A = JsonData('$.user.id')
+        B = JsonData('$.user.id')
+        UserA = Entity('User', JsonData('$.user.id'))
+        UserB = Entity('User', A)
+        IsJhggA = UserA == 'jhgg'
+        IsJhggB = UserB == 'jhgg'
+        IsNotJhgg = Entity('User', B) != 'jhgg'
+        Email = Entity('Email', A)
+    ''')
+
+    # B and the anonymous JsonData into A, UserB and the anonymous Entity into UserA, two of the
+    # three 'jhgg' literals, and IsJhggB and the comparison within IsNotJhgg into IsJhggA.
+    assert plan.deduplicated == 8
+    assert plan.slot_of(plan.nodes[plan.outputs[0][1]]) == plan.outputs[0][1]
+    assert len(set(slot for name, slot in plan.outputs if name in ('A', 'B'))) == 1
+
+    data = harness.execute(plan, {'user': {'id': 'jhgg'}}).data
+    assert data == {
+        'A': 'jhgg',
+        'B': 'jhgg',
+        'UserA': EntityRef('User', 'jhgg'),
+        'UserB': EntityRef('User', 'jhgg'),
+        'IsJhggA': True,
+        'IsJhggB': True,
+        'IsNotJhgg': False,
+        'Email': EntityRef('Email', 'jhgg'),
+    }
+    assert data['Email'].type == 'Email'
+
+
+def test_literals_of_different_types_are_not_merged():
+    data = harness.run('''
+        Int = 1
+        Float = 1.0
+        Bool = True
+    ''')
+
+    assert [type(data[name]) for name in ('Int', 'Float', 'Bool')] == [int, float, bool]
+
+
+def test_stateful_nodes_are_not_merged():
+    plan = harness.build('''
+        User = Entity('User', 1)
+        A = RateLimit(by=User, max=1, per=Interval.Minutes(1))
+        B = RateLimit(by=User, max=1, per=Interval.Minutes(1))
+        RuleA = Rule(when=[A], reason='A')
+        RuleB = Rule(when=[A], reason='A')
+
+        WhenRules(
+            rules=[RuleA],
+            then=[Label.Add(User, 'a')]
+        )
+        WhenRules(
+            rules=[RuleB],
+            then=[Label.Add(User, 'a')]
+        )
+    ''')
+
+    # RuleB into RuleA, and the lists of rules, but not A and B (which share a counter instead), nor
+    # the label operations.
+    assert plan.deduplicated == 2
+    harness.execute(plan, {})
+    result = harness.execute(plan, {})
+    assert result.data['A'] == result.data['B'] == True
+    assert len(result.actions) == 2
+    assert result.actions[0] is not result.actions[1]
+    assert sorted(action.rules_with_reasons.keys()[0] for action in result.actions) == ['RuleA', 'RuleB']
+
+
+def test_constant_folding():
+    blocklist = ', '.join('"10.0.%d.%d"' % (i / 256, i % 256) for i in xrange(5000))
+    plan = harness.build('''
+        Ip = JsonData('$.ip')
+        Blocklist = [%s]
+        IsBlocked = Ip.in_(Blocklist)
+        AlwaysTrue = Rule(when=[1 < 2, ~False], reason='Always')
+        User = Entity('User', 1)
+        Limited = RateLimit(by=User, max=1, per=Interval.Minutes(1))
+        IsBlockedInline = Ip.in_([%s])
+    ''' % (blocklist, blocklist.replace('"10.0.', '"10.2.')))
+
+    # Only the membership checks and the rate limit (and its counter) are left to resolve for each event.
+    assert sorted(step.node.name for step in plan.eager_steps) == [
+        'IsBlocked', 'IsBlockedInline', 'Limited', 'User[]']
+
+    # The members of the lists are folded into the lists, and do not take up a slot each.
+    assert len(plan) < 20
+    lengths = [len(plan.initial_values[slot]) for slot in plan.constant_slots if isinstance(
+        plan.initial_values[slot], list)]
+    assert lengths.count(5000) == 2
+
+    first = harness.execute(plan, {'ip': '10.0.19.135'}).data
+    second = harness.execute(plan, {'ip': '10.1.0.0'}).data
+    assert first['IsBlocked'] == True
+    assert second['IsBlocked'] == False
+    assert (first['IsBlockedInline'], second['IsBlockedInline']) == (False, False)
+    assert harness.execute(plan, {'ip': '10.2.0.1'}).data['IsBlockedInline'] == True
+    assert first['AlwaysTrue'] == second['AlwaysTrue'] == True
+    assert first['User'] == EntityRef('User', 1)
+    assert (first['Limited'], second['Limited']) == (False, True)
+
+    batch = graph.execute_many(plan, [{'ip': '10.0.0.1'}, {}])
+    assert [result.data['IsBlocked'] for result in batch] == [True, False]
+    assert graph.execute_async(plan, {'ip': '10.0.0.1'}).result(timeout=5).data['IsBlocked'] == True
+
+
+def test_constant_folding_leaves_errors_to_runtime(monkeypatch):
+    class Explodes(InvertNode):
+        def resolve(self, value):
+            raise ValueError(value)
+
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'Explodes', Explodes)
+    plan = harness.build('''
+        A = JsonData('$.a')
+        R = Rule(when=[A, Explodes(True)], reason='R')
+    ''')
+
+    assert harness.execute(plan, {'a': True}).data['R'] == True
+    with pytest.raises(ValueError):
+        harness.execute(plan, {'a': False})
+
+
+def test_contains_entity_in_literal_list():
+    data = harness.run('''
+        User = Entity('User', JsonData('$.user'))
+        T = User.in_(['jhgg', 'other'])
+        F = User.in_(['other'])
+        Nested = [1, 2].in_([[1, 2], [3]])
+    ''', {'user': 'jhgg'})
+
+    assert data['T'] == True
+    assert data['F'] == False
+    assert data['Nested'] == True
+
+
+class Lookup(InvertNode):
+    pure = True
+    memoize = 2
+    resolved = []
+
+    def resolve(self, value):
+        Lookup.resolved.append(value)
+        return u'%s!' % (value,)
+
+
+def test_pure_nodes_are_memoized_across_events(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'Lookup', Lookup)
+    monkeypatch.setattr(Lookup, 'resolved', [])
+    plan = harness.build('''
+        Ip = JsonData('$.ip')
+        Country = Lookup(Ip)
+    ''')
+
+    for ip in ['1.1.1.1', '1.1.1.1', '2.2.2.2', '1.1.1.1', 1, True, '3.3.3.3', '2.2.2.2', [1]]:
+        assert harness.execute(plan, {'ip': ip}).data['Country'] == u'%s!' % (ip,)
+
+    # At most two values are kept, values of different types are not mixed up, and values that can
+    # not be hashed are not memoized.
+    assert Lookup.resolved == ['1.1.1.1', '2.2.2.2', 1, True, '3.3.3.3', '2.2.2.2', [1]]
+
+    cache = get_resolve_cache(plan.nodes[plan.outputs[1][1]])
+    assert (cache.hits, cache.misses) == (2, 6)
+    batch = graph.execute_many(plan.select(['Country']), [{'ip': '2.2.2.2'}])
+    assert batch[0].data == {'Country': u'2.2.2.2!'}
+    assert cache.hits == 3
@@ -0,0 +1,241 @@
+import os
+import threading
+from collections import Counter
+
+import pytest
+
+import graph
+import harness
+from node import InvertNode
+from plan import ExecutionPlan
+from workers import HashRing, PartitionedWorkerPool, WorkerError, WorkerPool, batched
+
+CODE = '''
+    A = JsonData('$.a')
+    User = Entity('User', A)
+    IsOne = A == 1
+    Pid = GetPid(A)
+    R = Rule(when=[IsOne], reason='A is one')
+
+    WhenRules(
+        rules=[R],
+        then=[Label.Add(User, 'one')]
+    )
+'''
+
+
+class GetPid(InvertNode):
+    def resolve(self, value):
+        if value == 'explode':
+            raise ValueError(value)
+
+        if value == 'unpicklable':
+            raise ValueError(threading.Lock())
+
+        if value == 'die':
+            os._exit(3)
+
+        return os.getpid()
+
+
+class BlockingGetPid(GetPid):
+    blocking = True
+
+
+@pytest.fixture
+def plan(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'GetPid', GetPid)
+    return harness.build(CODE)
+
+
+def test_batched():
+    assert list(batched(xrange(5), 2)) == [(0, [0, 1]), (2, [2, 3]), (4, [4])]
+    assert list(batched([], 2)) == []
+
+
+def test_worker_pool(plan):
+    events = [{'a': i % 3} for i in xrange(50)]
+    expected = graph.execute_many(plan, events)
+
+    with WorkerPool(plan, processes=2, batch_size=7) as pool:
+        results = pool.execute_many(events)
+        unordered = sorted(pool.imap_unordered(iter(events)))
+
+    assert [result.data['IsOne'] for result in results] == [result.data['IsOne'] for result in expected]
+    assert [result.data['A'] for _, result in unordered] == [event['a'] for event in events]
+    assert [index for index, _ in unordered] == range(50)
+    assert all(result.data['Pid'] != os.getpid() for result in results)
+
+    labeled = [result.actions[0].entity for result in results if result.actions]
+    assert labeled == [entity for entity in [event['a'] for event in events] if entity == 1]
+
+
+def test_worker_pool_selects_outputs(plan):
+    with WorkerPool(plan, processes=1, outputs=['IsOne'], actions=False) as pool:
+        results = pool.imap([{'a': 1}, {'a': 2}])
+        assert [result.data for result in results] == [{'IsOne': True}, {'IsOne': False}]
+
+
+def test_worker_pool_failure(plan):
+    with pytest.raises(ValueError):
+        with WorkerPool(plan, processes=1) as pool:
+            pool.execute_many([{'a': 1}, {'a': 'explode'}])
+
+
+def test_workers_do_not_compile_plans(plan, monkeypatch):
+    parent = os.getpid()
+    compile_plan = ExecutionPlan.__init__
+
+    def compile_in_parent(self, *args, **kwargs):
+        # Raised in a worker, this fails the batch it is executing.
+        if os.getpid() != parent:
+            raise AssertionError('The plan was compiled again in a worker.')
+
+        compile_plan(self, *args, **kwargs)
+
+    monkeypatch.setattr(ExecutionPlan, '__init__', compile_in_parent)
+    events = [{'a': 1}, {'a': 2}]
+
+    with WorkerPool(plan, processes=1, outputs=['IsOne'], actions=False) as pool:
+        assert [result.data for result in pool.imap(events)] == [{'IsOne': True}, {'IsOne': False}]
+
+    with PartitionedWorkerPool(plan, 'User', processes=1, outputs=['IsOne', 'User']) as pool:
+        assert [result.data['IsOne'] for result in pool.imap(events)] == [True, False]
+
+
+def test_worker_pool_blocking_nodes(monkeypatch):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'GetPid', BlockingGetPid)
+    plan = harness.build(CODE)
+    assert plan.blocking
+
+    # The parent starts its pool of threads for blocking nodes before forking the workers, which
+    # must start their own.
+    assert graph.execute(plan, {'a': 1}).data['Pid'] == os.getpid()
+
+    pool = WorkerPool(plan, processes=1)
+    results = []
+    executing = threading.Thread(target=lambda: results.extend(pool.execute_many([{'a': 1}, {'a': 2}])))
+    executing.daemon = True
+    executing.start()
+    executing.join(10)
+    if executing.is_alive():
+        pool.terminate()
+        pytest.fail('The workers did not resolve the blocking nodes.')
+
+    pool.close()
+    assert [result.data['IsOne'] for result in results] == [True, False]
+    assert all(result.data['Pid'] != os.getpid() for result in results)
+
+
+def test_hash_ring():
+    ring = HashRing(range(4))
+    keys = [u'User/%d' % i for i in xrange(4000)]
+    assigned = dict((key, ring.get(key)) for key in keys)
+
+    counts = Counter(assigned.itervalues())
+    assert sorted(counts) == range(4)
+    assert min(counts.values()) > 500
+
+    # Only the keys assigned to the new node move, about a fifth of them.
+    ring.add(4)
+    moved = [key for key in keys if ring.get(key) != assigned[key]]
+    assert all(ring.get(key) == 4 for key in moved)
+    assert 400 < len(moved) < 1200
+
+    ring.remove(4)
+    assert dict((key, ring.get(key)) for key in keys) == assigned
+    assert len(ring) == 4
+
+
+PARTITIONED_CODE = '''
+    User = Entity('User', JsonData('$.user'))
+    Pid = GetPid(User)
+    TooManyPosts = RateLimit(by=User, max=2, per=Interval.Minutes(1))
+'''
+
+
+def test_partitioned_worker_pool(monkeypatch, rate_limit_store):
+    monkeypatch.setitem(graph.BASE_GLOBALS, 'GetPid', GetPid)
+    plan = harness.build(PARTITIONED_CODE)
+    events = [{'user': i % 7} for i in xrange(70)] + [{}]
+
+    with PartitionedWorkerPool(plan, 'User', processes=3, batch_size=4) as pool:
+        results = pool.execute_many(events)
+
+        # Every event of a user went to the same worker, so each worker counted all of its posts.
+        pids = {}
+        for event, result in zip(events, results):
+            assert pids.setdefault(event.get('user'), result.data['Pid']) == result.data['Pid']
+        assert len(set(pid for user, pid in pids.iteritems() if user is not None)) == 3
+        assert [result.data['TooManyPosts'] for result in results[:21]] == [False] * 14 + [True] * 7
+        assert results[-1].data['User'] is None
+
+        # Only the workers counted posts, not this process, as it partitioned the events.
+        assert len(rate_limit_store) == 0
+
+        # A new worker only takes some of the users, which start over with no posts counted.
+        worker = pool.add_worker()
+        assert pool.workers == [0, 1, 2, 3]
+        moved = [user for user in xrange(7) if pool.get_worker({'user': user}) == worker]
+        results = pool.execute_many({'user': user} for user in xrange(7))
+        assert [result.data['TooManyPosts'] for result in results] == [user not in moved for user in range(7)]
+
+        pool.remove_worker(worker)
+        assert sorted(pool.imap_unordered([{'user': 1}, {'user': 2}]))[1][1].data['User'] == 2
+
+
+def test_partitioned_worker_pool_remove_worker_mid_stream(plan):
+    pool = PartitionedWorkerPool(plan, 'User', processes=2, batch_size=1000)
+    events = [{'a': i % 100} for i in xrange(20000)]
+    results = []
+
+    def execute():
+        # The batches sent to the removed worker are large enough that their results can not all
+        # be buffered by the queue, so the worker only exits once they are read.
+        stream = pool.imap(events)
+        results.append(next(stream))
+        pool.remove_worker(pool.workers[0])
+        results.extend(stream)
+
+    executing = threading.Thread(target=execute)
+    executing.daemon = True
+    executing.start()
+    executing.join(30)
+    if executing.is_alive():
+        pool.terminate()
+        pytest.fail('Removing a worker with results pending did not return.')
+
+    pool.close()
+    assert [result.data['A'] for result in results] == [event['a'] for event in events]
+
+
+def test_partitioned_worker_pool_failure(plan):
+    with PartitionedWorkerPool(plan, 'User', processes=2, batch_size=1) as pool:
+        events = [{'a': i} for i in xrange(10)]
+        for value in ('explode', 'unpicklable'):
+            with pytest.raises(WorkerError) as e:
+                pool.execute_many(events + [{'a': value}] + events)
+
+            assert e.value.exception_type == 'ValueError'
+            assert 'raise ValueError' in e.value.traceback
+
+            # The batches of the failed stream are not mistaken for those of the next one.
+            results = pool.execute_many([{'a': 'fresh0'}, {'a': 'fresh1'}])
+            assert [result.data['A'] for result in results] == ['fresh0', 'fresh1']
+
+
+def test_partitioned_worker_pool_abandoned_stream(plan):
+    with PartitionedWorkerPool(plan, 'User', processes=2, batch_size=1) as pool:
+        results = pool.imap({'a': i} for i in xrange(10))
+        assert next(results).data['A'] == 0
+
+        results = pool.execute_many([{'a': 'fresh0'}, {'a': 'fresh1'}])
+        assert [result.data['A'] for result in results] == ['fresh0', 'fresh1']
+
+
+def test_partitioned_worker_pool_worker_dies(plan):
+    with pytest.raises(WorkerError) as e:
+        with PartitionedWorkerPool(plan, 'User', processes=2) as pool:
+            pool.execute_many([{'a': 1}, {'a': 'die'}, {'a': 2}])
+
+    assert 'exit code 3' in str(e.value)
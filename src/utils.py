@@ -1,3 +1,7 @@
+import gc
+from contextlib import contextmanager
+
+
 class Checker(object):
     """
     Subclass this to implement more specific type-checks to customize the behavior
@@ -59,3 +63,20 @@ def expect(what, item):
         return item
 
     raise TypeError('Expected type %r, got %r' % (what, item))
+
+
+@contextmanager
+def paused_gc():
+    """
+    Pauses the cyclic garbage collector for the duration of the block.
+
+    Building a graph allocates a large number of long lived objects, which otherwise makes the
+    collector run (and traverse everything allocated so far) over and over again.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
@@ -0,0 +1,479 @@
+import Queue
+import bisect
+import cPickle as pickle
+import hashlib
+import itertools
+import multiprocessing
+import struct
+import threading
+import traceback
+from collections import Counter, deque
+
+import graph
+from nodes.entity import EntityRef
+
+# By default, events are sent to the worker processes in batches of this many events.
+DEFAULT_BATCH_SIZE = 100
+
+# By default, each worker is placed at this many points of a `HashRing`, so that the keys are
+# spread evenly between them.
+DEFAULT_REPLICAS = 100
+
+# While waiting for the results of its workers, a `PartitionedWorkerPool` checks that they are
+# still alive this often, in seconds.
+RESULT_TIMEOUT = 1.0
+
+# While a worker that is being removed exits, its results are read this often, in seconds.
+WORKER_EXIT_POLL = 0.01
+
+# The plans (and what to select from them) of the live worker pools, by their token. Worker
+# processes are forked with these already in memory, rather than having them sent over, so every
+# worker shares the plans its parent built (copy-on-write), without building them again.
+_worker_plans = {}
+_worker_plans_lock = threading.Lock()
+_tokens = itertools.count()
+
+
+def _execute_batch(task):
+    token, start, events = task
+    plan, outputs, actions = _worker_plans[token]
+    return start, graph.execute_many(plan, events, outputs, actions)
+
+
+def batched(events, batch_size):
+    """
+    Splits an iterable of events into lists of at most `batch_size` events, yielding the index of
+    the first event of each, along with the list.
+    """
+    events = iter(events)
+    start = 0
+    while True:
+        batch = list(itertools.islice(events, batch_size))
+        if not batch:
+            return
+
+        yield start, batch
+        start += len(batch)
+
+
+class WorkerPool(object):
+    """
+    Executes a plan for a stream of events, on a pool of `processes` worker processes (by default,
+    one per core), so that execution is not limited to a single core by the GIL.
+
+    The plan is built once, by the caller, and the workers are forked from this process, so that
+    they share it, rather than each of them building it again. Events are sent to the workers in
+    batches of `batch_size` events, which are executed with `execute_many`, and `outputs` and
+    `actions` select what to evaluate, like they do for `execute`.
+
+    Stores (e.g. of rate limits) are per process: each worker counts only the events it was sent.
+
+        with WorkerPool(graph.build(rules)) as pool:
+            for result in pool.imap(events):
+                ...
+    """
+
+    def __init__(self, plan, processes=None, batch_size=DEFAULT_BATCH_SIZE, outputs=None, actions=True):
+        self.plan = plan.select(outputs, actions)
+        self.batch_size = batch_size
+
+        with _worker_plans_lock:
+            self._token = next(_tokens)
+            _worker_plans[self._token] = (self.plan, outputs, actions)
+            self._pool = multiprocessing.Pool(processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def _tasks(self, events):
+        for start, batch in batched(events, self.batch_size):
+            yield self._token, start, batch
+
+    def execute_many(self, events):
+        """
+        Executes the plan for every event, returning a list of their `ExecutionResult`, in order.
+        """
+        return list(self.imap(events))
+
+    def imap(self, events):
+        """
+        Executes the plan for every event of an iterable (which may be an endless stream), yielding
+        their `ExecutionResult` in the order of the events.
+        """
+        for _, results in self._pool.imap(_execute_batch, self._tasks(events)):
+            for result in results:
+                yield result
+
+    def imap_unordered(self, events):
+        """
+        Like `imap`, but yields the results as soon as their batch is executed, as tuples of the
+        index of the event, and its `ExecutionResult`, so that a slow batch does not hold up the
+        batches after it.
+        """
+        for start, results in self._pool.imap_unordered(_execute_batch, self._tasks(events)):
+            for index, result in enumerate(results, start):
+                yield index, result
+
+    def close(self):
+        """
+        Waits for the pending batches to be executed, and stops the workers.
+        """
+        self._pool.close()
+        self._pool.join()
+        self._forget()
+
+    def terminate(self):
+        """
+        Stops the workers, without waiting for the pending batches.
+        """
+        self._pool.terminate()
+        self._pool.join()
+        self._forget()
+
+    def _forget(self):
+        with _worker_plans_lock:
+            _worker_plans.pop(self._token, None)
+
+
+def hash_key(key):
+    """
+    Hashes a unicode string to a 64 bit integer, the same way in every process (unlike `hash`).
+    """
+    return struct.unpack('>Q', hashlib.md5(key.encode('utf-8')).digest()[:8])[0]
+
+
+class HashRing(object):
+    """
+    Assigns keys to nodes (e.g. worker processes) by consistent hashing: each node is placed at
+    `replicas` points of a ring of hashes, and a key is assigned to the node at the first point
+    after its hash. Adding or removing a node only moves the keys of the points it takes (or
+    leaves), about 1 / len(nodes) of them, rather than most of the keys.
+    """
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self._points = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._nodes))
+
+    def add(self, node):
+        for replica in xrange(self.replicas):
+            point = hash_key(u'%s:%d' % (node, replica))
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node):
+        kept = [(point, n) for point, n in zip(self._points, self._nodes) if n != node]
+        self._points = [point for point, _ in kept]
+        self._nodes = [n for _, n in kept]
+
+    def get(self, key):
+        """
+        Returns the node that `key`, a unicode string, is assigned to.
+        """
+        if not self._points:
+            raise LookupError('The ring has no nodes.')
+
+        index = bisect.bisect(self._points, hash_key(key))
+        return self._nodes[index % len(self._nodes)]
+
+
+def get_partition_key(value):
+    """
+    Returns the key an event is partitioned by, given the value of the node it is partitioned by.
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, EntityRef):
+        return value.entity_path()
+
+    return unicode(value)
+
+
+class WorkerError(Exception):
+    """
+    Raised when a worker of a `PartitionedWorkerPool` failed to execute a batch of events, either
+    because the plan raised an exception (named `exception_type`, and formatted in `traceback`),
+    or because the worker died.
+    """
+
+    def __init__(self, message, exception_type=None, traceback=None):
+        super(WorkerError, self).__init__(message)
+        self.exception_type = exception_type
+        self.traceback = traceback
+
+
+def _run_partition_worker(token, worker_id, tasks, results):
+    plan, outputs, actions = _worker_plans[token]
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+
+        # Messages are pickled here, rather than by the queue, in the background, which would
+        # leave the parent waiting forever for a result (or an exception) that can not be pickled.
+        stream, indexes, events = task
+        try:
+            executed = graph.execute_many(plan, events, outputs, actions)
+            message = pickle.dumps((stream, worker_id, indexes, executed, None), pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            error = (type(e).__name__, traceback.format_exc())
+            message = pickle.dumps((stream, worker_id, indexes, None, error), pickle.HIGHEST_PROTOCOL)
+
+        results.put(message)
+
+
+class PartitionedWorkerPool(object):
+    """
+    Executes a plan for a stream of events on worker processes, like `WorkerPool`, but sends every
+    event of an entity to the same worker, so that the state kept for the entity (e.g. its rate
+    limit counters, or its cached labels) stays in a single process, and each worker only keeps
+    the state of its share of the entities.
+
+    Events are partitioned by the value of the node named `partition_by` (e.g. the `Entity` of
+    the actor of the event), which is resolved in this process, and assigned to workers with a
+    `HashRing`. Events that it resolves to None are spread over the workers in turn.
+
+    Workers can be added, and removed, while the pool runs (see `add_worker`): only the entities
+    that are moved to (or from) that worker change workers, and they start over with no state in
+    their new worker. The pool executes a single stream of events at a time: the results of a
+    stream that is abandoned partway are dropped.
+
+    Should a batch fail, or a worker die, a `WorkerError` is raised, once the rest of the batches
+    sent are executed.
+    """
+
+    def __init__(self, plan, partition_by, processes=None, batch_size=DEFAULT_BATCH_SIZE,
+                 outputs=None, actions=True, replicas=DEFAULT_REPLICAS):
+        self.plan = plan.select(outputs, actions)
+        self.partition_by = partition_by
+        self.batch_size = batch_size
+        self.ring = HashRing(replicas=replicas)
+        self._partition_plan = plan.select([partition_by], actions=False)
+        self._results = multiprocessing.Queue()
+        # The messages read from `_results` while removing a worker, which are yet to be received.
+        self._received = deque()
+        self._workers = {}
+        self._worker_ids = itertools.count()
+        self._unpartitioned = itertools.count()
+        self._streams = itertools.count()
+
+        with _worker_plans_lock:
+            self._token = next(_tokens)
+            _worker_plans[self._token] = (self.plan, outputs, actions)
+
+        for _ in xrange(processes or multiprocessing.cpu_count()):
+            self.add_worker()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.terminate()
+
+    @property
+    def workers(self):
+        return sorted(self._workers)
+
+    def add_worker(self):
+        """
+        Starts a new worker, moving its share of the entities to it, and returns its id.
+        """
+        worker_id = next(self._worker_ids)
+        tasks = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_run_partition_worker,
+            args=(self._token, worker_id, tasks, self._results),
+        )
+        process.daemon = True
+        process.start()
+
+        self._workers[worker_id] = (process, tasks)
+        self.ring.add(worker_id)
+        return worker_id
+
+    def remove_worker(self, worker_id):
+        """
+        Stops a worker once it has executed the events it was sent, moving its entities to the
+        other workers.
+        """
+        process, tasks = self._workers.pop(worker_id)
+        self.ring.remove(worker_id)
+        tasks.put(None)
+
+        # A process does not exit until the messages it put on a queue are read, so the results
+        # of its pending batches are read (and kept, for the stream they belong to) until it does.
+        while True:
+            try:
+                self._received.append(self._results.get_nowait())
+            except Queue.Empty:
+                if not process.is_alive():
+                    break
+
+                process.join(WORKER_EXIT_POLL)
+
+        process.join()
+
+    def get_worker(self, event):
+        """
+        Returns the id of the worker that `event` is sent to.
+        """
+        # The partition plan only resolves `partition_by`, as it was selected already.
+        result = graph.execute(self._partition_plan, event)
+        key = get_partition_key(result.data[self.partition_by])
+        if key is None:
+            workers = self.workers
+            return workers[next(self._unpartitioned) % len(workers)]
+
+        return self.ring.get(key)
+
+    def execute_many(self, events):
+        """
+        Executes the plan for every event, returning a list of their `ExecutionResult`, in order.
+        """
+        return list(self.imap(events))
+
+    def imap(self, events):
+        """
+        Executes the plan for every event of an iterable (which may be an endless stream), yielding
+        their `ExecutionResult` in the order of the events.
+        """
+        done = {}
+        next_index = 0
+        for index, result in self.imap_unordered(events):
+            done[index] = result
+            while next_index in done:
+                yield done.pop(next_index)
+                next_index += 1
+
+    def imap_unordered(self, events):
+        """
+        Like `imap`, but yields the results as soon as their batch is executed, as tuples of the
+        index of the event, and its `ExecutionResult`.
+        """
+        # The results of the stream are told apart from those of the streams before it.
+        stream = next(self._streams)
+        # The number of batches sent to each worker, but not yet executed, which is bounded, so
+        # that a stream of events is not read any faster than the workers execute it.
+        pending = Counter()
+        max_pending = 2 * len(self._workers)
+
+        for start, events in batched(events, self.batch_size * len(self._workers)):
+            partitions = {}
+            for index, event in enumerate(events, start):
+                indexes, partition = partitions.setdefault(self.get_worker(event), ([], []))
+                indexes.append(index)
+                partition.append(event)
+
+            for worker_id, (indexes, partition) in partitions.iteritems():
+                self._workers[worker_id][1].put((stream, indexes, partition))
+                pending[worker_id] += 1
+
+            while sum(pending.itervalues()) > max_pending:
+                for executed in self._collect(stream, pending):
+                    yield executed
+
+        while any(pending.itervalues()):
+            for executed in self._collect(stream, pending):
+                yield executed
+
+    def _collect(self, stream, pending):
+        """
+        Waits for the next batch of `stream` to be executed, returning the index and result of
+        each of its events. Should it fail, the other pending batches are waited for (and
+        dropped) before raising.
+        """
+        try:
+            _, worker_id, indexes, results, error = self._receive(stream, pending)
+        except WorkerError as e:
+            self._drain(stream, pending)
+            raise e
+
+        pending[worker_id] -= 1
+        if error is not None:
+            self._drain(stream, pending)
+            exception_type, formatted = error
+            raise WorkerError(
+                'Worker %d raised %s:\n%s' % (worker_id, exception_type, formatted),
+                exception_type,
+                formatted,
+            )
+
+        return zip(indexes, results)
+
+    def _drain(self, stream, pending):
+        while any(pending.itervalues()):
+            try:
+                message = self._receive(stream, pending)
+            except WorkerError:
+                continue
+
+            pending[message[1]] -= 1
+
+    def _receive(self, stream, pending):
+        """
+        Returns the next message of the workers for `stream`, dropping those of other streams,
+        or raises a `WorkerError` if a worker died with batches pending (which are forgotten).
+        """
+        while True:
+            try:
+                if self._received:
+                    message = pickle.loads(self._received.popleft())
+                else:
+                    message = pickle.loads(self._results.get(timeout=RESULT_TIMEOUT))
+            except Queue.Empty:
+                self._check_workers(pending)
+                continue
+
+            if message[0] == stream:
+                return message
+
+    def _check_workers(self, pending):
+        for worker_id, count in pending.items():
+            if not count or worker_id not in self._workers:
+                continue
+
+            # Workers only exit cleanly once they executed every batch they were sent.
+            exitcode = self._workers[worker_id][0].exitcode
+            if exitcode not in (None, 0):
+                pending[worker_id] = 0
+                raise WorkerError('Worker %d died, with exit code %d.' % (worker_id, exitcode))
+
+    def close(self):
+        """
+        Waits for the pending events to be executed, and stops the workers.
+        """
+        for worker_id in self.workers:
+            self.remove_worker(worker_id)
+
+        self._forget()
+
+    def terminate(self):
+        """
+        Stops the workers, without waiting for the pending events.
+        """
+        for process, _ in self._workers.itervalues():
+            process.terminate()
+            process.join()
+
+        self._workers.clear()
+        self._forget()
+
+    def _forget(self):
+        with _worker_plans_lock:
+            _worker_plans.pop(self._token, None)